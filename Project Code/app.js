@@ -3,6 +3,8 @@
  */
 const API_BASE_URL = 'http://127.0.0.1:5000';
 const COST_PER_KWH = 8.0; // ₹8.00 per kilowatt-hour (Hardcoded to match backend for client-side display)
+const CUSTOMER_PAGE_SIZE = 50; // Customers fetched per search page (admin)
+const CUSTOMER_SEARCH_DELAY = 250; // ms of typing pause before the customer search is sent
 
 let userState = {
     isLoggedIn: false,
@@ -11,7 +13,11 @@ let userState = {
     name: null,
     selectedCustomerId: null, // The customer ID currently being viewed (admin) or the user's own ID (customer)
     allApplications: [], // Stores the 50 predefined apps
-    allCustomers: [], // Stores list of all customers (for admin)
+    allCustomers: [], // Customers loaded so far for the current search (for admin)
+    customerSearch: { nextCursor: null, timer: null }, // Server-side customer search paging
+    applications: [], // Usage records of the selected customer, newest first
+    dashboardChartData: { appBreakdown: [], daily: [] }, // Current month's dashboard chart data
+    changeFeed: null, // EventSource streaming the selected customer's changes
 
     // Chart instances for Dashboard
     appChartInstance: null,
@@ -159,12 +165,14 @@ async function login(event) {
 
 function logout() {
     clearTimeout(activityTimer);
+    closeChangeFeed();
     userState.isLoggedIn = false;
     userState.role = null;
     userState.id = null;
     userState.name = null;
     userState.selectedCustomerId = null;
     userState.allCustomers = [];
+    userState.customerSearch.nextCursor = null;
 
     // Destroy all chart instances
     if (userState.appChartInstance) userState.appChartInstance.destroy();
@@ -225,6 +233,7 @@ function updateUIVisibility() {
             // Customer logs in, their ID is the selected ID
             userState.selectedCustomerId = userState.id;
             document.getElementById('current-customer-display').textContent = `Viewing: ${userState.name} (Your Data)`;
+            openChangeFeed(userState.id);
             showView('dashboard');
         }
 
@@ -349,10 +358,8 @@ async function addCustomerApplication(event) {
     if (result.ok && result.data.success) {
         showPopup(result.data.message, 'success');
         closeModal('add-application-modal');
-        fetchCustomerTotals(customerId);
-        fetchCustomerApplications(customerId); // Refresh the list
-        // Update dashboard charts
-        fetchDashboardChartData(customerId);
+        // With a live change feed the table, totals and charts are patched from its events
+        if (!isChangeFeedLive()) refreshCustomerData(customerId);
     } else {
         showPopup(result.data.message || 'Failed to add application usage.', 'error');
     }
@@ -389,9 +396,8 @@ async function editCustomerApplication(event) {
     if (result.ok && result.data.success) {
         showPopup(result.data.message, 'success');
         closeModal('edit-application-modal');
-        fetchCustomerTotals(customerId);
-        fetchCustomerApplications(customerId); // Refresh the list
-        fetchDashboardChartData(customerId);
+        // With a live change feed the table, totals and charts are patched from its events
+        if (!isChangeFeedLive()) refreshCustomerData(customerId);
     } else {
         showPopup(result.data.message || 'Failed to update application usage.', 'error');
     }
@@ -407,9 +413,8 @@ async function deleteCustomerApplication(custAppId, appName) {
 
     if (result.ok && result.data.success) {
         showPopup(result.data.message, 'success');
-        fetchCustomerTotals(customerId);
-        fetchCustomerApplications(customerId); // Refresh the list
-        fetchDashboardChartData(customerId);
+        // With a live change feed the table, totals and charts are patched from its events
+        if (!isChangeFeedLive()) refreshCustomerData(customerId);
     } else {
         showPopup(result.data.message || 'Failed to delete application usage.', 'error');
     }
@@ -421,27 +426,15 @@ async function deleteCustomerApplication(custAppId, appName) {
  */
 
 async function fetchCustomerTotals(customerId) {
-    // Get Daily, Monthly, Yearly costs for the Dashboard Totals (current period)
+    // Get Daily, Monthly, Yearly costs for the Dashboard Totals (current period) in one request
     const today = new Date().toISOString().substring(0, 10); // YYYY-MM-DD
-    const month = new Date().toISOString().substring(0, 7); // YYYY-MM
-    const year = new Date().toISOString().substring(0, 4); // YYYY
 
-    // 1. Daily Total
-    const dailyResult = await apiFetch(`/api/cost_analysis?customer_id=${customerId}&period=day&date=${today}`);
-    if (dailyResult.ok) {
-        document.getElementById('daily-cost-total').textContent = formatINR(dailyResult.data.summary_cost);
-    }
-
-    // 2. Monthly Total
-    const monthlyResult = await apiFetch(`/api/cost_analysis?customer_id=${customerId}&period=month&date=${month}`);
-    if (monthlyResult.ok) {
-        document.getElementById('monthly-cost-total').textContent = formatINR(monthlyResult.data.summary_cost);
-    }
-
-    // 3. Yearly Total
-    const yearlyResult = await apiFetch(`/api/cost_analysis?customer_id=${customerId}&period=year&date=${year}`);
-    if (yearlyResult.ok) {
-        document.getElementById('yearly-cost-total').textContent = formatINR(yearlyResult.data.summary_cost);
+    const result = await apiFetch(`/api/customer/${customerId}/totals?date=${today}`);
+    if (result.ok && result.data.success) {
+        const totals = result.data.totals;
+        document.getElementById('daily-cost-total').textContent = formatINR(totals.day.total_cost);
+        document.getElementById('monthly-cost-total').textContent = formatINR(totals.month.total_cost);
+        document.getElementById('yearly-cost-total').textContent = formatINR(totals.year.total_cost);
     }
 }
 
@@ -453,6 +446,7 @@ async function fetchCustomerApplications(customerId) {
 
     if (result.ok && result.data.success) {
         const applications = result.data.applications;
+        userState.applications = applications;
         renderApplicationList(applications);
         fetchDashboardChartData(customerId);
     } else {
@@ -492,6 +486,85 @@ function renderApplicationList(applications) {
     tableBody.innerHTML = rowsHtml;
 }
 
+/**
+ * --- LIVE CHANGE FEED ---
+ * The server pushes every committed change to the selected customer's usage as a server-sent
+ * event carrying the row and the updated day/month/year totals, so the dashboard is patched
+ * in place instead of refetching the list, totals and charts after each edit.
+ */
+
+function openChangeFeed(customerId) {
+    closeChangeFeed();
+    if (!customerId || !window.EventSource) return;
+
+    const feed = new EventSource(`${API_BASE_URL}/api/customer/${customerId}/changes`);
+    ['usage_added', 'usage_updated', 'usage_deleted'].forEach(eventType => {
+        feed.addEventListener(eventType, event => applyUsageChange(JSON.parse(event.data)));
+    });
+    // Bulk changes (imports, repricing) and missed events: reload everything once
+    feed.addEventListener('resync', () => refreshCustomerData(customerId));
+    feed.addEventListener('customer_deleted', () => closeChangeFeed());
+    userState.changeFeed = feed;
+}
+
+function closeChangeFeed() {
+    if (userState.changeFeed) {
+        userState.changeFeed.close();
+        userState.changeFeed = null;
+    }
+}
+
+function isChangeFeedLive() {
+    return Boolean(userState.changeFeed && userState.changeFeed.readyState === EventSource.OPEN);
+}
+
+function refreshCustomerData(customerId) {
+    fetchCustomerTotals(customerId);
+    fetchCustomerApplications(customerId); // Also refreshes the dashboard charts
+}
+
+function applyUsageChange(change) {
+    if (change.customer_id !== userState.selectedCustomerId) return;
+
+    // 1. Usage table: replace or drop the row, keeping the newest-first order
+    const applications = userState.applications.filter(app => app.cust_app_id !== change.cust_app_id);
+    if (change.record) {
+        applications.push(change.record);
+        applications.sort((a, b) => b.date_time.localeCompare(a.date_time) || b.cust_app_id - a.cust_app_id);
+    }
+    userState.applications = applications;
+    renderApplicationList(applications);
+
+    // 2. Dashboard totals and charts, for the buckets of today and the current month
+    const today = new Date().toISOString().substring(0, 10);
+    const month = today.substring(0, 7);
+    const totalIds = { day: 'daily-cost-total', month: 'monthly-cost-total', year: 'yearly-cost-total' };
+    const chartData = userState.dashboardChartData;
+    let chartsChanged = false;
+
+    change.totals.forEach(bucket => {
+        if (today.startsWith(bucket.bucket)) {
+            document.getElementById(totalIds[bucket.period]).textContent = formatINR(bucket.total_cost);
+        }
+        if (bucket.period === 'month' && bucket.bucket === month) {
+            chartData.appBreakdown = bucket.app_breakdown;
+            chartsChanged = true;
+        } else if (bucket.period === 'day' && bucket.bucket.startsWith(month)) {
+            chartData.daily = chartData.daily.filter(day => day.day_label !== bucket.bucket);
+            if (bucket.total_cost) {
+                chartData.daily.push({ day_label: bucket.bucket, total_cost: bucket.total_cost });
+                chartData.daily.sort((a, b) => a.day_label.localeCompare(b.day_label));
+            }
+            chartsChanged = true;
+        }
+    });
+
+    if (chartsChanged) {
+        renderAppBreakdownChart(chartData.appBreakdown, 'app-chart', userState.appChartInstance);
+        renderTimeChart(chartData.daily, 'time-chart', userState.timeChartInstance, 'Day');
+    }
+}
+
 /**
  * --- DASHBOARD CHART RENDERING ---
  */
@@ -500,10 +573,11 @@ async function fetchDashboardChartData(customerId) {
     // Fetch data for the last 30 days (application breakdown) and current month trend (time series)
     const month = new Date().toISOString().substring(0, 7); // YYYY-MM
 
-    const result = await apiFetch(`/api/cost_analysis?customer_id=${customerId}&period=month&date=${month}`);
+    const result = await apiFetch(`/api/cost_analysis?customer_id=${customerId}&period=month&date=${month}&fields=app_breakdown,time_series`);
 
     if (result.ok && result.data.success) {
         const data = result.data;
+        userState.dashboardChartData = { appBreakdown: data.app_breakdown_data, daily: data.daily_chart_data || [] };
         // 1. Application Breakdown (Application Usage Breakdown)
         renderAppBreakdownChart(data.app_breakdown_data, 'app-chart', userState.appChartInstance);
 
@@ -526,12 +600,20 @@ async function handleAdminView() {
     }
 }
 
-async function fetchCustomers() {
-    const result = await apiFetch('/api/admin/customers');
+async function fetchCustomers({ append = false, reselect = true } = {}) {
+    // The server filters and pages the customers; the list shows this month's cost per customer
+    const searchTerm = document.getElementById('customer-search')?.value.trim() || '';
+    const params = new URLSearchParams({ limit: CUSTOMER_PAGE_SIZE, totals: '1' });
+    if (searchTerm) params.set('q', searchTerm);
+    if (append && userState.customerSearch.nextCursor) params.set('cursor', userState.customerSearch.nextCursor);
+
+    const result = await apiFetch(`/api/admin/customers/search?${params}`);
     if (result.ok && result.data.success) {
-        userState.allCustomers = result.data.customers;
+        userState.allCustomers = append ? userState.allCustomers.concat(result.data.customers) : result.data.customers;
+        userState.customerSearch.nextCursor = result.data.next_cursor;
         renderCustomerList();
         populateCustomerSelect();
+        if (!reselect) return;
 
         // If an ID is set but customer list has changed, re-select (e.g., after an add/edit)
         if (userState.allCustomers.length > 0 && userState.selectedCustomerId === null) {
@@ -551,33 +633,37 @@ function renderCustomerList() {
     if (!tableBody) return;
 
     if (userState.allCustomers.length === 0) {
-        tableBody.innerHTML = '<tr><td colspan="5" class="text-center py-4 text-gray-500">No customers found.</td></tr>';
+        tableBody.innerHTML = '<tr><td colspan="6" class="text-center py-4 text-gray-500">No customers found.</td></tr>';
         return;
     }
 
-    // Filter customers based on search input (basic search logic)
-    const searchTerm = document.getElementById('customer-search')?.value.toLowerCase() || '';
-    const filteredCustomers = userState.allCustomers.filter(customer =>
-        customer.customer_name.toLowerCase().includes(searchTerm) ||
-        customer.email_id.toLowerCase().includes(searchTerm)
-    );
-
-    const rowsHtml = filteredCustomers.map((customer, index) => `
+    // The list already holds only the customers matching the search (filtered server-side)
+    const rowsHtml = userState.allCustomers.map((customer, index) => `
         <tr class="hover:bg-gray-50 cursor-pointer ${customer.customer_id === userState.selectedCustomerId ? 'bg-emerald-100' : ''}" onclick="selectCustomer(${customer.customer_id})">
             <td class="px-4 py-3">${customer.customer_id}</td> <td class="px-4 py-3 font-medium text-gray-900">${customer.customer_name}</td>
             <td class="px-4 py-3 text-sm text-gray-500">${customer.email_id}</td>
             <td class="px-4 py-3 text-sm text-gray-500">${customer.phone_no || 'N/A'}</td>
+            <td class="px-4 py-3 text-sm text-gray-700">${formatINR(customer.month_cost || 0)}</td>
             <td class="px-4 py-3 text-right space-x-2">
                 <button onclick="event.stopPropagation(); openEditCustomerModal(${customer.customer_id})" class="btn-edit text-xs">Edit</button>
                 <button onclick="event.stopPropagation(); deleteCustomer(${customer.customer_id}, '${customer.customer_name}')" class="btn-delete text-xs">Delete</button>
             </td>
         </tr>
     `).join('');
-    tableBody.innerHTML = rowsHtml;
+    const loadMoreHtml = userState.customerSearch.nextCursor ? `
+        <tr>
+            <td colspan="6" class="px-4 py-3 text-center">
+                <button onclick="fetchCustomers({ append: true, reselect: false })" class="btn-secondary text-xs">Load more</button>
+            </td>
+        </tr>
+    ` : '';
+    tableBody.innerHTML = rowsHtml + loadMoreHtml;
 }
 
 function searchCustomers() {
-    renderCustomerList(); // Re-render the list with the current filter
+    // Wait for a pause in typing, then fetch the first page of matches from the server
+    clearTimeout(userState.customerSearch.timer);
+    userState.customerSearch.timer = setTimeout(() => fetchCustomers({ reselect: false }), CUSTOMER_SEARCH_DELAY);
 }
 
 function populateCustomerSelect() {
@@ -611,9 +697,10 @@ function selectCustomer(customerId) {
 
     // Re-render the customer list to highlight the selected row
     renderCustomerList();
-    // Fetch data for the new customer
+    // Fetch data for the new customer and follow its changes
     fetchCustomerTotals(customerId);
     fetchCustomerApplications(customerId);
+    openChangeFeed(customerId);
     // Also ensure the Reports section is ready for the new customer
     setupCostAnalysisDashboard();
 }
@@ -688,6 +775,7 @@ async function deleteCustomer(customerId, customerName) {
         showPopup(result.data.message, 'success');
         // If the selected customer was deleted, clear the selection
         if (userState.selectedCustomerId === customerId) {
+            closeChangeFeed();
             userState.selectedCustomerId = null;
             document.getElementById('current-customer-display').textContent = 'Viewing: N/A';
         }
@@ -918,86 +1006,15 @@ function generatePDF(customerId) {
         return;
     }
 
-    showPopup('Generating PDF report...', 'info');
-
-    apiFetch(`/api/customer/${customerId}/report_data`)
-        .then(response => {
-            if (response.ok && response.data.success) {
-                const data = response.data;
-                createPdfDocument(data);
-            } else {
-                showPopup('Failed to fetch data for PDF report.', 'error');
-            }
-        });
-}
-
-function createPdfDocument(data) {
-    // Check for jspdf library
-    if (!window.jspdf) {
-        showPopup('PDF library failed to load.', 'error');
-        return;
-    }
-    const { jsPDF } = window.jspdf;
-    const doc = new jsPDF();
-    let y = 10;
-
-    // --- Header ---
-    doc.setFontSize(22);
-    doc.setTextColor(16, 185, 129); // Emerald color
-    doc.text("Energy Consumption Report - BillBuddy", 105, y, null, null, "center");
-    y += 10;
-
-    // --- Customer Info ---
-    doc.setFontSize(14);
-    doc.setTextColor(31, 41, 55); // Dark text
-    doc.text(`Customer: ${data.customer_info.customer_name}`, 15, y);
-    y += 7;
-    doc.setFontSize(10);
-    doc.text(`Email: ${data.customer_info.email_id} | Phone: ${data.customer_info.phone_no || 'N/A'}`, 15, y);
-    y += 10;
-
-    // --- Summary Totals ---
-    doc.setFontSize(14);
-    doc.text("Consumption Summary", 15, y);
-    doc.line(15, y + 1, 195, y + 1); // Separator line
-    y += 8;
-
-    doc.setFontSize(12);
-    doc.text(`Total Energy Consumed (All Time): ${data.totals.total_kwh ? data.totals.total_kwh.toFixed(3) : '0.000'} kWh`, 15, y);
-    doc.setTextColor(239, 68, 68); // Red color
-    doc.text(`Total Estimated Cost (All Time): ${formatINR(data.totals.total_cost || 0.00)}`, 105, y, null, null, "left");
-    doc.setTextColor(31, 41, 55);
-    y += 10;
-
-    // --- Usage Table ---
-    doc.setFontSize(14);
-    doc.text("Detailed Application Usage Log", 15, y);
-    y += 5;
-
-    const tableData = data.usage_data.map(app => [
-        app.date_time,
-        app.application_name,
-        app.qty.toString(),
-        `${app.watts} W`,
-        `${app.hours_day} h`,
-        `${app.daily_kwh.toFixed(3)} kWh`,
-        formatINR(app.daily_cost)
-    ]);
-
-    doc.autoTable({
-        startY: y,
-        head: [['Date/Time', 'Application', 'QTY', 'Watts', 'Hrs/Day', 'Daily kWh', 'Daily Cost']],
-        body: tableData,
-        styles: { fontSize: 8, cellPadding: 2, overflow: 'linebreak' },
-        headStyles: { fillColor: [31, 41, 55], textColor: 255 }, // Dark header
-        theme: 'striped',
-        margin: { top: y }
-    });
-
-    // Final save
-    const customerName = data.customer_info.customer_name.replace(/\s/g, '_');
-    doc.save(`Energy_Report_${customerName}_${new Date().toISOString().substring(0, 10)}.pdf`);
-    showPopup('PDF generated successfully!', 'success');
+    // The report is rendered (and cached) by the server and streamed back as an
+    // attachment, so the browser never has to load the customer's full usage history
+    const link = document.createElement('a');
+    link.href = `${API_BASE_URL}/api/customer/${customerId}/report.pdf`;
+    link.download = '';
+    document.body.appendChild(link);
+    link.click();
+    link.remove();
+    showPopup('Downloading PDF report...', 'success');
 }
 
 
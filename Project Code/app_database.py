@@ -1,19 +1,197 @@
 import sqlite3
-import os
+import sys
+import time
+import threading
+from datetime import datetime
 from initial_data import APPLICATIONS_LIST
 
 # Define the path for the SQLite database file
 DB_NAME = 'energy_estimator.db'
 
+# Stored form of customer_application.date_time (e.g. 2025-01-31T18:30); every write is
+# normalized to it, and the generated epoch and bucket columns are derived from it
+USAGE_DATE_TIME_GLOB = '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]T[0-9][0-9]:[0-9][0-9]'
+
+# Rollup granularities and the date_time prefix length that identifies each bucket
+# (YYYY-MM-DD, YYYY-MM, YYYY)
+ROLLUP_PERIODS = {'day': 10, 'month': 7, 'year': 4}
+# Levels tracked in customer_active_period to back the year/month pickers
+ACTIVE_PERIOD_LEVELS = ('month', 'year')
+
+# Connection settings shared by every connection. Adjust with configure_connection_pool()
+# before the first request (e.g. from a gunicorn post_fork hook).
+DB_POOL_SETTINGS = {
+    'enabled': True,                   # Reuse one persistent connection per thread
+    'busy_timeout_ms': 5000,           # Wait this long for a writer instead of 'database is locked'
+    'synchronous': 'NORMAL',           # Safe with WAL; skips the fsync on every commit
+    'mmap_size': 256 * 1024 * 1024,    # Bytes of the database file read through mmap
+    'cache_size_kib': 64 * 1024,       # Page cache per connection
+    'cached_statements': 256,          # Prepared statements kept per connection
+    'connection_factory': None,        # sqlite3.Connection subclass, e.g. for instrumentation
+}
+
+# Customer purges delete usage in transactions of this many rows, pausing between them so
+# live writers get the write lock in between
+DELETE_CHUNK_SIZE = 5000
+DELETE_PAUSE_SECONDS = 0.01
+# Customers handled per purge pass, keeping each IN list well under SQLite's variable limit
+PURGE_GROUP_SIZE = 500
+
+_thread_local = threading.local()
+
+def configure_connection_pool(**settings):
+    """Overrides DB_POOL_SETTINGS; connections opened afterwards use the new values."""
+    unknown = set(settings) - set(DB_POOL_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown connection pool settings: {', '.join(sorted(unknown))}")
+    DB_POOL_SETTINGS.update(settings)
+
 def get_db_connection():
-    """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DB_NAME)
+    """Establishes a new, tuned connection to the SQLite database. The caller closes it."""
+    conn = sqlite3.connect(
+        DB_NAME,
+        timeout=DB_POOL_SETTINGS['busy_timeout_ms'] / 1000.0,
+        cached_statements=DB_POOL_SETTINGS['cached_statements'],
+        factory=DB_POOL_SETTINGS['connection_factory'] or sqlite3.Connection,
+    )
     conn.row_factory = sqlite3.Row  # Allows accessing columns by name
+    # WAL lets readers proceed while a writer commits; the mode is stored in the database file
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA busy_timeout = {int(DB_POOL_SETTINGS['busy_timeout_ms'])}")
+    conn.execute(f"PRAGMA synchronous = {DB_POOL_SETTINGS['synchronous']}")
+    conn.execute(f"PRAGMA mmap_size = {int(DB_POOL_SETTINGS['mmap_size'])}")
+    conn.execute(f"PRAGMA cache_size = -{int(DB_POOL_SETTINGS['cache_size_kib'])}")
+    # Foreign keys are off by default in SQLite and must be enabled on every connection
+    conn.execute("PRAGMA foreign_keys = ON")
     return conn
 
-def create_tables():
-    """Creates the customer, application, and customer_application tables."""
-    conn = get_db_connection()
+def get_pooled_connection():
+    """
+    Returns the calling thread's persistent connection, opening it on first use. With the
+    pool disabled this behaves like get_db_connection() and the caller must close it.
+    """
+    if not DB_POOL_SETTINGS['enabled']:
+        return get_db_connection()
+    conn = getattr(_thread_local, 'conn', None)
+    if conn is None or _thread_local.db_name != DB_NAME:
+        if conn is not None:
+            conn.close()
+        conn = get_db_connection()
+        _thread_local.conn = conn
+        _thread_local.db_name = DB_NAME
+    return conn
+
+def release_pooled_connection(conn):
+    """Hands a connection from get_pooled_connection() back at the end of a request."""
+    if not DB_POOL_SETTINGS['enabled'] or getattr(_thread_local, 'conn', None) is not conn:
+        conn.close()
+    elif conn.in_transaction:
+        # Never carry an open transaction (and its locks) into the thread's next request
+        conn.rollback()
+
+def close_pooled_connection():
+    """Closes the calling thread's persistent connection, if it has one."""
+    conn = getattr(_thread_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _thread_local.conn = None
+
+CUSTOMER_APPLICATION_DDL = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        cust_app_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        customer_id INTEGER NOT NULL,
+        application_name TEXT NOT NULL,
+        qty INTEGER NOT NULL,
+        date_time TEXT NOT NULL,
+        watts INTEGER NOT NULL,
+        hours_day REAL NOT NULL,
+        daily_kwh REAL,
+        daily_cost REAL,
+        FOREIGN KEY (customer_id) REFERENCES customer (customer_id) ON DELETE CASCADE,
+        FOREIGN KEY (application_name) REFERENCES application (application_name)
+    )
+'''
+# Version 2 adds stored generated columns: date_epoch is the wall-clock time as seconds since
+# 1970 (read as UTC), and the buckets are the usage_rollup bucket of each period. All are
+# NULL for a date_time SQLite cannot parse.
+CUSTOMER_APPLICATION_V2_DDL = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        cust_app_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        customer_id INTEGER NOT NULL,
+        application_name TEXT NOT NULL,
+        qty INTEGER NOT NULL,
+        date_time TEXT NOT NULL,
+        watts INTEGER NOT NULL,
+        hours_day REAL NOT NULL,
+        daily_kwh REAL,
+        daily_cost REAL,
+        date_epoch INTEGER GENERATED ALWAYS AS (CAST(STRFTIME('%s', date_time) AS INTEGER)) STORED,
+        day_bucket TEXT GENERATED ALWAYS AS (DATE(date_epoch, 'unixepoch')) STORED,
+        month_bucket TEXT GENERATED ALWAYS AS (STRFTIME('%Y-%m', date_epoch, 'unixepoch')) STORED,
+        year_bucket TEXT GENERATED ALWAYS AS (STRFTIME('%Y', date_epoch, 'unixepoch')) STORED,
+        FOREIGN KEY (customer_id) REFERENCES customer (customer_id) ON DELETE CASCADE,
+        FOREIGN KEY (application_name) REFERENCES application (application_name)
+    )
+'''
+# A phone number with its usual separators stripped, for the customer search index
+PHONE_DIGITS_SQL = (
+    "REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(COALESCE({row}.phone_no, ''), "
+    "' ', ''), '-', ''), '+', ''), '(', ''), ')', ''), '.', '')"
+)
+# Columns written by callers; the generated ones are computed by SQLite
+CUSTOMER_APPLICATION_COLUMNS = (
+    'cust_app_id, customer_id, application_name, qty, date_time, watts, hours_day, daily_kwh, daily_cost'
+)
+
+def normalize_date_time(value):
+    """
+    Parses an incoming usage date_time (any ISO 8601 form, e.g. '2025-01-31T18:30' or
+    '2025-01-31 18:30:00') and returns it as YYYY-MM-DDTHH:MM, or raises ValueError.
+    Seconds and any UTC offset are dropped: usage is recorded in the customer's wall-clock time.
+    """
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid date_time '{value}'.")
+    return parsed.replace(tzinfo=None).isoformat(timespec='minutes')
+
+def rebuild_customer_application_table(conn):
+    """
+    Recreates customer_application with the current foreign keys (SQLite cannot alter a
+    constraint in place), keeping every row, its id and the AUTOINCREMENT sequence.
+    Indexes are dropped with the old table; migration 1 recreates them.
+    """
+    conn.commit()
+    # Must be switched off outside a transaction, or the DROP would cascade
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'customer_application'")
+        row = cursor.fetchone()
+        sequence = row[0] if row else 0
+        cursor.execute(CUSTOMER_APPLICATION_DDL.format(table='customer_application_rebuild'))
+        cursor.execute('INSERT INTO customer_application_rebuild SELECT * FROM customer_application')
+        cursor.execute('DROP TABLE customer_application')
+        cursor.execute('ALTER TABLE customer_application_rebuild RENAME TO customer_application')
+        cursor.execute(
+            "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'customer_application'", (sequence,)
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+    print("Rebuilt customer_application with ON DELETE CASCADE.")
+
+def migrate_v1_base_schema(conn):
+    """
+    Version 1: the customer, application, usage, rollup, active-period, tariff,
+    data-version and archive-segment tables, their indexes and the initial application
+    catalog. Every statement is idempotent, so databases created before schema versioning
+    are brought up to date in place.
+    """
     cursor = conn.cursor()
 
     # (i) customer table: Stores user/customer accounts
@@ -34,52 +212,501 @@ def create_tables():
         )
     ''')
 
-    # (iii) customer_application table: Stores a customer's usage entries
+    # (iii) customer_application table: Stores a customer's usage entries. Deleting a
+    # customer cascades to their usage rows (legacy tables are rebuilt by migrate_database()).
+    cursor.execute(CUSTOMER_APPLICATION_DDL.format(table='customer_application'))
+
+    # (iv) Secondary indexes: let per-customer date filters and app breakdowns
+    # walk an index range instead of scanning every usage row. The (customer_id, date_time)
+    # index also serves the ON DELETE CASCADE lookup and customer purges.
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_customer_application_customer_date
+        ON customer_application (customer_id, date_time)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_customer_application_customer_app
+        ON customer_application (customer_id, application_name)
+    ''')
+
+    # (v) usage_rollup table: Per customer/period bucket/application totals, kept in
+    # step with customer_application on every write so cost analysis never re-aggregates
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS customer_application (
-            cust_app_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        CREATE TABLE IF NOT EXISTS usage_rollup (
             customer_id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            bucket TEXT NOT NULL,
             application_name TEXT NOT NULL,
-            qty INTEGER NOT NULL,
-            date_time TEXT NOT NULL,
-            watts INTEGER NOT NULL,
-            hours_day REAL NOT NULL,
-            daily_kwh REAL,
-            daily_cost REAL,
-            FOREIGN KEY (customer_id) REFERENCES customer (customer_id),
-            FOREIGN KEY (application_name) REFERENCES application (application_name)
+            total_kwh REAL NOT NULL DEFAULT 0,
+            total_cost REAL NOT NULL DEFAULT 0,
+            entry_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (customer_id, period, bucket, application_name)
+        ) WITHOUT ROWID
+    ''')
+
+    # (vi) customer_active_period table: The months/years each customer has usage in,
+    # so the filter pickers never need a DISTINCT over usage rows
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS customer_active_period (
+            customer_id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            entry_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (customer_id, period, bucket)
+        ) WITHOUT ROWID
+    ''')
+
+    # (vii) customer_data_version table: A counter bumped in the same transaction as every
+    # change to a customer's usage or details, so derived artifacts (rendered reports) can
+    # be keyed by it. Rows outlive their customer so a reused id never sees an old version.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS customer_data_version (
+            customer_id INTEGER PRIMARY KEY,
+            data_version INTEGER NOT NULL DEFAULT 0
         )
     ''')
-    conn.commit()
-    conn.close()
-    print("Database tables created successfully.")
+    # Rollups of existing databases are (re)built from the usage rows by migration 2
 
-def insert_initial_applications():
-    """Populates the application table with 50 predefined applications."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    # (viii) tariff tables: Flat, slab and time-of-use tariffs. A tariff's bands are never
+    # edited in place; a change is a new tariff, activated with a repricing job.
+    # band_start is the kWh/day threshold for 'slab' bands and the hour of day for 'tou' bands.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tariff (
+            tariff_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tariff_name TEXT UNIQUE NOT NULL,
+            tariff_type TEXT NOT NULL CHECK (tariff_type IN ('flat', 'slab', 'tou')),
+            is_active INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT (DATETIME('now'))
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tariff_band (
+            tariff_id INTEGER NOT NULL,
+            band_start REAL NOT NULL,
+            rate_per_kwh REAL NOT NULL,
+            PRIMARY KEY (tariff_id, band_start),
+            FOREIGN KEY (tariff_id) REFERENCES tariff (tariff_id)
+        )
+    ''')
+
+    # (ix) reprice_job table: Progress of background repricing after a tariff change;
+    # last_cust_app_id is committed with each chunk so an interrupted job can resume
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reprice_job (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tariff_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            last_cust_app_id INTEGER NOT NULL DEFAULT 0,
+            max_cust_app_id INTEGER NOT NULL,
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            rows_changed INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TEXT NOT NULL DEFAULT (DATETIME('now')),
+            updated_at TEXT NOT NULL DEFAULT (DATETIME('now')),
+            FOREIGN KEY (tariff_id) REFERENCES tariff (tariff_id)
+        )
+    ''')
+
+    # (x) usage_archive_segment table: The committed columnar segments of archived usage
+    # (see usage_archive.py). A segment's files are only read once its row exists.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS usage_archive_segment (
+            segment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_id INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            first_date_time TEXT NOT NULL,
+            last_date_time TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (DATETIME('now')),
+            FOREIGN KEY (customer_id) REFERENCES customer (customer_id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_usage_archive_segment_customer
+        ON usage_archive_segment (customer_id, segment_id)
+    ''')
 
-    # Check if data already exists to prevent duplication
+    # (xi) The 50 predefined applications, only into an empty catalog
     cursor.execute("SELECT COUNT(*) FROM application")
     if cursor.fetchone()[0] == 0:
-        app_data = [(name, watts) for name, watts in APPLICATIONS_LIST.items()]
         cursor.executemany(
             'INSERT INTO application (application_name, watts) VALUES (?, ?)',
-            app_data
+            list(APPLICATIONS_LIST.items())
+        )
+
+def migrate_v2_typed_time_columns(conn):
+    """
+    Version 2: normalizes customer_application.date_time to YYYY-MM-DDTHH:MM and rebuilds
+    the table with the generated date_epoch and day/month/year bucket columns, each bucket
+    indexed with customer_id, then rebuilds the rollups from them. Rows whose date_time
+    cannot be parsed are kept as they are.
+    """
+    # Imported here because usage_archive itself imports this module
+    from usage_archive import add_archive_to_rollups
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT cust_app_id, date_time FROM customer_application WHERE date_time NOT GLOB ?", (USAGE_DATE_TIME_GLOB,)
+    )
+    updates = []
+    unparsed = 0
+    for cust_app_id, date_time in cursor.fetchall():
+        try:
+            updates.append((normalize_date_time(date_time), cust_app_id))
+        except ValueError:
+            unparsed += 1
+    cursor.executemany("UPDATE customer_application SET date_time = ? WHERE cust_app_id = ?", updates)
+
+    # Stored generated columns cannot be added with ALTER TABLE, so the table is copied
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'customer_application'")
+    row = cursor.fetchone()
+    sequence = row[0] if row else 0
+    cursor.execute(CUSTOMER_APPLICATION_V2_DDL.format(table='customer_application_v2'))
+    cursor.execute(f'''
+        INSERT INTO customer_application_v2 ({CUSTOMER_APPLICATION_COLUMNS})
+        SELECT {CUSTOMER_APPLICATION_COLUMNS} FROM customer_application
+    ''')
+    cursor.execute('DROP TABLE customer_application')
+    cursor.execute('ALTER TABLE customer_application_v2 RENAME TO customer_application')
+    cursor.execute(
+        "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'customer_application'", (sequence,)
+    )
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_customer_application_customer_date
+        ON customer_application (customer_id, date_time)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_customer_application_customer_app
+        ON customer_application (customer_id, application_name)
+    ''')
+    # Bucket indexes carry application_name, so rollup grouping walks them in order
+    for period in ROLLUP_PERIODS:
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_customer_application_customer_{period}
+            ON customer_application (customer_id, {period}_bucket, application_name)
+        ''')
+
+    populate_usage_rollups(cursor)
+    add_archive_to_rollups(cursor)
+    if unparsed:
+        print(f"{unparsed} usage rows have a date_time that could not be parsed; they were left unchanged.")
+
+def migrate_v3_customer_search(conn):
+    """
+    Version 3: customer_search, an FTS5 index over each customer's name, email and phone
+    (as written and as bare digits, so '98765' and '+91 98765' both find it), kept in
+    step with the customer table by triggers. The index is contentless: it only maps
+    tokens to customer_id, and matches are joined back to customer.
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS customer_search USING fts5(
+            customer_name, email_id, phone_no,
+            content = '', prefix = '2 3', tokenize = 'unicode61 remove_diacritics 2'
+        )
+    ''')
+    phone_terms = "COALESCE({row}.phone_no, '') || ' ' || " + PHONE_DIGITS_SQL
+    new_values = f"new.customer_id, new.customer_name, new.email_id, {phone_terms.format(row='new')}"
+    old_values = f"old.customer_id, old.customer_name, old.email_id, {phone_terms.format(row='old')}"
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS customer_search_insert AFTER INSERT ON customer BEGIN
+            INSERT INTO customer_search (rowid, customer_name, email_id, phone_no) VALUES ({new_values});
+        END
+    ''')
+    # A contentless index is told the old values of the row it removes
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS customer_search_delete AFTER DELETE ON customer BEGIN
+            INSERT INTO customer_search (customer_search, rowid, customer_name, email_id, phone_no)
+            VALUES ('delete', {old_values});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS customer_search_update AFTER UPDATE ON customer BEGIN
+            INSERT INTO customer_search (customer_search, rowid, customer_name, email_id, phone_no)
+            VALUES ('delete', {old_values});
+            INSERT INTO customer_search (rowid, customer_name, email_id, phone_no) VALUES ({new_values});
+        END
+    ''')
+    cursor.execute('DELETE FROM customer_search')
+    cursor.execute(f'''
+        INSERT INTO customer_search (rowid, customer_name, email_id, phone_no)
+        SELECT customer_id, customer_name, email_id, {phone_terms.format(row='customer')} FROM customer
+    ''')
+
+def migrate_v4_write_idempotency(conn):
+    """
+    Version 4: write_idempotency_key, the outcome of each usage write sent with an
+    Idempotency-Key header, recorded in the write's own transaction. A retry with the same
+    key is answered from it instead of being applied again. Keys expire after a day.
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS write_idempotency_key (
+            idempotency_key TEXT PRIMARY KEY,
+            request_hash TEXT NOT NULL,
+            status INTEGER NOT NULL,
+            response TEXT NOT NULL,
+            created_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_write_idempotency_key_created_at ON write_idempotency_key (created_at)"
+    )
+
+# Ordered (version, migration) pairs. A migration takes a connection, must be idempotent
+# and must not commit; migrate_database() records its version in PRAGMA user_version and
+# commits. Append new migrations with the next version number; never edit an applied one.
+MIGRATIONS = [
+    (1, migrate_v1_base_schema),
+    (2, migrate_v2_typed_time_columns),
+    (3, migrate_v3_customer_search),
+    (4, migrate_v4_write_idempotency),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate_database():
+    """
+    Applies every migration newer than the database's PRAGMA user_version, in order, each
+    in its own IMMEDIATE transaction (so concurrent workers apply it once). Returns the
+    list of versions applied.
+    """
+    conn = get_db_connection()
+    applied = []
+    try:
+        for version, migration in MIGRATIONS:
+            if get_schema_version(conn) >= version:
+                continue
+            if version == 1:
+                # Must run outside a transaction: it switches foreign keys off for a legacy rebuild
+                cursor = conn.cursor()
+                cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'customer_application'")
+                usage_table = cursor.fetchone()
+                if usage_table is not None and 'ON DELETE CASCADE' not in usage_table[0]:
+                    rebuild_customer_application_table(conn)
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Another process may have migrated while this one waited for the lock
+                if get_schema_version(conn) < version:
+                    migration(conn)
+                    conn.execute(f'PRAGMA user_version = {int(version)}')
+                    applied.append(version)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        conn.close()
+    if applied:
+        print(f"Migrated database schema to version {applied[-1]}.")
+    return applied
+
+def ensure_schema():
+    """
+    Startup check: one PRAGMA read when the schema is current, the pending migrations
+    otherwise. Returns True if migrations were applied.
+    """
+    conn = sqlite3.connect(DB_NAME)
+    try:
+        version = get_schema_version(conn)
+    finally:
+        conn.close()
+    if version == SCHEMA_VERSION:
+        return False
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema version {version} is newer than this code supports ({SCHEMA_VERSION})."
         )
+    return bool(migrate_database())
+
+def bump_customer_data_versions(cursor, customer_ids):
+    """Increments the data version of each given customer. Runs in the caller's transaction."""
+    cursor.executemany('''
+        INSERT INTO customer_data_version (customer_id, data_version) VALUES (?, 1)
+        ON CONFLICT (customer_id) DO UPDATE SET data_version = data_version + 1
+    ''', [(customer_id,) for customer_id in set(customer_ids)])
+
+def get_customer_data_version(cursor, customer_id):
+    """Returns a customer's current data version (0 before their first change)."""
+    cursor.execute("SELECT data_version FROM customer_data_version WHERE customer_id = ?", (customer_id,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def update_usage_rollups(cursor, customer_id, application_name, date_time, daily_kwh, daily_cost, direction=1):
+    """
+    Adds (direction=1) or removes (direction=-1) one usage entry from its day, month and
+    year rollup buckets and its active periods. Runs on the caller's cursor so it shares
+    the write's transaction.
+    """
+    update_usage_rollups_bulk(
+        cursor, [(customer_id, application_name, date_time, daily_kwh, daily_cost)], direction
+    )
+
+def update_usage_rollups_bulk(cursor, entries, direction=1):
+    """
+    Applies many (customer_id, application_name, date_time, daily_kwh, daily_cost) entries
+    to the rollups at once. Deltas are merged per bucket in Python first, so every touched
+    bucket is written by a single executemany row however many entries fall into it.
+    The data version of every customer involved is bumped as well.
+    """
+    rollup_deltas = {}
+    period_deltas = {}
+    for customer_id, application_name, date_time, daily_kwh, daily_cost in entries:
+        for period, prefix_len in ROLLUP_PERIODS.items():
+            key = (customer_id, period, date_time[:prefix_len], application_name)
+            total_kwh, total_cost, entry_count = rollup_deltas.get(key, (0.0, 0.0, 0))
+            rollup_deltas[key] = (
+                total_kwh + direction * (daily_kwh or 0.0),
+                total_cost + direction * (daily_cost or 0.0),
+                entry_count + direction,
+            )
+            if period in ACTIVE_PERIOD_LEVELS:
+                period_key = key[:3]
+                period_deltas[period_key] = period_deltas.get(period_key, 0) + direction
+
+    cursor.executemany('''
+        INSERT INTO usage_rollup
+            (customer_id, period, bucket, application_name, total_kwh, total_cost, entry_count)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (customer_id, period, bucket, application_name) DO UPDATE SET
+            total_kwh = total_kwh + excluded.total_kwh,
+            total_cost = total_cost + excluded.total_cost,
+            entry_count = entry_count + excluded.entry_count
+    ''', [key + delta for key, delta in rollup_deltas.items()])
+    cursor.executemany('''
+        INSERT INTO customer_active_period (customer_id, period, bucket, entry_count)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (customer_id, period, bucket) DO UPDATE SET
+            entry_count = entry_count + excluded.entry_count
+    ''', [key + (entry_count,) for key, entry_count in period_deltas.items()])
+
+    if direction < 0:
+        # Drop emptied buckets so deleted history leaves no zero rows (or float residue) behind
+        cursor.executemany('''
+            DELETE FROM usage_rollup
+            WHERE customer_id = ? AND period = ? AND bucket = ? AND application_name = ? AND entry_count <= 0
+        ''', list(rollup_deltas))
+        cursor.executemany('''
+            DELETE FROM customer_active_period
+            WHERE customer_id = ? AND period = ? AND bucket = ? AND entry_count <= 0
+        ''', list(period_deltas))
+
+    bump_customer_data_versions(cursor, [key[0] for key in period_deltas])
+
+def purge_customers(conn, customer_ids, chunk_size=None, pause_seconds=None):
+    """
+    Deletes customers and all their usage. Usage rows are removed in IMMEDIATE transactions
+    of at most chunk_size rows, each together with its rollup adjustments, so the write
+    lock is only ever held for one chunk and an interrupted purge leaves consistent rollups.
+    A final transaction deletes the customer rows (cascading to anything added meanwhile),
+    their remaining rollups and active periods, and bumps their data versions.
+    Returns (customers_deleted, usage_rows_deleted).
+    """
+    chunk_size = chunk_size or DELETE_CHUNK_SIZE
+    pause_seconds = DELETE_PAUSE_SECONDS if pause_seconds is None else pause_seconds
+    customer_ids = sorted(set(customer_ids))
+    cursor = conn.cursor()
+    usage_rows_deleted = 0
+    customers_deleted = 0
+    for start in range(0, len(customer_ids), PURGE_GROUP_SIZE):
+        group = customer_ids[start:start + PURGE_GROUP_SIZE]
+        placeholders = ', '.join('?' * len(group))
+        while True:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute(f'''
+                SELECT cust_app_id, customer_id, application_name, date_time, daily_kwh, daily_cost
+                FROM customer_application
+                WHERE customer_id IN ({placeholders})
+                LIMIT ?
+            ''', (*group, chunk_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            cursor.executemany(
+                'DELETE FROM customer_application WHERE cust_app_id = ?', [(row[0],) for row in rows]
+            )
+            update_usage_rollups_bulk(cursor, [tuple(row)[1:] for row in rows], direction=-1)
+            conn.commit()
+            usage_rows_deleted += len(rows)
+            if len(rows) == chunk_size:
+                time.sleep(pause_seconds)
+
+        # Still inside the IMMEDIATE transaction that found no usage left
+        cursor.execute(f'DELETE FROM usage_rollup WHERE customer_id IN ({placeholders})', group)
+        cursor.execute(f'DELETE FROM customer_active_period WHERE customer_id IN ({placeholders})', group)
+        cursor.execute(f'DELETE FROM customer WHERE customer_id IN ({placeholders})', group)
+        customers_deleted += cursor.rowcount
+        bump_customer_data_versions(cursor, group)
         conn.commit()
-        print(f"Successfully inserted {len(app_data)} initial applications.")
-    else:
-        print("Initial application data already exists.")
+    return customers_deleted, usage_rows_deleted
+
+def populate_usage_rollups(cursor):
+    """
+    Recomputes every rollup bucket and active period from the raw customer_application rows,
+    grouping on the indexed generated bucket columns.
+    """
+    cursor.execute('DELETE FROM usage_rollup')
+    cursor.execute('DELETE FROM customer_active_period')
+    for period, prefix_len in ROLLUP_PERIODS.items():
+        cursor.execute(f'''
+            INSERT INTO usage_rollup
+                (customer_id, period, bucket, application_name, total_kwh, total_cost, entry_count)
+            SELECT customer_id, ?, {period}_bucket, application_name,
+                   COALESCE(SUM(daily_kwh), 0), COALESCE(SUM(daily_cost), 0), COUNT(*)
+            FROM customer_application
+            WHERE {period}_bucket IS NOT NULL
+            GROUP BY customer_id, {period}_bucket, application_name
+        ''', (period,))
+        # Rows stored before date_time was validated may not parse; like the write path,
+        # they are bucketed by their text prefix
+        cursor.execute('''
+            INSERT INTO usage_rollup
+                (customer_id, period, bucket, application_name, total_kwh, total_cost, entry_count)
+            SELECT customer_id, ?, SUBSTR(date_time, 1, ?), application_name,
+                   COALESCE(SUM(daily_kwh), 0), COALESCE(SUM(daily_cost), 0), COUNT(*)
+            FROM customer_application
+            WHERE date_epoch IS NULL
+            GROUP BY customer_id, SUBSTR(date_time, 1, ?), application_name
+            ON CONFLICT (customer_id, period, bucket, application_name) DO UPDATE SET
+                total_kwh = total_kwh + excluded.total_kwh,
+                total_cost = total_cost + excluded.total_cost,
+                entry_count = entry_count + excluded.entry_count
+        ''', (period, prefix_len, prefix_len))
+    cursor.execute('''
+        INSERT INTO customer_active_period (customer_id, period, bucket, entry_count)
+        SELECT customer_id, period, bucket, SUM(entry_count)
+        FROM usage_rollup
+        WHERE period IN ('month', 'year')
+        GROUP BY customer_id, period, bucket
+    ''')
+    # Usage may have changed outside the API, so every customer's derived artifacts are stale
+    cursor.execute('''
+        INSERT INTO customer_data_version (customer_id, data_version)
+        SELECT customer_id, 1 FROM customer WHERE TRUE
+        ON CONFLICT (customer_id) DO UPDATE SET data_version = data_version + 1
+    ''')
 
+def rebuild_usage_rollups():
+    """One-shot rebuild of the usage_rollup table for an existing database, archived usage included."""
+    # Imported here because usage_archive itself imports this module
+    from usage_archive import add_archive_to_rollups
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    populate_usage_rollups(cursor)
+    add_archive_to_rollups(cursor)
+    conn.commit()
+    cursor.execute("SELECT COUNT(*) FROM usage_rollup")
+    print(f"Rebuilt usage rollups ({cursor.fetchone()[0]} buckets).")
     conn.close()
 
 if __name__ == '__main__':
-    # Ensure the database is initialized when the file is run directly
-    if not os.path.exists(DB_NAME):
-        create_tables()
-        insert_initial_applications()
-    else:
-        # If DB exists, just ensure tables are up-to-date and initial data is present
-        create_tables()
-        insert_initial_applications()
\ No newline at end of file
+    # One-shot maintenance command: python app_database.py rebuild-rollups
+    if len(sys.argv) > 1 and sys.argv[1] == 'rebuild-rollups':
+        ensure_schema()
+        rebuild_usage_rollups()
+        sys.exit(0)
+
+    # Setup: python app_database.py migrate (the default) creates or upgrades the database
+    if len(sys.argv) > 1 and sys.argv[1] != 'migrate':
+        sys.exit(f"Unknown command: {sys.argv[1]} (expected 'migrate' or 'rebuild-rollups')")
+    if not ensure_schema():
+        print(f"Database schema is already current (version {SCHEMA_VERSION}).")
\ No newline at end of file
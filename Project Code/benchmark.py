@@ -0,0 +1,640 @@
+# Benchmark harness for the BillBuddy API.
+# Seeds a separate database with synthetic customers and usage drawn from
+# initial_data.APPLICATIONS_LIST, drives every route through the Flask test client (or a
+# local threaded WSGI server) at a configurable concurrency, and reports throughput and
+# p50/p95/p99 latency per endpoint. Results can be saved as a JSON baseline and diffed.
+#
+#   python benchmark.py --customers 50 --rows 100000 --output bench_baseline.json
+#   python benchmark.py --reuse-db --compare bench_baseline.json
+#   python benchmark.py --reuse-db --payload-customers 3 --scenarios ''
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import uuid
+import platform
+import tempfile
+import threading
+import subprocess
+import statistics
+import http.client
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import app_database
+from initial_data import APPLICATIONS_LIST
+
+DEFAULT_DB_PATH = os.path.join(tempfile.gettempdir(), 'billbuddy_bench.db')
+# Rows inserted per transaction while seeding
+SEED_CHUNK_SIZE = 5000
+# A p95 latency or throughput change beyond this fraction counts as a regression in --compare
+DEFAULT_REGRESSION_THRESHOLD = 0.15
+# Prefix of this run's idempotency keys, so a rerun on a reused database is not answered from the last run's
+RUN_ID = uuid.uuid4().hex[:12]
+
+# --- Synthetic Data ---
+
+def typical_hours_per_day(app_name, watts, rng):
+    """A plausible hours/day for an appliance: always-on, heavy loads briefly, small loads longer."""
+    name = app_name.lower()
+    if 'refrigerator' in name or 'router' in name or 'freezer' in name:
+        return 24.0
+    if watts >= 1500:
+        return round(rng.uniform(0.25, 2.0), 2)
+    if watts >= 300:
+        return round(rng.uniform(0.5, 5.0), 2)
+    return round(rng.uniform(2.0, 12.0), 2)
+
+def seed_database(energy_app, customers, rows, years, seed):
+    """
+    Creates 'customers' customers, each owning a random subset of the catalog, and spreads
+    'rows' usage entries over the last 'years' years. Rows go through insert_usage_chunk,
+    so rollups and data versions are maintained exactly as the import route does.
+    """
+    rng = random.Random(seed)
+    app_names = list(APPLICATIONS_LIST)
+    conn = app_database.get_db_connection()
+    cursor = conn.cursor()
+    cursor.executemany(
+        'INSERT INTO customer (customer_name, email_id, phone_no) VALUES (?, ?, ?)',
+        [(f'Bench Customer {i}', f'bench{i}@example.com', f'98{i:08d}') for i in range(customers)]
+    )
+    conn.commit()
+    cursor.execute("SELECT customer_id FROM customer ORDER BY customer_id")
+    customer_ids = [row[0] for row in cursor.fetchall()]
+
+    households = {}
+    for customer_id in customer_ids:
+        owned = rng.sample(app_names, rng.randint(6, min(20, len(app_names))))
+        households[customer_id] = [(name, rng.choice((1, 1, 1, 2, 3))) for name in owned]
+
+    end = datetime.now()
+    span_minutes = int(years * 365 * 24 * 60)
+    tariff = energy_app.load_active_tariff(conn)
+    chunk = []
+    started = time.perf_counter()
+    for _ in range(rows):
+        customer_id = rng.choice(customer_ids)
+        app_name, qty = rng.choice(households[customer_id])
+        watts = APPLICATIONS_LIST[app_name]
+        date_time = (end - timedelta(minutes=rng.randrange(span_minutes))).strftime('%Y-%m-%dT%H:%M')
+        chunk.append((customer_id, app_name, qty, date_time, watts, typical_hours_per_day(app_name, watts, rng)))
+        if len(chunk) >= SEED_CHUNK_SIZE:
+            energy_app.insert_usage_chunk(conn, chunk, tariff)
+            chunk = []
+    if chunk:
+        energy_app.insert_usage_chunk(conn, chunk, tariff)
+    conn.close()
+    print(f"Seeded {customers} customers and {rows} usage rows in {time.perf_counter() - started:.1f}s.")
+
+def load_context():
+    """Reads what the request generators need from the seeded database."""
+    conn = app_database.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT customer_id, email_id FROM customer WHERE email_id LIKE 'bench%' ORDER BY customer_id")
+    customers = [tuple(row) for row in cursor.fetchall()]
+    cursor.execute("SELECT period, bucket FROM customer_active_period WHERE period IN ('month', 'year') GROUP BY period, bucket")
+    buckets = {'month': [], 'year': []}
+    for period, bucket in cursor.fetchall():
+        buckets[period].append(bucket)
+    cursor.execute("SELECT DISTINCT bucket FROM usage_rollup WHERE period = 'day' LIMIT 2000")
+    buckets['day'] = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    if not customers or not buckets['day']:
+        raise SystemExit('The benchmark database has no seeded data; run without --reuse-db.')
+    return {'customers': customers, 'buckets': buckets}
+
+# --- Transports ---
+
+class TestClientTransport:
+    """Calls the app in-process through one Flask test client per worker thread."""
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body, headers=headers)
+        data = response.get_data()  # Drains streamed bodies too
+        return response.status_code, data
+
+    def close(self):
+        pass
+
+class HttpTransport:
+    """Calls the app over HTTP through a local threaded WSGI server, one connection per worker."""
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.port = self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection('127.0.0.1', self.port)
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        try:
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            # The dev server closes idle keep-alive connections; reconnect once
+            conn.close()
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+        return response.status, response.read()
+
+    def close(self):
+        self.server.shutdown()
+
+# --- Scenarios ---
+# A scenario is a task: a callable taking (transport, rng, context) that performs one or more
+# requests and returns [(endpoint_name, ok, seconds), ...].
+
+def timed(transport, name, method, path, body=None, expect=(200,)):
+    started = time.perf_counter()
+    status, data = transport.request(method, path, body)
+    return (name, status in expect, time.perf_counter() - started), status, data
+
+def read_scenario(name, make_path, method='GET', make_body=None, expect=(200,)):
+    def task(transport, rng, context):
+        body = make_body(rng, context) if make_body else None
+        sample, _, _ = timed(transport, name, method, make_path(rng, context), body, expect)
+        return [sample]
+    return task
+
+_lookup_local = threading.local()
+
+def lookup_id(sql, params):
+    """Reads an id straight from the database, outside the timed path (the add routes don't return ids)."""
+    conn = getattr(_lookup_local, 'conn', None)
+    if conn is None:
+        conn = _lookup_local.conn = app_database.get_db_connection()
+    row = conn.execute(sql, params).fetchone()
+    return row[0] if row else None
+
+def usage_crud_task(transport, rng, context):
+    """Adds a usage entry, edits it, then deletes it."""
+    customer_id, _ = rng.choice(context['customers'])
+    app_name = rng.choice(list(APPLICATIONS_LIST))
+    date_time = f"{rng.choice(context['buckets']['day'])}T{rng.randint(0, 23):02d}:00"
+    samples = []
+    sample, _, _ = timed(transport, 'add_usage', 'POST', f'/api/customer/{customer_id}/application', {
+        'application_name': app_name, 'qty': 1, 'date_time': date_time, 'hours_day': 2
+    }, expect=(201,))
+    samples.append(sample)
+    cust_app_id = lookup_id(
+        "SELECT MAX(cust_app_id) FROM customer_application WHERE customer_id = ? AND application_name = ? AND date_time = ?",
+        (customer_id, app_name, date_time)
+    )
+    if cust_app_id is None:
+        return samples
+    sample, _, _ = timed(transport, 'edit_usage', 'PUT', f'/api/customer/application/{cust_app_id}', {
+        'qty': 2, 'date_time': date_time, 'hours_day': 3
+    })
+    samples.append(sample)
+    sample, _, _ = timed(transport, 'delete_usage', 'DELETE', f'/api/customer/application/{cust_app_id}')
+    samples.append(sample)
+    return samples
+
+def usage_ingest_task(transport, rng, context):
+    """Adds one usage entry with an idempotency key, as a meter gateway would (rows are kept)."""
+    customer_id, _ = rng.choice(context['customers'])
+    date_time = f"{rng.choice(context['buckets']['day'])}T{rng.randint(0, 23):02d}:00"
+    body = {'application_name': rng.choice(list(APPLICATIONS_LIST)), 'qty': 1, 'date_time': date_time, 'hours_day': 1}
+    started = time.perf_counter()
+    status, _ = transport.request('POST', f'/api/customer/{customer_id}/application', body,
+                                  {'Idempotency-Key': f'bench-{RUN_ID}-{rng.getrandbits(64):x}'})
+    return [('ingest_usage', status == 201, time.perf_counter() - started)]
+
+def customer_crud_task(transport, rng, context):
+    """Adds a customer, edits it, then deletes it."""
+    email = f'crud{rng.getrandbits(48)}@example.com'
+    samples = []
+    sample, _, _ = timed(transport, 'add_customer', 'POST', '/api/admin/customer',
+                         {'name': 'Bench CRUD', 'email': email, 'phone': '1'}, expect=(201,))
+    samples.append(sample)
+    customer_id = lookup_id("SELECT customer_id FROM customer WHERE email_id = ?", (email,))
+    if customer_id is None:
+        return samples
+    sample, _, _ = timed(transport, 'edit_customer', 'PUT', f'/api/admin/customer/{customer_id}',
+                         {'name': 'Bench CRUD Edited', 'email': email, 'phone': '2'})
+    samples.append(sample)
+    sample, _, _ = timed(transport, 'delete_customer', 'DELETE', f'/api/admin/customer/{customer_id}')
+    samples.append(sample)
+    return samples
+
+def random_customer_id(rng, context):
+    return rng.choice(context['customers'])[0]
+
+SCENARIOS = {
+    'login': read_scenario('login', lambda rng, ctx: '/api/login', 'POST',
+                           lambda rng, ctx: {'username': rng.choice(ctx['customers'])[1], 'password': 'x'}),
+    'applications': read_scenario('applications', lambda rng, ctx: '/api/applications'),
+    'customers': read_scenario('customers', lambda rng, ctx: '/api/admin/customers'),
+    'customer_search': read_scenario('customer_search', lambda rng, ctx:
+        f"/api/admin/customers/search?q={rng.choice(ctx['customers'])[1][:6]}&totals=1&limit=50"),
+    'customer_applications': read_scenario('customer_applications', lambda rng, ctx:
+        f'/api/customer/{random_customer_id(rng, ctx)}/applications?limit=100'),
+    'cost_analysis_day': read_scenario('cost_analysis_day', lambda rng, ctx:
+        f"/api/cost_analysis?customer_id={random_customer_id(rng, ctx)}&period=day&date={rng.choice(ctx['buckets']['day'])}"),
+    'cost_analysis_month': read_scenario('cost_analysis_month', lambda rng, ctx:
+        f"/api/cost_analysis?customer_id={random_customer_id(rng, ctx)}&period=month&date={rng.choice(ctx['buckets']['month'])}"),
+    'cost_analysis_year': read_scenario('cost_analysis_year', lambda rng, ctx:
+        f"/api/cost_analysis?customer_id={random_customer_id(rng, ctx)}&period=year&date={rng.choice(ctx['buckets']['year'])}"),
+    'totals': read_scenario('totals', lambda rng, ctx:
+        f"/api/customer/{random_customer_id(rng, ctx)}/totals?date={rng.choice(ctx['buckets']['day'])}"),
+    'report_data': read_scenario('report_data', lambda rng, ctx:
+        f'/api/customer/{random_customer_id(rng, ctx)}/report_data'),
+    'report_data_page': read_scenario('report_data_page', lambda rng, ctx:
+        f'/api/customer/{random_customer_id(rng, ctx)}/report_data?limit=100'),
+    'load_curve': read_scenario('load_curve', lambda rng, ctx:
+        f"/api/customer/{random_customer_id(rng, ctx)}/load_curve?date={rng.choice(ctx['buckets']['month'])}"),
+    'peak_demand': read_scenario('peak_demand', lambda rng, ctx:
+        f"/api/admin/analytics/peak_demand?date={rng.choice(ctx['buckets']['month'])}"),
+    'usage_crud': usage_crud_task,
+    'usage_ingest': usage_ingest_task,
+    'customer_crud': customer_crud_task,
+}
+
+# --- Change Feed Fan-out Check ---
+
+def read_feed_events(response, expected, deadline):
+    """Reads (event_type, received_at) pairs from an SSE response until 'expected' usage events or the deadline."""
+    events = []
+    for chunk in response.response:
+        received_at = time.perf_counter()
+        text = chunk.decode()
+        if not text.startswith(':'):
+            event_type = next(line[7:] for line in text.split('\n') if line.startswith('event: '))
+            if event_type != 'hello':
+                events.append((event_type, received_at))
+        if len(events) >= expected or received_at > deadline:
+            break
+    return events
+
+def run_change_feed_check(energy_app, context, subscribers, writes, timeout=30.0):
+    """
+    Opens 'subscribers' concurrent change feed streams on one customer, then adds and deletes
+    'writes' usage entries through the API. Every subscriber must receive every event, in
+    order. Returns (samples, failures, wall_seconds), where each sample is one delivery with
+    its latency from the start of the write that caused it.
+    """
+    import change_feed
+    # Idle streams wake up often, so a subscriber that misses events gives up at the deadline
+    change_feed.CHANGE_FEED_HEARTBEAT_SECONDS = 1
+    customer_id = context['customers'][0][0]
+    expected_types = ['usage_added', 'usage_deleted'] * writes
+    write_started = []
+    ready = threading.Barrier(subscribers + 1)
+    deadline = time.perf_counter() + timeout
+    received = [None] * subscribers
+
+    def subscribe(index):
+        response = energy_app.app.test_client().get(f'/api/customer/{customer_id}/changes', buffered=False)
+        chunks = iter(response.response)
+        next(chunks)  # hello: subscribed from here on
+        ready.wait()
+        try:
+            received[index] = read_feed_events(response, len(expected_types), deadline)
+        finally:
+            response.close()
+
+    threads = [threading.Thread(target=subscribe, args=(index,), daemon=True) for index in range(subscribers)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+
+    started = time.perf_counter()
+    client = energy_app.app.test_client()
+    app_name = next(iter(APPLICATIONS_LIST))
+    for _ in range(writes):
+        write_started.append(time.perf_counter())
+        client.post(f'/api/customer/{customer_id}/application', json={
+            'application_name': app_name, 'qty': 1, 'date_time': context['buckets']['day'][0] + 'T08:00', 'hours_day': 1
+        })
+        cust_app_id = lookup_id("SELECT MAX(cust_app_id) FROM customer_application WHERE customer_id = ?", (customer_id,))
+        write_started.append(time.perf_counter())
+        client.delete(f'/api/customer/application/{cust_app_id}')
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.perf_counter()) + 2)
+    wall_seconds = time.perf_counter() - started
+
+    samples = []
+    failures = []
+    for index, events in enumerate(received):
+        events = events or []
+        if [event_type for event_type, _ in events] != expected_types:
+            failures.append(f'subscriber {index} received {len(events)} of {len(expected_types)} events in order')
+        for (event_type, received_at), write_at in zip(events, write_started):
+            samples.append(('change_feed_delivery', True, received_at - write_at))
+    leaked = change_feed.get_change_feed().subscriber_count()
+    if leaked:
+        failures.append(f'{leaked} subscriptions still open after every stream was closed')
+    return samples, failures, wall_seconds
+
+# --- Response Payload Check ---
+
+def payload_paths(customer_id, year):
+    """The list endpoints measured by the payload check, by name."""
+    return {
+        'customer_applications': f'/api/customer/{customer_id}/applications',
+        'report_data': f'/api/customer/{customer_id}/report_data',
+        'cost_analysis_year': f'/api/cost_analysis?customer_id={customer_id}&period=year&date={year}',
+        'customers': '/api/admin/customers',
+    }
+
+def run_payload_check(energy_app, context, customers, repeats):
+    """
+    Fetches each list endpoint for the 'customers' customers with the most usage rows, in the
+    row-per-object and columnar formats and with every content coding the server offers.
+    Returns one row per (customer, endpoint, format, encoding) with the body size, the
+    median request time, and the median time to encode the JSON and compress it. Bodies
+    too small to be compressed only get their identity row.
+    """
+    import response_codec
+    conn = app_database.get_db_connection()
+    largest = [row[0] for row in conn.execute(
+        "SELECT customer_id FROM customer_application GROUP BY customer_id ORDER BY COUNT(*) DESC LIMIT ?", (customers,)
+    )]
+    conn.close()
+    year = max(context['buckets']['year'])
+    encodings = ('identity',) + response_codec.supported_encodings()
+    client = energy_app.app.test_client()
+    # Measure building the responses, not replaying them from the response cache
+    cache_size = energy_app.app.config['RESPONSE_CACHE_SIZE']
+    energy_app.app.config['RESPONSE_CACHE_SIZE'] = 0
+    rows = []
+    try:
+        for customer_id in largest:
+            for endpoint, path in payload_paths(customer_id, year).items():
+                for data_format in ('rows', 'columns'):
+                    format_path = path + ('&' if '?' in path else '?') + 'format=columns' if data_format == 'columns' else path
+                    payload = client.get(format_path, headers={'Accept-Encoding': 'identity'}).get_json()
+                    for encoding in encodings:
+                        request_times = []
+                        encode_times = []
+                        for _ in range(repeats):
+                            started = time.perf_counter()
+                            response = client.get(format_path, headers={'Accept-Encoding': encoding})
+                            request_times.append(time.perf_counter() - started)
+                            body = response.get_data()
+                            started = time.perf_counter()
+                            encoded = response_codec.encode_json(payload)
+                            if encoding != 'identity':
+                                response_codec.compress(encoded, encoding)
+                            encode_times.append(time.perf_counter() - started)
+                        if response.headers.get('Content-Encoding', 'identity') != encoding:
+                            continue  # Below the compression threshold: same as the identity row
+                        rows.append({
+                            'customer_id': customer_id, 'endpoint': endpoint, 'format': data_format,
+                            'encoding': encoding, 'status': response.status_code, 'bytes': len(body),
+                            'request_ms': round(statistics.median(request_times) * 1000.0, 3),
+                            'encode_ms': round(statistics.median(encode_times) * 1000.0, 3),
+                        })
+    finally:
+        energy_app.app.config['RESPONSE_CACHE_SIZE'] = cache_size
+    return rows
+
+def print_payload_report(rows):
+    header = f"{'customer':>9}  {'endpoint':<24}{'format':<9}{'encoding':<10}{'bytes':>10}{'vs rows':>9}{'request':>10}{'encode':>9}"
+    print(header)
+    print('-' * len(header))
+    identity_rows = {
+        (row['customer_id'], row['endpoint']): row['bytes']
+        for row in rows if row['format'] == 'rows' and row['encoding'] == 'identity'
+    }
+    for row in rows:
+        baseline_bytes = identity_rows.get((row['customer_id'], row['endpoint']))
+        ratio = f"{row['bytes'] / baseline_bytes:.0%}" if baseline_bytes else '-'
+        print(f"{row['customer_id']:>9}  {row['endpoint']:<24}{row['format']:<9}{row['encoding']:<10}{row['bytes']:>10}"
+              f"{ratio:>9}{row['request_ms']:>10}{row['encode_ms']:>9}")
+    print('(bytes on the wire; vs rows = size against the uncompressed row-per-object body; times in ms)')
+
+# --- Running and Reporting ---
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1))]
+
+def summarize(samples, wall_seconds):
+    latencies = sorted(seconds for _, _, seconds in samples)
+    errors = sum(1 for _, ok, _ in samples if not ok)
+    to_ms = lambda seconds: round(seconds * 1000.0, 3) if seconds is not None else None
+    return {
+        'count': len(samples),
+        'errors': errors,
+        'throughput_rps': round(len(samples) / wall_seconds, 1) if wall_seconds else None,
+        'mean_ms': to_ms(sum(latencies) / len(latencies)) if latencies else None,
+        'p50_ms': to_ms(percentile(latencies, 50)),
+        'p95_ms': to_ms(percentile(latencies, 95)),
+        'p99_ms': to_ms(percentile(latencies, 99)),
+        'max_ms': to_ms(latencies[-1]) if latencies else None,
+    }
+
+def run_scenario(transport, task, iterations, concurrency, context, seed, warmup):
+    """Runs one scenario's tasks on 'concurrency' threads; returns (samples, wall_seconds)."""
+    warm_rng = random.Random(seed ^ 0x5EED)
+    for _ in range(warmup):
+        task(transport, warm_rng, context)
+
+    seeds = random.Random(seed).sample(range(1 << 30), iterations)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda task_seed: task(transport, random.Random(task_seed), context), seeds))
+    wall_seconds = time.perf_counter() - started
+    return [sample for samples in results for sample in samples], wall_seconds
+
+def print_report(results):
+    header = f"{'endpoint':<24}{'count':>7}{'err':>5}{'rps':>9}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+    print(header)
+    print('-' * len(header))
+    for name, stats in results.items():
+        print(f"{name:<24}{stats['count']:>7}{stats['errors']:>5}{stats['throughput_rps']:>9}"
+              f"{stats['mean_ms']:>9}{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}{stats['max_ms']:>9}")
+    print('(latencies in ms)')
+
+# Run settings that must match for a comparison to be meaningful
+COMPARABLE_SETTINGS = ('customers', 'concurrency', 'transport', 'response_cache')
+
+def compare_with_baseline(results, meta, baseline_path, threshold):
+    """Prints p50/p95/throughput changes against a saved baseline; returns True on a regression."""
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    print(f"\nCompared with {baseline_path} at revision {baseline['meta'].get('git_revision')} "
+          f"(regression threshold {threshold:.0%}):")
+    for setting in COMPARABLE_SETTINGS:
+        if baseline['meta'].get(setting) != meta[setting]:
+            print(f"  warning: {setting} differs ({baseline['meta'].get(setting)} -> {meta[setting]})")
+    baseline = baseline['results']
+    regressed = False
+    print(f"{'endpoint':<24}{'p50':>26}{'p95':>26}{'rps':>26}")
+    for name, stats in results.items():
+        old = baseline.get(name)
+        if not old:
+            print(f'{name:<24}  (not in baseline)')
+            continue
+        cells = []
+        flag = ''
+        for metric, higher_is_worse in (('p50_ms', True), ('p95_ms', True), ('throughput_rps', False)):
+            change = (stats[metric] - old[metric]) / old[metric] if old[metric] else 0.0
+            cells.append(f'{old[metric]}->{stats[metric]} ({change:+.0%})')
+            worse = change > threshold if higher_is_worse else change < -threshold
+            if worse and metric != 'p50_ms':
+                flag = '  REGRESSION'
+                regressed = True
+        print(f'{name:<24}' + ''.join(f'{cell:>26}' for cell in cells) + flag)
+    return regressed
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the BillBuddy API against a synthetic database.')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='benchmark database file (default: %(default)s)')
+    parser.add_argument('--reuse-db', action='store_true', help='keep an existing benchmark database instead of reseeding')
+    parser.add_argument('--customers', type=int, default=50, help='customers to seed')
+    parser.add_argument('--rows', type=int, default=100000, help='usage rows to seed')
+    parser.add_argument('--years', type=float, default=3, help='years of history the rows are spread over')
+    parser.add_argument('--requests', type=int, default=200, help='tasks per scenario')
+    parser.add_argument('--concurrency', type=int, default=4, help='worker threads')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed tasks per scenario before measuring')
+    parser.add_argument('--transport', choices=('client', 'http'), default='client',
+                        help='Flask test client in-process, or HTTP to a local threaded WSGI server')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help='comma-separated subset of: %(default)s')
+    parser.add_argument('--no-response-cache', action='store_true', help='disable the versioned response cache')
+    parser.add_argument('--write-queue', action='store_true', help='send usage writes through the group-commit write queue')
+    parser.add_argument('--write-batch-size', type=int, help='most writes per group commit (with --write-queue)')
+    parser.add_argument('--synchronous', choices=('OFF', 'NORMAL', 'FULL'),
+                        help='SQLite synchronous setting (FULL syncs to disk on every commit)')
+    parser.add_argument('--feed-subscribers', type=int, default=0,
+                        help='also check change feed fan-out to this many concurrent subscribers (in-process); '
+                             'exits 1 if any misses an event')
+    parser.add_argument('--feed-writes', type=int, default=50, help='usage add/delete pairs published in the fan-out check')
+    parser.add_argument('--payload-customers', type=int, default=0,
+                        help='also compare list response sizes and encode times by format and content coding '
+                             'for this many of the largest customers')
+    parser.add_argument('--payload-repeats', type=int, default=5, help='timed requests per payload check combination')
+    parser.add_argument('--seed', type=int, default=17193, help='random seed for data and request mix')
+    parser.add_argument('--output', help='write the results as a JSON baseline to this file')
+    parser.add_argument('--compare', help='baseline JSON to diff against; exits 1 on a regression')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help='fractional p95/throughput change counted as a regression')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    scenario_names = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenario_names) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    if not args.reuse_db:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+    seed_needed = not os.path.exists(args.db)
+    # Point the app at the benchmark database (and a scratch report cache) before importing
+    # it, as energy_app migrates the schema on import
+    app_database.DB_NAME = args.db
+    if args.synchronous:
+        app_database.configure_connection_pool(synchronous=args.synchronous)
+    import report_engine
+    report_engine.REPORT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(args.db)), 'billbuddy_bench_reports')
+    import energy_app
+    if args.no_response_cache:
+        energy_app.app.config['RESPONSE_CACHE_SIZE'] = 0
+    energy_app.app.config['WRITE_QUEUE'] = args.write_queue
+    if args.write_batch_size:
+        energy_app.app.config['WRITE_BATCH_SIZE'] = args.write_batch_size
+    if seed_needed:
+        seed_database(energy_app, args.customers, args.rows, args.years, args.seed)
+    context = load_context()
+
+    transport = HttpTransport(energy_app.app) if args.transport == 'http' else TestClientTransport(energy_app.app)
+    results = {}
+    started = time.perf_counter()
+    try:
+        for index, name in enumerate(scenario_names):
+            samples, wall_seconds = run_scenario(
+                transport, SCENARIOS[name], args.requests, args.concurrency, context, args.seed + index, args.warmup
+            )
+            by_endpoint = {}
+            for sample in samples:
+                by_endpoint.setdefault(sample[0], []).append(sample)
+            for endpoint, endpoint_samples in by_endpoint.items():
+                results[endpoint] = summarize(endpoint_samples, wall_seconds)
+    finally:
+        transport.close()
+
+    feed_failures = []
+    if args.feed_subscribers:
+        samples, feed_failures, wall_seconds = run_change_feed_check(
+            energy_app, context, args.feed_subscribers, args.feed_writes
+        )
+        results['change_feed_delivery'] = summarize(samples, wall_seconds)
+
+    payload_rows = []
+    if args.payload_customers:
+        payload_rows = run_payload_check(energy_app, context, args.payload_customers, args.payload_repeats)
+
+    if results:
+        print_report(results)
+    for failure in feed_failures:
+        print(f'change feed: {failure}')
+    if payload_rows:
+        print_payload_report(payload_rows)
+    baseline = {
+        'meta': {
+            'git_revision': git_revision(),
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': app_database.sqlite3.sqlite_version,
+            'customers': len(context['customers']),
+            'rows_seeded': args.rows if seed_needed else None,
+            'requests_per_scenario': args.requests,
+            'concurrency': args.concurrency,
+            'transport': args.transport,
+            'response_cache': not args.no_response_cache,
+            'write_queue': args.write_queue,
+            'write_batch_size': energy_app.app.config['WRITE_BATCH_SIZE'] if args.write_queue else None,
+            'synchronous': app_database.DB_POOL_SETTINGS['synchronous'],
+            'feed_subscribers': args.feed_subscribers,
+            'seed': args.seed,
+            'total_seconds': round(time.perf_counter() - started, 2),
+        },
+        'results': results,
+        'payload': payload_rows,
+    }
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(baseline, output_file, indent=2)
+        print(f'Saved results to {args.output}')
+    if args.compare and compare_with_baseline(results, baseline['meta'], args.compare, args.threshold):
+        return 1
+    return 1 if feed_failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
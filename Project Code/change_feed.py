@@ -0,0 +1,150 @@
+# This module holds the per-customer change feed behind /api/customer/<id>/changes.
+# Write routes publish an event after they commit (row-level usage deltas with the updated
+# rollup totals, or a 'resync' for bulk changes), and every subscribed dashboard receives it
+# as a server-sent event, so clients patch their table and charts instead of refetching.
+# Events are encoded once per publish and shared by all subscribers.
+#
+# The default backend is in-process: subscribers only see events published by the same
+# server process. Multi-process deployments install a shared backend (any object with the
+# LocalChangeFeed methods) with configure_change_feed().
+
+import json
+import threading
+from collections import deque
+
+# Events buffered per subscriber; a subscriber that falls further behind is sent a
+# 'resync' instead of the events it missed
+CHANGE_FEED_QUEUE_SIZE = 256
+# Seconds between keep-alive comments on an idle stream (also how soon a disconnected
+# client's subscription is noticed and dropped)
+CHANGE_FEED_HEARTBEAT_SECONDS = 15
+SSE_MIMETYPE = 'text/event-stream'
+
+HEARTBEAT = ': keep-alive\n\n'
+
+
+def format_sse(event_type, data, event_id=None):
+    """Encodes one server-sent event."""
+    lines = [] if event_id is None else [f'id: {event_id}']
+    lines.append(f'event: {event_type}')
+    lines.append(f'data: {json.dumps(data, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
+
+
+OVERFLOW_RESYNC = format_sse('resync', {'reason': 'overflow'})
+
+
+class Subscription:
+    """One subscriber's bounded queue of encoded events."""
+
+    def __init__(self, customer_id, queue_size):
+        self.customer_id = customer_id
+        self.queue_size = queue_size
+        self._messages = deque()
+        self._condition = threading.Condition()
+        self._overflowed = False
+
+    def put(self, message):
+        with self._condition:
+            if len(self._messages) >= self.queue_size:
+                # The queued deltas can no longer be applied in full; replace them with a resync
+                self._messages.clear()
+                self._overflowed = True
+            elif not self._overflowed:
+                self._messages.append(message)
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """Returns the next encoded event, or None if none arrives within timeout seconds."""
+        with self._condition:
+            if not self._messages and not self._overflowed:
+                self._condition.wait(timeout)
+            if self._overflowed:
+                self._overflowed = False
+                return OVERFLOW_RESYNC
+            return self._messages.popleft() if self._messages else None
+
+
+class LocalChangeFeed:
+    """In-process pub/sub: a set of subscriptions per customer."""
+
+    def __init__(self, queue_size=None):
+        self.queue_size = queue_size or CHANGE_FEED_QUEUE_SIZE
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, customer_id):
+        subscription = Subscription(customer_id, self.queue_size)
+        with self._lock:
+            self._subscriptions.setdefault(customer_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.customer_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.customer_id]
+
+    def publish(self, customer_id, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(customer_id, ()))
+        for subscription in subscriptions:
+            subscription.put(message)
+        return len(subscriptions)
+
+    def has_subscribers(self, customer_id):
+        """Lets publishers skip building an event nobody would receive."""
+        return customer_id in self._subscriptions
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+
+_backend = LocalChangeFeed()
+
+
+def configure_change_feed(backend):
+    """Replaces the pub/sub backend; call before the first request."""
+    global _backend
+    _backend = backend
+
+
+def get_change_feed():
+    return _backend
+
+
+def publish_change(customer_id, event_type, data, event_id=None):
+    """Publishes one event to the customer's subscribers; returns how many received it."""
+    return _backend.publish(customer_id, format_sse(event_type, data, event_id))
+
+
+def has_subscribers(customer_id):
+    return _backend.has_subscribers(customer_id)
+
+
+def publish_resync(customer_ids, reason):
+    """Tells each customer's subscribers to refetch, after a change too large to send as deltas."""
+    for customer_id in set(customer_ids):
+        if _backend.has_subscribers(customer_id):
+            publish_change(customer_id, 'resync', {'customer_id': customer_id, 'reason': reason})
+
+
+def iter_change_stream(customer_id, make_first_message=None, heartbeat_seconds=None):
+    """
+    Subscribes to a customer's feed and yields its encoded events for a streamed response,
+    with keep-alive comments while idle. make_first_message() runs once subscribed, so the
+    state it reports cannot miss a change. The subscription is dropped when the client goes away.
+    """
+    heartbeat_seconds = heartbeat_seconds or CHANGE_FEED_HEARTBEAT_SECONDS
+    subscription = _backend.subscribe(customer_id)
+    try:
+        if make_first_message:
+            yield make_first_message()
+        while True:
+            message = subscription.get(heartbeat_seconds)
+            yield HEARTBEAT if message is None else message
+    finally:
+        _backend.unsubscribe(subscription)
@@ -1,10 +1,57 @@
 import os
-from flask import Flask, request, jsonify, g
+import io
+import csv
+import base64
+import hashlib
+import heapq
+import functools
+import itertools
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from flask import Flask, Response, request, jsonify, g, send_file
 from flask_cors import CORS
+from werkzeug.utils import secure_filename
 import sqlite3
 import json
-from datetime import datetime
-from app_database import DB_NAME, get_db_connection, create_tables, insert_initial_applications
+from datetime import datetime, timedelta
+from app_database import (
+    ROLLUP_PERIODS, DELETE_CHUNK_SIZE, PURGE_GROUP_SIZE, get_db_connection, get_pooled_connection,
+    release_pooled_connection,
+    ensure_schema,
+    update_usage_rollups, update_usage_rollups_bulk,
+    bump_customer_data_versions, get_customer_data_version, purge_customers, normalize_date_time
+)
+from change_feed import (
+    SSE_MIMETYPE, format_sse, get_change_feed, has_subscribers, iter_change_stream, publish_change, publish_resync
+)
+from estimation_engine import load_usage_arrays, run_what_if
+from forecast_engine import forecast_bills
+from load_profile_engine import customer_load_curves
+from fleet_analytics import fleet_top_consumers, fleet_appliance_load, fleet_monthly_growth
+from instrumentation import (
+    PROMETHEUS_MIMETYPE, SLOW_QUERY_MS, add_json_seconds, install_instrumentation, instrumentation_enabled, render_metrics, slow_queries
+)
+from write_queue import (
+    MAX_IDEMPOTENCY_KEY_LENGTH, WRITE_BATCH_DELAY_MS, WRITE_BATCH_SIZE, WRITE_QUEUE_SIZE, WRITE_TIMEOUT_SECONDS,
+    WriteQueueFull, WriteResult, execute_write, get_write_queue, request_fingerprint, write_queue_stats
+)
+from response_codec import (
+    COLUMNS_FORMAT, COMPRESS_MIN_BYTES, columnar, records, encode_json, negotiate_encoding, compress
+)
+from report_engine import (
+    REPORT_FORMATS, report_cache_key, cached_report_path, cache_report_chunks, purge_customer_reports,
+    render_report_csv, render_report_pdf
+)
+from tariff_engine import (
+    validate_tariff_bands, load_active_tariff, price_daily_kwh, reprice_slab_days, start_reprice_job
+)
+from usage_archive import (
+    archive_closed_periods, archive_stats, iter_archived_usage, load_customer_archive, purge_customer_archive
+)
 
 # --- Configuration ---
 app = Flask(__name__)
@@ -12,41 +59,492 @@ CORS(app) # Enable CORS for frontend communication
 app.config['SECRET_KEY'] = 'a_very_secret_key_for_session_management'
 # UPDATED: Cost is now in INR as per project details
 COST_PER_KWH = 8.0 # ?8.00 per kilowatt-hour
+# Maps a date filter's length (YYYY-MM-DD, YYYY-MM, YYYY) to the usage_rollup level that answers it
+ROLLUP_LEVEL_BY_PREFIX_LEN = {prefix_len: level for level, prefix_len in ROLLUP_PERIODS.items()}
+# Usage listings: largest page a client may request, and the opt-in streaming media type
+MAX_PAGE_LIMIT = 1000
+NDJSON_MIMETYPE = 'application/x-ndjson'
+# Admin customer search: page size when the client does not pass a limit
+CUSTOMER_SEARCH_PAGE_SIZE = 50
+# Columns of the admin customer lists
+CUSTOMER_COLUMNS = ('customer_id', 'customer_name', 'email_id', 'phone_no')
+# Fields returned for each usage record by the listing and report endpoints
+USAGE_LIST_FIELDS = ('cust_app_id', 'application_name', 'qty', 'date_time', 'watts', 'hours_day', 'daily_kwh', 'daily_cost')
+REPORT_USAGE_FIELDS = USAGE_LIST_FIELDS[1:]
+# Bulk import: rows committed per transaction (overridable per request), its upper bound,
+# and how many per-row errors are reported back before the list is truncated
+app.config.setdefault('IMPORT_CHUNK_SIZE', 5000)
+MAX_IMPORT_CHUNK_SIZE = 100000
+MAX_IMPORT_ERRORS = 1000
+# Bulk customer deletion: most customers removed per request, and the largest usage chunk
+MAX_BULK_DELETE_CUSTOMERS = 10000
+MAX_DELETE_CHUNK_SIZE = 100000
+# How long browsers may reuse the application catalog before revalidating it with its ETag
+CATALOG_MAX_AGE = 300
+# Aggregates /api/cost_analysis can return; the 'fields' parameter selects a subset. The
+# bill forecast scans the customer's last three months of rollups, so it is only sent on request
+COST_ANALYSIS_FIELDS = ('summary', 'app_breakdown', 'time_series', 'filters', 'forecast')
+DEFAULT_COST_ANALYSIS_FIELDS = ('summary', 'app_breakdown', 'time_series', 'filters')
+# Per-customer JSON responses kept by the versioned response cache (least recently used evicted first)
+app.config.setdefault('RESPONSE_CACHE_SIZE', 512)
+# JSON responses at least this large are gzip/Brotli-compressed for clients that accept it
+app.config.setdefault('COMPRESS_MIN_BYTES', COMPRESS_MIN_BYTES)
+# Usage add/edit/delete: opt-in group commit (BILLBUDDY_WRITE_QUEUE=1), where one writer
+# thread commits queued writes in batches of up to WRITE_BATCH_SIZE, waiting at most
+# WRITE_BATCH_DELAY_MS for a batch to fill; requests wait up to WRITE_TIMEOUT_SECONDS
+app.config.setdefault('WRITE_QUEUE', os.environ.get('BILLBUDDY_WRITE_QUEUE') == '1')
+app.config.setdefault('WRITE_BATCH_SIZE', WRITE_BATCH_SIZE)
+app.config.setdefault('WRITE_BATCH_DELAY_MS', WRITE_BATCH_DELAY_MS)
+app.config.setdefault('WRITE_QUEUE_SIZE', WRITE_QUEUE_SIZE)
+app.config.setdefault('WRITE_TIMEOUT_SECONDS', WRITE_TIMEOUT_SECONDS)
+# Fleet analytics: largest top-N list and longest growth window an admin may request
+MAX_FLEET_TOP_LIMIT = 100
+MAX_FLEET_GROWTH_MONTHS = 120
+# Opt-in request/SQL instrumentation behind /api/metrics (BILLBUDDY_INSTRUMENTATION=1), and the
+# statement time from which a query is logged with its plan
+app.config.setdefault('INSTRUMENTATION', os.environ.get('BILLBUDDY_INSTRUMENTATION') == '1')
+app.config.setdefault('SLOW_QUERY_MS', float(os.environ.get('BILLBUDDY_SLOW_QUERY_MS', SLOW_QUERY_MS)))
+if app.config['INSTRUMENTATION']:
+    install_instrumentation(app, app.config['SLOW_QUERY_MS'])
+
+# --- Application Catalog Cache ---
+# The catalog is a small, static table seeded from initial_data.APPLICATIONS_LIST, so it is
+# read once per process and reused until invalidate_application_catalog() is called.
+_application_catalog = None
+
+def get_application_catalog():
+    """Returns the cached catalog as a dict: 'applications' (sorted rows), 'watts' (name -> watts) and 'etag'."""
+    global _application_catalog
+    catalog = _application_catalog
+    if catalog is None:
+        conn = get_db_connection()
+        try:
+            rows = conn.execute("SELECT application_name, watts FROM application ORDER BY application_name ASC").fetchall()
+        finally:
+            conn.close()
+        applications = [dict(row) for row in rows]
+        body = json.dumps(applications, sort_keys=True).encode()
+        catalog = {
+            'applications': applications,
+            'watts': {app['application_name']: app['watts'] for app in applications},
+            'etag': hashlib.sha256(body).hexdigest()[:32],
+        }
+        _application_catalog = catalog
+    return catalog
+
+def invalidate_application_catalog():
+    """Drops the cached catalog; call after any write to the application table."""
+    global _application_catalog
+    _application_catalog = None
 
-# Ensure database is initialized on startup
+# Bring the database schema up to date on startup; a current schema costs one PRAGMA read.
+# Deployments run 'python app_database.py migrate' before starting workers.
 try:
-    create_tables()
-    insert_initial_applications()
+    ensure_schema()
 except Exception as e:
     print(f"Initial DB setup failed: {e}")
 
 # --- Database Connection Management ---
 def get_db():
-    """Get a database connection, reusing existing one if possible."""
+    """Get a database connection: the worker thread's pooled connection, reused across requests."""
     if 'db' not in g:
-        g.db = get_db_connection()
+        g.db = get_pooled_connection()
     return g.db
 
 @app.teardown_appcontext
 def close_db(e=None):
-    """Close the database connection at the end of the request."""
+    """Release the database connection at the end of the request."""
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        release_pooled_connection(db)
 
 # --- Utility Functions ---
 
-def calculate_daily_cost(watts, hours_day, qty):
-    """Calculates Daily kWh and Daily Cost."""
+def calculate_daily_cost(watts, hours_day, qty, date_time=None, tariff=None):
+    """
+    Calculates Daily kWh and Daily Cost. Cost uses the given compiled tariff (see
+    tariff_engine.load_active_tariff), or the flat COST_PER_KWH when there is none.
+    """
     try:
         # Daily kWh = (Watts * Hours/Day * QTY) / 1000
         daily_kwh = (watts * hours_day * qty) / 1000.0
+        if tariff:
+            return round(daily_kwh, 3), price_daily_kwh(tariff, daily_kwh, hours_day, date_time)
         # Daily Cost = Daily kWh * Cost per kWh
         daily_cost = daily_kwh * COST_PER_KWH
         return round(daily_kwh, 3), round(daily_cost, 2)
     except Exception:
         return 0.0, 0.0
 
+def calculate_daily_costs(watts, hours_day, qty, date_times, tariff=None):
+    """Batch form of calculate_daily_cost over parallel sequences; returns (kWh list, cost list)."""
+    daily_kwh = [w * h * q / 1000.0 for w, h, q in zip(watts, hours_day, qty)]
+    if tariff:
+        daily_cost = [
+            price_daily_kwh(tariff, kwh, h, date_time) for kwh, h, date_time in zip(daily_kwh, hours_day, date_times)
+        ]
+    else:
+        daily_cost = [round(kwh * COST_PER_KWH, 2) for kwh in daily_kwh]
+    return [round(kwh, 3) for kwh in daily_kwh], daily_cost
+
+def get_date_range(date_prefix):
+    """
+    Converts a YYYY, YYYY-MM or YYYY-MM-DD prefix into a half-open [start, end) range.
+    Range predicates on date_time can use the (customer_id, date_time) index, LIKE cannot.
+    """
+    if len(date_prefix) == 10:
+        start = datetime.strptime(date_prefix, '%Y-%m-%d')
+        end = start + timedelta(days=1)
+        return start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+    if len(date_prefix) == 7:
+        start = datetime.strptime(date_prefix, '%Y-%m')
+        end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+        return start.strftime('%Y-%m'), end.strftime('%Y-%m')
+    if len(date_prefix) == 4:
+        start = datetime.strptime(date_prefix, '%Y')
+        return start.strftime('%Y'), f"{start.year + 1:04d}"
+    raise ValueError(f"Invalid date '{date_prefix}'. Expected YYYY, YYYY-MM or YYYY-MM-DD.")
+
+def encode_page_cursor(sort_key):
+    """Encodes a (date_time, cust_app_id) keyset position as an opaque URL-safe token."""
+    return base64.urlsafe_b64encode(json.dumps(list(sort_key)).encode()).decode()
+
+def decode_page_cursor(token):
+    """Decodes a token produced by encode_page_cursor back into (date_time, cust_app_id)."""
+    try:
+        date_time, cust_app_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return str(date_time), int(cust_app_id)
+    except Exception:
+        raise ValueError('Invalid pagination cursor.')
+
+def get_page_params():
+    """Reads the optional 'cursor' and 'limit' pagination query parameters."""
+    limit = request.args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError('Limit must be an integer.')
+        if not 1 <= limit <= MAX_PAGE_LIMIT:
+            raise ValueError(f'Limit must be between 1 and {MAX_PAGE_LIMIT}.')
+    token = request.args.get('cursor')
+    page_cursor = decode_page_cursor(token) if token else None
+    return page_cursor, limit
+
+def wants_ndjson():
+    """True when the client explicitly prefers a streamed NDJSON body over a JSON document."""
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+def wants_columns():
+    """True when the client asked for lists in the compact columnar form (?format=columns)."""
+    return request.args.get('format') == COLUMNS_FORMAT
+
+def list_payload(columns, rows):
+    """Row tuples as the client asked for them: one object per row, or one array per column."""
+    return columnar(columns, rows) if wants_columns() else records(columns, rows)
+
+def json_response(payload, status=200):
+    """Like jsonify, but encoded with the fast encoder (and without sorting keys)."""
+    started = time.perf_counter()
+    body = encode_json(payload)
+    add_json_seconds(time.perf_counter() - started)
+    return app.response_class(body, status=status, mimetype='application/json')
+
+def usage_columns_sql(fields):
+    """The SELECT list for usage record fields, with date_time formatted as 'YYYY-MM-DD HH:MM'."""
+    return ', '.join(
+        "STRFTIME('%Y-%m-%d %H:%M', customer_application.date_time) AS date_time" if field == 'date_time' else field
+        for field in fields
+    )
+
+USAGE_LIST_COLUMNS = usage_columns_sql(USAGE_LIST_FIELDS)
+
+def iter_usage_values(cursor, customer_id, fields, page_cursor=None, limit=None):
+    """
+    Yields (values, sort_key) for a customer's usage rows, newest first, in keyset order on
+    (date_time, cust_app_id); values is a tuple in 'fields' order. Live rows are read lazily
+    as plain tuples, never with fetchall(), and merged in order with the customer's archived rows.
+    """
+    archive = load_customer_archive(cursor, customer_id)
+    sql = f'''
+        SELECT {usage_columns_sql(fields)}, customer_application.date_time AS sort_date_time, cust_app_id AS sort_id
+        FROM customer_application
+        WHERE customer_id = ?'''
+    params = [customer_id]
+    if page_cursor:
+        sql += " AND (customer_application.date_time, cust_app_id) < (?, ?)"
+        params.extend(page_cursor)
+    sql += " ORDER BY customer_application.date_time DESC, cust_app_id DESC"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    # A cursor of its own, so the caller's keeps its row factory
+    values_cursor = cursor.connection.cursor()
+    values_cursor.row_factory = None
+    values_cursor.execute(sql, params)
+
+    live_rows = ((row[:-2], row[-2:]) for row in values_cursor)
+    if archive is None:
+        yield from live_rows
+        return
+    archived_rows = (
+        (tuple(record[field] for field in fields), sort_key)
+        for record, sort_key in iter_archived_usage(archive, page_cursor, limit)
+    )
+    merged = heapq.merge(live_rows, archived_rows, key=lambda row: row[1], reverse=True)
+    yield from itertools.islice(merged, limit) if limit else merged
+
+def iter_usage_rows(cursor, customer_id, fields, page_cursor=None, limit=None):
+    """iter_usage_values with each record as a dict, for the streamed and rendered outputs."""
+    for values, sort_key in iter_usage_values(cursor, customer_id, fields, page_cursor, limit):
+        yield dict(zip(fields, values)), sort_key
+
+def fetch_usage_page(cursor, customer_id, fields, page_cursor, limit):
+    """
+    Returns (records, next_cursor), records in the list format the client asked for.
+    Without a limit the whole history is returned and next_cursor is None; otherwise one
+    extra row is read to tell whether a next page exists.
+    """
+    if not limit:
+        rows = [values for values, _ in iter_usage_values(cursor, customer_id, fields, page_cursor)]
+        return list_payload(fields, rows), None
+
+    rows = list(iter_usage_values(cursor, customer_id, fields, page_cursor, limit + 1))
+    next_cursor = encode_page_cursor(rows[limit - 1][1]) if len(rows) > limit else None
+    return list_payload(fields, [values for values, _ in rows[:limit]]), next_cursor
+
+def stream_ndjson(make_records):
+    """
+    Streams dicts as newline-delimited JSON in constant memory. make_records(cursor) is
+    run on a connection owned by the stream, as the request's connection is closed once
+    the view returns.
+    """
+    def generate():
+        conn = get_db_connection()
+        try:
+            for record in make_records(conn.cursor()):
+                yield json.dumps(record) + '\n'
+        finally:
+            conn.close()
+    return Response(generate(), mimetype=NDJSON_MIMETYPE)
+
+# --- Change Feed Publishing ---
+
+def fetch_bucket_totals(cursor, customer_id, date_times):
+    """
+    The customer's current day, month and year rollup totals (with their per-application
+    breakdown) for every bucket containing one of the given date_times.
+    """
+    keys = sorted({(period, date_time[:prefix_len]) for date_time in date_times
+                   for period, prefix_len in ROLLUP_PERIODS.items()})
+    totals = {key: {'period': key[0], 'bucket': key[1], 'total_kwh': 0.0, 'total_cost': 0.0, 'app_breakdown': []}
+              for key in keys}
+    # Joined from the list of buckets so each one seeks usage_rollup's primary key
+    cursor.execute(f'''
+        SELECT r.period, r.bucket, r.application_name, r.total_kwh, r.total_cost
+        FROM (VALUES {', '.join(['(?, ?)'] * len(keys))}) AS wanted
+        JOIN usage_rollup r ON r.customer_id = ? AND r.period = wanted.column1 AND r.bucket = wanted.column2
+        ORDER BY r.total_cost DESC
+    ''', (*[value for key in keys for value in key], customer_id))
+    for row in cursor:
+        bucket_totals = totals[(row['period'], row['bucket'])]
+        bucket_totals['total_kwh'] += row['total_kwh']
+        bucket_totals['total_cost'] += row['total_cost']
+        bucket_totals['app_breakdown'].append(
+            {'application_name': row['application_name'], 'total_cost': row['total_cost']}
+        )
+    for bucket_totals in totals.values():
+        bucket_totals['total_kwh'] = round(bucket_totals['total_kwh'], 3)
+        bucket_totals['total_cost'] = round(bucket_totals['total_cost'], 2)
+    return list(totals.values())
+
+def publish_usage_change(cursor, customer_id, event_type, cust_app_id, date_times):
+    """
+    Publishes a committed usage add/edit/delete to the customer's change feed: the row as
+    the listing returns it (None once deleted) and the updated totals of every bucket the
+    change touched (its old and new date_time). The event id is the customer's data version.
+    """
+    if not has_subscribers(customer_id):
+        return
+    try:
+        record = None
+        if event_type != 'usage_deleted':
+            cursor.execute(f"SELECT {USAGE_LIST_COLUMNS} FROM customer_application WHERE cust_app_id = ?", (cust_app_id,))
+            row = cursor.fetchone()
+            record = dict(row) if row else None
+        publish_change(customer_id, event_type, {
+            'customer_id': customer_id,
+            'cust_app_id': cust_app_id,
+            'record': record,
+            'totals': fetch_bucket_totals(cursor, customer_id, date_times),
+        }, get_customer_data_version(cursor, customer_id))
+    except sqlite3.Error as e:
+        # The write is already committed; subscribers fall back to a full refetch
+        print(f"Change feed publish failed for customer {customer_id}: {e}")
+        publish_resync([customer_id], 'publish_failed')
+
+def reprice_usage_days(cursor, tariff, customer_id, date_times, cust_app_id):
+    """
+    Shares a slab tariff's cost out again over the customer's entries on the days a write
+    touched (see tariff_engine.reprice_slab_days). Returns True when entries other than
+    cust_app_id were repriced, so the change feed sends a resync rather than a single-row delta.
+    """
+    day_len = ROLLUP_PERIODS['day']
+    repriced = reprice_slab_days(cursor, tariff, {(customer_id, date_time[:day_len]) for date_time in date_times})
+    return any(changed_id != cust_app_id for _, changed_id in repriced)
+
+# --- Usage Writes ---
+
+def run_usage_write(operation):
+    """
+    Applies a usage write operation (cursor -> WriteResult) and returns its response:
+    directly on the request's connection, or through the group-commit write queue when
+    WRITE_QUEUE is on. Either way the response is sent only after the write has committed.
+    Requests with an Idempotency-Key header are applied at most once per key.
+    """
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= MAX_IDEMPOTENCY_KEY_LENGTH:
+        return jsonify({'success': False, 'message':
+                        f'Idempotency-Key must be 1 to {MAX_IDEMPOTENCY_KEY_LENGTH} characters.'}), 400
+    fingerprint = request_fingerprint(request.method, request.path, request.get_data()) if idempotency_key else None
+
+    try:
+        if app.config['WRITE_QUEUE']:
+            write_queue = get_write_queue(
+                app.config['WRITE_BATCH_SIZE'], app.config['WRITE_BATCH_DELAY_MS'], app.config['WRITE_QUEUE_SIZE']
+            )
+            result = write_queue.submit(operation, idempotency_key, fingerprint).result(
+                timeout=app.config['WRITE_TIMEOUT_SECONDS']
+            )
+        else:
+            result = execute_write(get_db(), operation, idempotency_key, fingerprint)
+    except WriteQueueFull as e:
+        response = jsonify({'success': False, 'message': str(e)})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    except FutureTimeoutError:
+        # The write stays queued and may still commit, so only a keyed retry is safe
+        if idempotency_key is not None:
+            message = 'The write is queued but not yet committed; retry with the same Idempotency-Key.'
+        else:
+            message = ('The write is queued but not yet committed, so its outcome is unknown; check the usage '
+                       'records before resubmitting, or send an Idempotency-Key to make retries safe.')
+        return jsonify({'success': False, 'message': message}), 504
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+    response = jsonify(result.body)
+    if result.replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response, result.status
+
+# --- Versioned Response Cache ---
+# Read-heavy customer endpoints keep their encoded JSON bodies in a bounded LRU. Entries are
+# tagged with the customer's data version (bumped in the same transaction as every usage
+# write and customer edit/delete), so a stale entry is simply never matched again.
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+response_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'not_modified': 0}
+
+def versioned_response_cache(view):
+    """
+    Caches a customer-scoped GET view's 200 JSON responses by (endpoint, customer, query
+    parameters) and validates them against the customer's data version. Responses carry an
+    ETag derived from the key and version, so a matching If-None-Match gets a 304 before
+    any aggregate query runs or any JSON is encoded. Streamed NDJSON responses bypass it.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        customer_id = kwargs.get('customer_id') or request.args.get('customer_id', type=int)
+        if not customer_id or wants_ndjson():
+            return view(*args, **kwargs)
+
+        # The only SQL on a cache hit: one primary-key read of the version, which keeps
+        # invalidation correct across worker processes and the background repricing job
+        data_version = get_customer_data_version(get_db().cursor(), customer_id)
+        # Defaulted date filters resolve to "now", so today's date is part of the key
+        key = (request.endpoint, customer_id, tuple(sorted(request.args.items(multi=True))),
+               datetime.now().strftime('%Y-%m-%d'))
+        etag = hashlib.sha256(repr((key, data_version)).encode()).hexdigest()[:32]
+
+        # Weak comparison: a compressed response carries the same tag, marked weak
+        if request.if_none_match.contains_weak(etag):
+            with _response_cache_lock:
+                response_cache_stats['not_modified'] += 1
+            response = app.response_class(status=304)
+        else:
+            with _response_cache_lock:
+                entry = _response_cache.get(key)
+                if entry is not None and entry[0] == data_version:
+                    _response_cache.move_to_end(key)
+                    response_cache_stats['hits'] += 1
+                else:
+                    entry = None
+                    response_cache_stats['misses'] += 1
+            if entry is not None:
+                response = app.response_class(entry[1], mimetype='application/json')
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                with _response_cache_lock:
+                    _response_cache[key] = (data_version, response.get_data())
+                    _response_cache.move_to_end(key)
+                    while len(_response_cache) > app.config['RESPONSE_CACHE_SIZE']:
+                        _response_cache.popitem(last=False)
+                        response_cache_stats['evictions'] += 1
+        response.set_etag(etag)
+        # Browsers may keep the body but must revalidate it on every use
+        response.cache_control.no_cache = True
+        return response
+    return wrapper
+
+def clear_response_cache():
+    """Empties the response cache (the counters are kept)."""
+    with _response_cache_lock:
+        _response_cache.clear()
+        _compressed_bodies.clear()
+
+# --- Response Compression ---
+# JSON bodies of at least COMPRESS_MIN_BYTES are gzip- or Brotli-compressed for clients that
+# accept it. Compressed bodies of ETag-tagged (cached) responses are kept in a bounded LRU
+# next to the response cache, so a repeated hit is not compressed again.
+_compressed_bodies = OrderedDict()
+
+@app.after_request
+def compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.accept_encodings)
+    body = response.get_data()
+    if encoding is None or len(body) < app.config['COMPRESS_MIN_BYTES']:
+        return response
+
+    etag, _ = response.get_etag()
+    key = (etag, encoding)
+    compressed = None
+    if etag:
+        with _response_cache_lock:
+            compressed = _compressed_bodies.get(key)
+            if compressed is not None:
+                _compressed_bodies.move_to_end(key)
+    if compressed is None:
+        compressed = compress(body, encoding)
+        if etag:
+            with _response_cache_lock:
+                _compressed_bodies[key] = compressed
+                while len(_compressed_bodies) > app.config['RESPONSE_CACHE_SIZE']:
+                    _compressed_bodies.popitem(last=False)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    if etag:
+        # Same representation, different bytes: the tag is only weakly valid now
+        response.set_etag(etag, weak=True)
+    return response
+
 def get_admin_user():
     """Returns a fixed admin user for authentication."""
     # Fixed credentials for admin as per project requirement (Admin/admin17193)
@@ -70,12 +568,60 @@ def get_customer_user(email_id, password):
     return None
 
 def fetch_all_customers():
-    """Retrieves all customers for admin view."""
+    """Retrieves all customers for admin view, as CUSTOMER_COLUMNS tuples."""
     db = get_db()
     cursor = db.cursor()
-    cursor.execute("SELECT customer_id, customer_name, email_id, phone_no FROM customer ORDER BY customer_id ASC")
-    customers = [dict(row) for row in cursor.fetchall()]
-    return customers
+    cursor.row_factory = None
+    cursor.execute(f"SELECT {', '.join(CUSTOMER_COLUMNS)} FROM customer ORDER BY customer_id ASC")
+    return cursor.fetchall()
+
+def customer_match_expression(query):
+    """
+    Turns free text into an FTS5 query for customer_search: every word must be the start
+    of a name, email or phone token (e.g. 'jo gma' finds jo.smith@gmail.com). Returns ''
+    when the text holds no words.
+    """
+    return ' '.join(f'"{term}"*' for term in re.findall(r'[^\W_]+', query.lower()))
+
+def search_customer_page(cursor, query, after_id, limit, totals_month=None):
+    """
+    Returns (columns, rows): up to limit customers matching query (all customers when it
+    is empty) with customer_id above after_id, in customer_id order, as tuples. With
+    totals_month (YYYY-MM), each also carries that month's kWh and cost, joined from the
+    rollups in the same query.
+    """
+    cursor.row_factory = None
+    match = customer_match_expression(query)
+    if match:
+        page_sql = '''
+            SELECT rowid AS customer_id FROM customer_search
+            WHERE customer_search MATCH ? AND rowid > ? ORDER BY rowid LIMIT ?'''
+        params = [match, after_id, limit]
+    else:
+        page_sql = "SELECT customer_id FROM customer WHERE customer_id > ? ORDER BY customer_id LIMIT ?"
+        params = [after_id, limit]
+
+    if totals_month:
+        cursor.execute(f'''
+            WITH page AS ({page_sql})
+            SELECT c.customer_id, c.customer_name, c.email_id, c.phone_no,
+                   ROUND(COALESCE(SUM(r.total_kwh), 0), 3) AS month_kwh,
+                   ROUND(COALESCE(SUM(r.total_cost), 0), 2) AS month_cost
+            FROM page
+            JOIN customer c ON c.customer_id = page.customer_id
+            LEFT JOIN usage_rollup r ON r.customer_id = c.customer_id AND r.period = 'month' AND r.bucket = ?
+            GROUP BY c.customer_id
+            ORDER BY c.customer_id
+        ''', params + [totals_month])
+    else:
+        cursor.execute(f'''
+            WITH page AS ({page_sql})
+            SELECT c.customer_id, c.customer_name, c.email_id, c.phone_no
+            FROM page JOIN customer c ON c.customer_id = page.customer_id
+            ORDER BY c.customer_id
+        ''', params)
+    rows = cursor.fetchall()
+    return tuple(column[0] for column in cursor.description), rows
 
 # --- Authentication Routes ---
 
@@ -112,12 +658,20 @@ def logout():
 
 @app.route('/api/applications', methods=['GET'])
 def get_applications():
-    """Fetches the list of all available applications (the 50 pre-saved ones)."""
-    db = get_db()
-    cursor = db.cursor()
-    cursor.execute("SELECT application_name, watts FROM application ORDER BY application_name ASC")
-    applications = [dict(row) for row in cursor.fetchall()]
-    return jsonify({'success': True, 'applications': applications}), 200
+    """
+    Fetches the list of all available applications (the 50 pre-saved ones) from the
+    in-process cache. Sends an ETag and answers a matching If-None-Match with 304; the
+    comparison is weak, as compress_response marks the tag weak on compressed bodies.
+    """
+    catalog = get_application_catalog()
+    if request.if_none_match.contains_weak(catalog['etag']):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify({'success': True, 'applications': catalog['applications']})
+    response.set_etag(catalog['etag'])
+    response.cache_control.public = True
+    response.cache_control.max_age = CATALOG_MAX_AGE
+    return response
 
 
 # --- Customer Management Routes (Admin only) ---
@@ -127,9 +681,43 @@ def get_customers():
     """Admin route to fetch all customer data."""
     try:
         customers = fetch_all_customers()
-        return jsonify({'success': True, 'customers': customers}), 200
+        return json_response({'success': True, 'customers': list_payload(CUSTOMER_COLUMNS, customers)})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/customers/search', methods=['GET'])
+def search_customers():
+    """
+    Admin customer search backed by the customer_search FTS5 index, in customer_id order.
+    Query parameters (all optional): q (words matched as prefixes of name, email or phone
+    tokens), limit (default CUSTOMER_SEARCH_PAGE_SIZE), cursor (the previous page's
+    next_cursor) and totals=1 to add each customer's kWh and cost for 'month'
+    (YYYY-MM, default the current month).
+    """
+    try:
+        limit = int(request.args.get('limit', CUSTOMER_SEARCH_PAGE_SIZE))
+        after_id = int(request.args.get('cursor') or 0)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Limit and cursor must be integers.'}), 400
+    if not 1 <= limit <= MAX_PAGE_LIMIT:
+        return jsonify({'success': False, 'message': f'Limit must be between 1 and {MAX_PAGE_LIMIT}.'}), 400
+    totals_month = None
+    if request.args.get('totals') == '1':
+        totals_month = request.args.get('month') or datetime.now().strftime('%Y-%m')
+        try:
+            datetime.strptime(totals_month, '%Y-%m')
+        except ValueError:
+            return jsonify({'success': False, 'message': 'month must be YYYY-MM.'}), 400
+
+    try:
+        # One extra row tells whether another page follows
+        columns, rows = search_customer_page(
+            get_db().cursor(), request.args.get('q', ''), after_id, limit + 1, totals_month
+        )
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
+    next_cursor = str(rows[limit - 1][0]) if len(rows) > limit else None
+    return json_response({'success': True, 'customers': list_payload(columns, rows[:limit]), 'next_cursor': next_cursor})
 
 @app.route('/api/admin/customer', methods=['POST'])
 def add_customer():
@@ -172,9 +760,16 @@ def edit_customer(customer_id):
             'UPDATE customer SET customer_name = ?, email_id = ?, phone_no = ? WHERE customer_id = ?',
             (name, email, phone, customer_id)
         )
+        updated = cursor.rowcount
+        # The customer's details appear in their rendered reports
+        bump_customer_data_versions(cursor, [customer_id])
         db.commit()
-        if cursor.rowcount == 0:
+        if updated == 0:
             return jsonify({'success': False, 'message': 'Customer not found.'}), 404
+        if has_subscribers(customer_id):
+            publish_change(customer_id, 'customer_updated', {
+                'customer_id': customer_id, 'customer_name': name, 'email_id': email, 'phone_no': phone
+            }, get_customer_data_version(cursor, customer_id))
         return jsonify({'success': True, 'message': f'Customer {name} updated successfully.'}), 200
     except sqlite3.IntegrityError:
         return jsonify({'success': False, 'message': 'Email address already exists.'}), 409
@@ -185,40 +780,96 @@ def edit_customer(customer_id):
 def delete_customer(customer_id):
     """Admin route to delete a customer and all their usage records."""
     db = get_db()
-    cursor = db.cursor()
     try:
-        # Delete related application usage first
-        cursor.execute('DELETE FROM customer_application WHERE customer_id = ?', (customer_id,))
-        # Then delete the customer
-        cursor.execute('DELETE FROM customer WHERE customer_id = ?', (customer_id,))
-        db.commit()
+        # Usage is removed in bounded chunks before the customer row itself
+        deleted, _ = purge_customers(db, [customer_id])
+        purge_customer_reports(customer_id)
+        purge_customer_archive(customer_id)
 
-        if cursor.rowcount == 0:
+        if deleted == 0:
             return jsonify({'success': False, 'message': 'Customer not found.'}), 404
+        publish_change(customer_id, 'customer_deleted', {'customer_id': customer_id})
 
         return jsonify({'success': True, 'message': 'Customer and all associated data deleted successfully.'}), 200
     except Exception as e:
+        db.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/customers/bulk_delete', methods=['POST'])
+def bulk_delete_customers():
+    """
+    Admin route to delete many customers and all their usage. Body: {"customer_ids": [...]}.
+    Usage rows are deleted in transactions of at most 'chunk_size' rows (query parameter,
+    default DELETE_CHUNK_SIZE), so live writes keep going while a large tenant is purged.
+    """
+    data = request.json or {}
+    try:
+        customer_ids = {int(customer_id) for customer_id in data.get('customer_ids') or []}
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'customer_ids must be a list of integers.'}), 400
+    try:
+        chunk_size = int(request.args.get('chunk_size', DELETE_CHUNK_SIZE))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'chunk_size must be an integer.'}), 400
+    if not customer_ids:
+        return jsonify({'success': False, 'message': 'customer_ids is required.'}), 400
+    if len(customer_ids) > MAX_BULK_DELETE_CUSTOMERS:
+        return jsonify({'success': False, 'message': f'At most {MAX_BULK_DELETE_CUSTOMERS} customers per request.'}), 400
+    if not 1 <= chunk_size <= MAX_DELETE_CHUNK_SIZE:
+        return jsonify({'success': False, 'message': f'chunk_size must be between 1 and {MAX_DELETE_CHUNK_SIZE}.'}), 400
+
+    db = get_db()
+    cursor = db.cursor()
+    # Looks up only the requested ids, in primary key seeks of PURGE_GROUP_SIZE at a time
+    existing_ids = set()
+    requested_ids = sorted(customer_ids)
+    for start in range(0, len(requested_ids), PURGE_GROUP_SIZE):
+        group = requested_ids[start:start + PURGE_GROUP_SIZE]
+        cursor.execute(
+            f"SELECT customer_id FROM customer WHERE customer_id IN ({', '.join('?' * len(group))})", group
+        )
+        existing_ids.update(row['customer_id'] for row in cursor.fetchall())
+    try:
+        deleted, usage_rows_deleted = purge_customers(db, existing_ids, chunk_size)
+    except Exception as e:
+        db.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
+    for customer_id in existing_ids:
+        purge_customer_reports(customer_id)
+        purge_customer_archive(customer_id)
+        publish_change(customer_id, 'customer_deleted', {'customer_id': customer_id})
+
+    return jsonify({
+        'success': True,
+        'message': f'Deleted {deleted} customers and {usage_rows_deleted} usage rows.',
+        'deleted': deleted,
+        'usage_rows_deleted': usage_rows_deleted,
+        'not_found': sorted(customer_ids - existing_ids)
+    }), 200
 
 # --- Application Usage Routes (Used by Admin on behalf of Customer & by Customer directly) ---
 
 @app.route('/api/customer/<int:customer_id>/applications', methods=['GET'])
 def get_customer_applications(customer_id):
-    """Fetches all application usage records for a specific customer."""
+    """
+    Fetches application usage records for a specific customer, newest first.
+    Optional 'limit' and 'cursor' parameters page through the history by keyset; sending
+    'Accept: application/x-ndjson' streams the rows one JSON object per line instead.
+    """
+    try:
+        page_cursor, limit = get_page_params()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    if wants_ndjson():
+        return stream_ndjson(lambda cursor: (
+            record for record, _ in iter_usage_rows(cursor, customer_id, USAGE_LIST_FIELDS, page_cursor, limit)
+        ))
+
     db = get_db()
     cursor = db.cursor()
-    # Select all fields and format date nicely
-    cursor.execute('''
-        SELECT 
-            cust_app_id, application_name, qty, 
-            STRFTIME('%Y-%m-%d %H:%M', date_time) AS date_time,
-            watts, hours_day, daily_kwh, daily_cost
-        FROM customer_application 
-        WHERE customer_id = ?
-        ORDER BY date_time DESC
-    ''', (customer_id,))
-    applications = [dict(row) for row in cursor.fetchall()]
-    return jsonify({'success': True, 'applications': applications}), 200
+    applications, next_cursor = fetch_usage_page(cursor, customer_id, USAGE_LIST_FIELDS, page_cursor, limit)
+    return json_response({'success': True, 'applications': applications, 'next_cursor': next_cursor})
 
 @app.route('/api/customer/<int:customer_id>/application', methods=['POST'])
 def add_customer_application(customer_id):
@@ -227,32 +878,54 @@ def add_customer_application(customer_id):
     app_name = data.get('application_name')
     qty = data.get('qty', 1)
     date_time_str = data.get('date_time')
-    watts = data.get('watts')
     hours_day = data.get('hours_day')
 
+    # Validate the name and default the wattage from the cached catalog (no DB round trip)
+    catalog_watts = get_application_catalog()['watts']
+    if app_name and (not isinstance(app_name, str) or app_name not in catalog_watts):
+        return jsonify({'success': False, 'message': f"Unknown application '{app_name}'."}), 400
+    watts = data.get('watts') or catalog_watts.get(app_name)
+
     if not all([app_name, date_time_str, watts, hours_day]):
         return jsonify({'success': False, 'message': 'Missing required fields.'}), 400
+    try:
+        date_time_str = normalize_date_time(date_time_str)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
 
     try:
         qty = int(qty)
         watts = int(watts)
         hours_day = float(hours_day)
-        daily_kwh, daily_cost = calculate_daily_cost(watts, hours_day, qty)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid data type for QTY, Watts, or Hours/Day.'}), 400
 
-        db = get_db()
-        cursor = db.cursor()
-        cursor.execute(
-            '''INSERT INTO customer_application 
-               (customer_id, application_name, qty, date_time, watts, hours_day, daily_kwh, daily_cost) 
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-            (customer_id, app_name, qty, date_time_str, watts, hours_day, daily_kwh, daily_cost)
+    def operation(cursor):
+        tariff = load_active_tariff(cursor.connection)
+        daily_kwh, daily_cost = calculate_daily_cost(watts, hours_day, qty, date_time_str, tariff)
+        try:
+            cursor.execute(
+                '''INSERT INTO customer_application 
+                   (customer_id, application_name, qty, date_time, watts, hours_day, daily_kwh, daily_cost) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                (customer_id, app_name, qty, date_time_str, watts, hours_day, daily_kwh, daily_cost)
+            )
+        except sqlite3.IntegrityError:
+            # The customer_id foreign key is enforced
+            return WriteResult({'success': False, 'message': 'Customer not found.'}, 404)
+        cust_app_id = cursor.lastrowid
+        update_usage_rollups(cursor, customer_id, app_name, date_time_str, daily_kwh, daily_cost)
+        if reprice_usage_days(cursor, tariff, customer_id, [date_time_str], cust_app_id):
+            after_commit = lambda cursor: publish_resync([customer_id], 'reprice')
+        else:
+            after_commit = lambda cursor: publish_usage_change(cursor, customer_id, 'usage_added', cust_app_id,
+                                                               [date_time_str])
+        return WriteResult(
+            {'success': True, 'message': 'Application usage added successfully.', 'cust_app_id': cust_app_id}, 201,
+            after_commit
         )
-        db.commit()
-        return jsonify({'success': True, 'message': 'Application usage added successfully.'}), 201
-    except ValueError:
-        return jsonify({'success': False, 'message': 'Invalid data type for QTY, Watts, or Hours/Day.'}), 400
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)}), 500
+
+    return run_usage_write(operation)
 
 @app.route('/api/customer/application/<int:cust_app_id>', methods=['PUT'])
 def edit_customer_application(cust_app_id):
@@ -265,216 +938,966 @@ def edit_customer_application(cust_app_id):
 
     if not all([qty, date_time_str, hours_day]):
         return jsonify({'success': False, 'message': 'Missing required fields.'}), 400
-
-    db = get_db()
-    cursor = db.cursor()
+    try:
+        date_time_str = normalize_date_time(date_time_str)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
 
     try:
+        qty = int(qty)
+        hours_day = float(hours_day)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid data type for QTY or Hours/Day.'}), 400
+
+    def operation(cursor):
         # First, retrieve the current record to get the fixed application_name and watts
-        cursor.execute("SELECT application_name, watts FROM customer_application WHERE cust_app_id = ?", (cust_app_id,))
+        # (plus the old date/kWh/cost so its rollup buckets can be adjusted)
+        cursor.execute("""
+            SELECT customer_id, application_name, watts, date_time, daily_kwh, daily_cost
+            FROM customer_application WHERE cust_app_id = ?
+        """, (cust_app_id,))
         record = cursor.fetchone()
         if not record:
-            return jsonify({'success': False, 'message': 'Usage record not found.'}), 404
+            return WriteResult({'success': False, 'message': 'Usage record not found.'}, 404)
 
         app_name = record['application_name']
         watts = record['watts']
 
         # Calculate new daily kwh and cost
-        qty = int(qty)
-        hours_day = float(hours_day)
-        daily_kwh, daily_cost = calculate_daily_cost(watts, hours_day, qty)
+        tariff = load_active_tariff(cursor.connection)
+        daily_kwh, daily_cost = calculate_daily_cost(watts, hours_day, qty, date_time_str, tariff)
 
-        # Update the record
+        # Update the record (read and written in the same transaction)
         cursor.execute(
             '''UPDATE customer_application 
                SET qty = ?, date_time = ?, hours_day = ?, daily_kwh = ?, daily_cost = ? 
                WHERE cust_app_id = ?''',
             (qty, date_time_str, hours_day, daily_kwh, daily_cost, cust_app_id)
         )
-        db.commit()
 
-        if cursor.rowcount == 0:
-            return jsonify({'success': False, 'message': 'Usage record not found after update attempt.'}), 404
+        # Move the entry's contribution from its old rollup buckets to the new ones
+        update_usage_rollups(cursor, record['customer_id'], app_name, record['date_time'],
+                             record['daily_kwh'], record['daily_cost'], direction=-1)
+        update_usage_rollups(cursor, record['customer_id'], app_name, date_time_str, daily_kwh, daily_cost)
+        date_times = [record['date_time'], date_time_str]
+        if reprice_usage_days(cursor, tariff, record['customer_id'], date_times, cust_app_id):
+            after_commit = lambda cursor: publish_resync([record['customer_id']], 'reprice')
+        else:
+            after_commit = lambda cursor: publish_usage_change(cursor, record['customer_id'], 'usage_updated',
+                                                               cust_app_id, date_times)
+        return WriteResult(
+            {'success': True, 'message': f'Usage record for {app_name} updated successfully.'}, 200, after_commit
+        )
 
-        return jsonify({'success': True, 'message': f'Usage record for {app_name} updated successfully.'}), 200
-    except ValueError:
-        return jsonify({'success': False, 'message': 'Invalid data type for QTY or Hours/Day.'}), 400
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)}), 500
+    return run_usage_write(operation)
 
 
 @app.route('/api/customer/application/<int:cust_app_id>', methods=['DELETE'])
 def delete_customer_application(cust_app_id):
     """Deletes an application usage record."""
+    def operation(cursor):
+        cursor.execute("""
+            SELECT customer_id, application_name, date_time, daily_kwh, daily_cost
+            FROM customer_application WHERE cust_app_id = ?
+        """, (cust_app_id,))
+        record = cursor.fetchone()
+        if not record:
+            return WriteResult({'success': False, 'message': 'Usage record not found.'}, 404)
+
+        cursor.execute('DELETE FROM customer_application WHERE cust_app_id = ?', (cust_app_id,))
+        update_usage_rollups(cursor, record['customer_id'], record['application_name'], record['date_time'],
+                             record['daily_kwh'], record['daily_cost'], direction=-1)
+        # The day's remaining entries now share its slab cost without this one
+        tariff = load_active_tariff(cursor.connection)
+        if reprice_usage_days(cursor, tariff, record['customer_id'], [record['date_time']], cust_app_id):
+            after_commit = lambda cursor: publish_resync([record['customer_id']], 'reprice')
+        else:
+            after_commit = lambda cursor: publish_usage_change(cursor, record['customer_id'], 'usage_deleted',
+                                                               cust_app_id, [record['date_time']])
+        return WriteResult({'success': True, 'message': 'Usage record deleted successfully.'}, 200, after_commit)
+
+    return run_usage_write(operation)
+
+
+@app.route('/api/customer/<int:customer_id>/changes', methods=['GET'])
+def stream_customer_changes(customer_id):
+    """
+    Server-sent events for one customer's dashboard. The stream opens with a 'hello' event
+    carrying the customer's data version, then pushes 'usage_added', 'usage_updated' and
+    'usage_deleted' (the row plus updated day/month/year totals), 'customer_updated',
+    'customer_deleted', and 'resync' when the client should refetch everything (bulk
+    imports, repricing, or a reconnect whose Last-Event-ID is no longer current).
+    """
+    cursor = get_db().cursor()
+    cursor.execute("SELECT 1 FROM customer WHERE customer_id = ?", (customer_id,))
+    if not cursor.fetchone():
+        return jsonify({'success': False, 'message': 'Customer not found.'}), 404
+    last_event_id = request.headers.get('Last-Event-ID')
+
+    def first_message():
+        # Read on a connection owned by the stream, after subscribing
+        conn = get_db_connection()
+        try:
+            data_version = get_customer_data_version(conn.cursor(), customer_id)
+        finally:
+            conn.close()
+        if last_event_id is not None and last_event_id != str(data_version):
+            return format_sse('resync', {'customer_id': customer_id, 'reason': 'reconnect'}, data_version)
+        return format_sse('hello', {'customer_id': customer_id, 'data_version': data_version}, data_version)
+
+    response = Response(iter_change_stream(customer_id, first_message), mimetype=SSE_MIMETYPE)
+    response.cache_control.no_cache = True
+    # Keep reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# --- Bulk Usage Import (Admin, for smart-meter and survey batches) ---
+
+def read_import_records(stream, import_format):
+    """
+    Yields (row_number, record) from a CSV or NDJSON upload, reading the stream line by line
+    so the body is never held in memory. Unparseable NDJSON lines yield a None record.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if import_format == 'csv':
+        yield from enumerate(csv.DictReader(text), start=1)
+        return
+    for row_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield row_number, record if isinstance(record, dict) else None
+
+def validate_import_record(record, catalog, customer_ids, default_customer_id):
+    """
+    Checks one import record against the application catalog and the known customers.
+    Returns (customer_id, application_name, qty, date_time, watts, hours_day) or raises ValueError.
+    """
+    if record is None:
+        raise ValueError('Row is not a valid JSON object.')
+
+    try:
+        customer_id = int(record.get('customer_id') or default_customer_id)
+    except (TypeError, ValueError):
+        raise ValueError('Missing or invalid customer_id.')
+    if customer_id not in customer_ids:
+        raise ValueError(f'Customer {customer_id} not found.')
+
+    app_name = (record.get('application_name') or '').strip()
+    if app_name not in catalog:
+        raise ValueError(f"Unknown application '{app_name}'.")
+
+    date_time_str = normalize_date_time(record.get('date_time') or '')
+
+    try:
+        qty = int(record.get('qty') or 1)
+        # Watts default to the catalog value when the row doesn't carry a measured figure
+        watts = int(record.get('watts') or catalog[app_name])
+        hours_day = float(record.get('hours_day'))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid data type for QTY, Watts, or Hours/Day.')
+    # Bad survey or meter data arrives here; out-of-range rows would be priced as-is
+    if not 0 < hours_day <= 24:
+        raise ValueError('Hours/Day must be more than 0 and at most 24.')
+    if qty < 1:
+        raise ValueError('QTY must be at least 1.')
+
+    return customer_id, app_name, qty, date_time_str, watts, hours_day
+
+def insert_usage_chunk(db, chunk, tariff=None):
+    """Inserts one chunk of validated usage rows, plus its rollup deltas, in a single transaction."""
+    customer_ids, app_names, qtys, date_times, watts, hours_days = zip(*chunk)
+    daily_kwh, daily_cost = calculate_daily_costs(watts, hours_days, qtys, date_times, tariff)
+    rows = list(zip(customer_ids, app_names, qtys, date_times, watts, hours_days, daily_kwh, daily_cost))
+
+    cursor = db.cursor()
+    cursor.executemany(
+        '''INSERT INTO customer_application
+           (customer_id, application_name, qty, date_time, watts, hours_day, daily_kwh, daily_cost)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+        rows
+    )
+    update_usage_rollups_bulk(cursor, [(row[0], row[1], row[3], row[6], row[7]) for row in rows])
+    day_len = ROLLUP_PERIODS['day']
+    reprice_slab_days(cursor, tariff, {(row[0], row[3][:day_len]) for row in rows})
+    db.commit()
+    publish_resync(customer_ids, 'import')
+
+@app.route('/api/admin/usage/import', methods=['POST'])
+def import_customer_applications():
+    """
+    Bulk-imports usage rows for one or many customers from a CSV or NDJSON upload, sent
+    either as the 'file' form field or as the raw request body. Each row carries
+    customer_id (or the 'customer_id' query parameter is used), application_name, qty,
+    date_time, hours_day and optionally watts. Valid rows are inserted in transactions of
+    'chunk_size' rows; invalid rows are skipped and listed in the returned error report.
+    """
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    mimetype = (upload.mimetype if upload else request.mimetype) or ''
+    filename = (upload.filename if upload else '') or ''
+
+    import_format = request.args.get('format')
+    if not import_format:
+        if 'csv' in mimetype or filename.endswith('.csv'):
+            import_format = 'csv'
+        elif 'ndjson' in mimetype or filename.endswith(('.ndjson', '.jsonl')):
+            import_format = 'ndjson'
+    if import_format not in ('csv', 'ndjson'):
+        return jsonify({'success': False, 'message': 'Upload format must be csv or ndjson.'}), 400
+
+    try:
+        chunk_size = int(request.args.get('chunk_size', app.config['IMPORT_CHUNK_SIZE']))
+        default_customer_id = request.args.get('customer_id', type=int)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'chunk_size must be an integer.'}), 400
+    if not 1 <= chunk_size <= MAX_IMPORT_CHUNK_SIZE:
+        return jsonify({'success': False, 'message': f'chunk_size must be between 1 and {MAX_IMPORT_CHUNK_SIZE}.'}), 400
+
     db = get_db()
     cursor = db.cursor()
+    # Validation runs against in-memory lookups, not one query per row
+    catalog = get_application_catalog()['watts']
+    cursor.execute("SELECT customer_id FROM customer")
+    customer_ids = {row['customer_id'] for row in cursor.fetchall()}
+    tariff = load_active_tariff(db)
+
+    inserted = 0
+    failed = 0
+    errors = []
+
+    def record_error(row_number, message):
+        nonlocal failed
+        failed += 1
+        if len(errors) < MAX_IMPORT_ERRORS:
+            errors.append({'row': row_number, 'message': message})
+
+    def flush(chunk, chunk_row_numbers):
+        nonlocal inserted
+        try:
+            insert_usage_chunk(db, chunk, tariff)
+            inserted += len(chunk)
+        except sqlite3.Error as e:
+            db.rollback()
+            for row_number in chunk_row_numbers:
+                record_error(row_number, f'Chunk insert failed: {e}')
+
+    chunk = []
+    chunk_row_numbers = []
     try:
-        cursor.execute('DELETE FROM customer_application WHERE cust_app_id = ?', (cust_app_id,))
+        for row_number, record in read_import_records(stream, import_format):
+            try:
+                chunk.append(validate_import_record(record, catalog, customer_ids, default_customer_id))
+            except ValueError as e:
+                record_error(row_number, str(e))
+                continue
+            chunk_row_numbers.append(row_number)
+            if len(chunk) >= chunk_size:
+                flush(chunk, chunk_row_numbers)
+                chunk = []
+                chunk_row_numbers = []
+        if chunk:
+            flush(chunk, chunk_row_numbers)
+    except (UnicodeDecodeError, csv.Error) as e:
+        return jsonify({
+            'success': False, 'message': f'Could not read upload: {e}',
+            'inserted': inserted, 'failed': failed, 'errors': errors
+        }), 400
+
+    return jsonify({
+        'success': failed == 0,
+        'message': f'Imported {inserted} usage rows, {failed} rejected.',
+        'inserted': inserted,
+        'failed': failed,
+        'errors': errors,
+        'errors_truncated': failed > len(errors)
+    }), 200
+
+# --- Tariff Management Routes (Admin only) ---
+
+@app.route('/api/admin/tariffs', methods=['GET'])
+def get_tariffs():
+    """Lists all tariffs with their bands; the active one prices new and repriced usage."""
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute("SELECT tariff_id, tariff_name, tariff_type, is_active, created_at FROM tariff ORDER BY tariff_id ASC")
+    tariffs = [dict(row) for row in cursor.fetchall()]
+    cursor.execute("SELECT tariff_id, band_start, rate_per_kwh FROM tariff_band ORDER BY tariff_id, band_start")
+    bands_by_tariff = {}
+    for row in cursor.fetchall():
+        bands_by_tariff.setdefault(row['tariff_id'], []).append(
+            {'band_start': row['band_start'], 'rate_per_kwh': row['rate_per_kwh']}
+        )
+    for tariff in tariffs:
+        tariff['is_active'] = bool(tariff['is_active'])
+        tariff['bands'] = bands_by_tariff.get(tariff['tariff_id'], [])
+    return jsonify({'success': True, 'tariffs': tariffs, 'default_cost_per_kwh': COST_PER_KWH}), 200
+
+@app.route('/api/admin/tariffs', methods=['POST'])
+def add_tariff():
+    """
+    Admin route to define a new (inactive) tariff. Body: name, tariff_type ('flat', 'slab'
+    or 'tou') and bands: [{band_start, rate_per_kwh}, ...]. band_start is the threshold on a
+    customer's total kWh for the day for slab tariffs (each entry pays its share of the
+    day's cost) and the starting hour of day for time-of-use tariffs.
+    """
+    data = request.json
+    name = data.get('name')
+    tariff_type = data.get('tariff_type')
+    if not name or not tariff_type:
+        return jsonify({'success': False, 'message': 'Name and tariff type are required.'}), 400
+    try:
+        bands = validate_tariff_bands(
+            tariff_type, [(band.get('band_start'), band.get('rate_per_kwh')) for band in data.get('bands') or []]
+        )
+    except (ValueError, AttributeError) as e:
+        return jsonify({'success': False, 'message': str(e) or 'Invalid bands.'}), 400
+
+    db = get_db()
+    cursor = db.cursor()
+    try:
+        cursor.execute('INSERT INTO tariff (tariff_name, tariff_type) VALUES (?, ?)', (name, tariff_type))
+        tariff_id = cursor.lastrowid
+        cursor.executemany(
+            'INSERT INTO tariff_band (tariff_id, band_start, rate_per_kwh) VALUES (?, ?, ?)',
+            [(tariff_id, start, rate) for start, rate in bands]
+        )
         db.commit()
+        return jsonify({'success': True, 'message': 'Tariff added successfully.', 'tariff_id': tariff_id}), 201
+    except sqlite3.IntegrityError as e:
+        db.rollback()
+        if 'tariff.tariff_name' in str(e):
+            return jsonify({'success': False, 'message': 'Tariff name already exists.'}), 409
+        return jsonify({'success': False, 'message': str(e)}), 500
+    except Exception as e:
+        db.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/tariffs/<int:tariff_id>/activate', methods=['POST'])
+def activate_tariff(tariff_id):
+    """
+    Admin route to make a tariff the active one. New usage is priced with it immediately,
+    and a background job reprices the existing rows in small resumable chunks.
+    """
+    db = get_db()
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT tariff_id FROM tariff WHERE tariff_id = ?", (tariff_id,))
+        if not cursor.fetchone():
+            return jsonify({'success': False, 'message': 'Tariff not found.'}), 404
+        cursor.execute("UPDATE tariff SET is_active = CASE WHEN tariff_id = ? THEN 1 ELSE 0 END", (tariff_id,))
+        cursor.execute("SELECT COALESCE(MAX(cust_app_id), 0) FROM customer_application")
+        max_cust_app_id = cursor.fetchone()[0]
+        cursor.execute(
+            'INSERT INTO reprice_job (tariff_id, max_cust_app_id) VALUES (?, ?)', (tariff_id, max_cust_app_id)
+        )
+        job_id = cursor.lastrowid
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
 
-        if cursor.rowcount == 0:
-            return jsonify({'success': False, 'message': 'Usage record not found.'}), 404
+    start_reprice_job(job_id)
+    return jsonify({'success': True, 'message': 'Tariff activated; repricing started.', 'job_id': job_id}), 202
 
-        return jsonify({'success': True, 'message': 'Usage record deleted successfully.'}), 200
+@app.route('/api/admin/reprice_jobs/<int:job_id>', methods=['GET'])
+def get_reprice_job(job_id):
+    """Reports a repricing job's status and progress."""
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute("SELECT * FROM reprice_job WHERE job_id = ?", (job_id,))
+    job = cursor.fetchone()
+    if not job:
+        return jsonify({'success': False, 'message': 'Reprice job not found.'}), 404
+    return jsonify({'success': True, 'job': dict(job)}), 200
+
+@app.route('/api/admin/reprice_jobs/<int:job_id>/resume', methods=['POST'])
+def resume_reprice_job(job_id):
+    """Restarts an interrupted or failed repricing job from its last committed chunk."""
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute("SELECT status FROM reprice_job WHERE job_id = ?", (job_id,))
+    job = cursor.fetchone()
+    if not job:
+        return jsonify({'success': False, 'message': 'Reprice job not found.'}), 404
+    if job['status'] in ('done', 'superseded'):
+        return jsonify({'success': False, 'message': f"Reprice job is already {job['status']}."}), 409
+    start_reprice_job(job_id)
+    return jsonify({'success': True, 'message': 'Repricing resumed.', 'job_id': job_id}), 202
+
+# --- Usage Archive (Admin only) ---
+
+@app.route('/api/admin/archive', methods=['GET'])
+def get_archive_stats():
+    """Reports how many usage rows, customers and segments the columnar archive holds."""
+    return jsonify({'success': True, 'archive': archive_stats(get_db().cursor())}), 200
+
+@app.route('/api/admin/archive', methods=['POST'])
+def archive_usage():
+    """
+    Moves every customer's usage dated before 'before' (YYYY-MM query parameter; default
+    ARCHIVE_LIVE_MONTHS months before the current one) into the columnar archive.
+    Listings, reports, cost analysis and what-if estimates keep including archived rows,
+    but archived rows can no longer be edited or deleted one by one.
+    """
+    before = request.args.get('before')
+    if before:
+        try:
+            datetime.strptime(before, '%Y-%m')
+        except ValueError:
+            return jsonify({'success': False, 'message': 'before must be a month (YYYY-MM).'}), 400
+    try:
+        result = archive_closed_periods(before)
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
+    return jsonify({
+        'success': True,
+        'message': f"Archived {result['rows']} usage rows of {result['customers']} customers.",
+        **result
+    }), 200
+
+# --- Response Cache Administration (Admin only) ---
+
+@app.route('/api/admin/response_cache', methods=['GET'])
+def get_response_cache_stats():
+    """Reports the response cache's size and its hit/miss/eviction/304 counters."""
+    with _response_cache_lock:
+        stats = dict(response_cache_stats, size=len(_response_cache))
+    stats['max_size'] = app.config['RESPONSE_CACHE_SIZE']
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+    return jsonify({'success': True, 'response_cache': stats}), 200
+
+@app.route('/api/admin/response_cache', methods=['DELETE'])
+def flush_response_cache():
+    """Drops every cached response, e.g. after editing the database by hand."""
+    clear_response_cache()
+    return jsonify({'success': True, 'message': 'Response cache cleared.'}), 200
 
+# --- Metrics ---
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Prometheus metrics. Per-route timing histograms and per-request SQL statement, time and
+    row counts are included when instrumentation is enabled; the response cache counters
+    are always reported, and the write queue's once it has been used.
+    """
+    with _response_cache_lock:
+        cache_stats = dict(response_cache_stats, size=len(_response_cache))
+    lines = [
+        '# HELP billbuddy_instrumentation_enabled Whether request/SQL instrumentation is installed.',
+        '# TYPE billbuddy_instrumentation_enabled gauge',
+        f'billbuddy_instrumentation_enabled {int(instrumentation_enabled())}',
+    ]
+    for name in ('hits', 'misses', 'evictions', 'not_modified'):
+        lines.extend([
+            f'# HELP billbuddy_response_cache_{name}_total Versioned response cache {name.replace("_", " ")}.',
+            f'# TYPE billbuddy_response_cache_{name}_total counter',
+            f'billbuddy_response_cache_{name}_total {cache_stats[name]}',
+        ])
+    lines.extend([
+        '# HELP billbuddy_response_cache_entries Responses currently cached.',
+        '# TYPE billbuddy_response_cache_entries gauge',
+        f"billbuddy_response_cache_entries {cache_stats['size']}",
+        '# HELP billbuddy_change_feed_subscribers Open change feed streams in this process.',
+        '# TYPE billbuddy_change_feed_subscribers gauge',
+        f'billbuddy_change_feed_subscribers {get_change_feed().subscriber_count()}',
+    ])
+    queue_stats = write_queue_stats()
+    if queue_stats is not None:
+        for name in ('writes', 'batches', 'failed_batches', 'rejected'):
+            lines.extend([
+                f'# HELP billbuddy_write_queue_{name}_total Group-commit write queue {name.replace("_", " ")}.',
+                f'# TYPE billbuddy_write_queue_{name}_total counter',
+                f'billbuddy_write_queue_{name}_total {queue_stats[name]}',
+            ])
+        lines.extend([
+            '# HELP billbuddy_write_queue_pending Writes waiting for the writer thread.',
+            '# TYPE billbuddy_write_queue_pending gauge',
+            f"billbuddy_write_queue_pending {queue_stats['pending']}",
+            '# HELP billbuddy_write_queue_largest_batch Most writes committed in one transaction.',
+            '# TYPE billbuddy_write_queue_largest_batch gauge',
+            f"billbuddy_write_queue_largest_batch {queue_stats['largest_batch']}",
+        ])
+    return Response(render_metrics(lines), content_type=PROMETHEUS_MIMETYPE)
+
+@app.route('/api/admin/slow_queries', methods=['GET'])
+def get_slow_queries():
+    """The most recent slow statements (newest first) with their query plans."""
+    return jsonify({
+        'success': True,
+        'enabled': instrumentation_enabled(),
+        'threshold_ms': app.config['SLOW_QUERY_MS'],
+        'slow_queries': list(reversed(slow_queries)),
+    }), 200
 
 # --- Reporting and Analysis Routes (Charts, Summary, PDF Data) ---
 
 @app.route('/api/cost_analysis', methods=['GET'])
+@versioned_response_cache
 def get_cost_analysis():
     """
     Provides aggregated data for charts and summary reports based on customer, period, and date filter.
     Filters: customer_id (required), period (day/month/year), date (YYYY-MM-DD, YYYY-MM, or YYYY)
+    Optional fields: comma-separated subset of COST_ANALYSIS_FIELDS (default: all but
+    'forecast'); the aggregates that are not asked for are neither computed nor returned.
     """
     customer_id = request.args.get('customer_id', type=int)
     period = request.args.get('period', 'month') # Default to month
     date_param = request.args.get('date') # YYYY-MM-DD, YYYY-MM, YYYY
+    fields_param = request.args.get('fields')
+    fields = set(fields_param.split(',')) if fields_param else set(DEFAULT_COST_ANALYSIS_FIELDS)
 
     if not customer_id:
         return jsonify({'success': False, 'message': 'Customer ID is required.'}), 400
+    if not fields <= set(COST_ANALYSIS_FIELDS):
+        return jsonify({'success': False, 'message': f"Fields must be among: {', '.join(COST_ANALYSIS_FIELDS)}."}), 400
 
     db = get_db()
     cursor = db.cursor()
 
     try:
-        # 1. Base Query Filter Construction
-        filter_clause = "WHERE customer_id = ?"
-        params = [customer_id]
-
-        # Determine the date filtering based on the provided date_param and period
-        # If a specific date is provided, restrict the filter
+        # 1. Date Filter Construction
+        # Determine the date filtering based on the provided date_param and period.
+        # Filters are half-open ranges (bucket >= start AND bucket < end) over the
+        # usage_rollup table, so no raw customer_application rows are re-aggregated.
+        date_prefix = None
         if date_param:
-            if period == 'day':
-                # Filter by YYYY-MM-DD
-                filter_clause += " AND date_time LIKE ?"
-                params.append(f"{date_param}%")
-            elif period == 'month':
-                # Filter by YYYY-MM
-                filter_clause += " AND date_time LIKE ?"
-                params.append(f"{date_param}%")
-            elif period == 'year':
-                # Filter by YYYY
-                filter_clause += " AND date_time LIKE ?"
-                params.append(f"{date_param}%")
-
-        # Fallback filter for month/year period when no date_param is explicitly set
-        if not date_param:
-             if period == 'month':
+            if period in ('day', 'month', 'year'):
+                # Filter by YYYY-MM-DD, YYYY-MM or YYYY
+                date_prefix = date_param
+        else:
+            # Fallback filter for month/year period when no date_param is explicitly set
+            if period == 'month':
                 # Default to current month if no date is given for month view
-                current_month = datetime.now().strftime('%Y-%m')
-                filter_clause += " AND date_time LIKE ?"
-                params.append(f"{current_month}%")
-             elif period == 'year':
+                date_prefix = datetime.now().strftime('%Y-%m')
+            elif period == 'year':
                 # Default to current year if no date is given for year view
-                current_year = datetime.now().strftime('%Y')
-                filter_clause += " AND date_time LIKE ?"
-                params.append(f"{current_year}%")
-
-        # 2. Summary (Total Cost) Calculation for the selected filter
-        cursor.execute(f"SELECT SUM(daily_cost) AS total_cost FROM customer_application {filter_clause}", tuple(params))
-        summary_cost = cursor.fetchone()['total_cost'] or 0.0
-
-        # 3. Chart Data Aggregation (Two main types: Application Breakdown and Time Series)
-
-        # Application Breakdown (Pie/Bar Chart): Total cost aggregated by application name for the filtered period
-        cursor.execute(f"""
-            SELECT application_name, SUM(daily_cost) AS total_cost
-            FROM customer_application
-            {filter_clause}
-            GROUP BY application_name
-            ORDER BY total_cost DESC
-        """, tuple(params))
-        app_breakdown_data = [dict(row) for row in cursor.fetchall()]
-
-        # Time Series Data: Aggregated by time unit (Day, Month, or Year)
-
-        monthly_chart_data_raw = None
-        daily_chart_data_raw = None
-
-        if period == 'year':
-            # Monthly totals within the selected year
-            month_group = "STRFTIME('%Y-%m', date_time)"
-            cursor.execute(f"""
-                SELECT {month_group} AS month_label, SUM(daily_cost) AS total_cost
-                FROM customer_application
-                {filter_clause}
-                GROUP BY month_label
-                ORDER BY month_label ASC
-            """, tuple(params))
-            monthly_chart_data_raw = [dict(row) for row in cursor.fetchall()]
-
-        elif period == 'month':
-            # Daily totals within the selected month
-            day_group = "STRFTIME('%Y-%m-%d', date_time)"
+                date_prefix = datetime.now().strftime('%Y')
+
+        range_params = []
+        range_clause = ""
+        # Without a date filter, the yearly buckets cover the customer's entire history
+        filter_level = 'year'
+        if date_prefix:
+            try:
+                range_start, range_end = get_date_range(date_prefix)
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            range_clause = " AND bucket >= ? AND bucket < ?"
+            range_params = [range_start, range_end]
+            # Rollup level matching the filter's granularity (day/month/year)
+            filter_level = ROLLUP_LEVEL_BY_PREFIX_LEN[len(date_prefix)]
+
+        # Time series unit: days within a month view, months within a year view
+        series_level = {'month': 'day', 'year': 'month'}.get(period) if 'time_series' in fields else None
+        # Scan the finer of the filter and series levels; coarser totals are summed from it
+        scan_level = filter_level
+        if series_level and ROLLUP_PERIODS[series_level] > ROLLUP_PERIODS[filter_level]:
+            scan_level = series_level
+
+        response = {'success': True}
+
+        # 2. Single scoped scan over the rollups: summary, application breakdown and time
+        # series are all accumulated in one pass over the customer's buckets
+        if fields & {'summary', 'app_breakdown', 'time_series'}:
             cursor.execute(f"""
-                SELECT {day_group} AS day_label, SUM(daily_cost) AS total_cost
-                FROM customer_application
-                {filter_clause}
-                GROUP BY day_label
-                ORDER BY day_label ASC
-            """, tuple(params))
-            daily_chart_data_raw = [dict(row) for row in cursor.fetchall()]
-
-
-        # 4. Available Filters for UI Controls
-
-        # Available Years
-        cursor.execute('''SELECT DISTINCT SUBSTR(date_time, 1, 4) AS year FROM customer_application ORDER BY year DESC''')
-        available_years = [row['year'] for row in cursor.fetchall()]
-
-        # Available Months for the selected year
-        year_filter = date_param[:4] if date_param and len(date_param) >= 4 else datetime.now().strftime('%Y')
-        cursor.execute('''SELECT DISTINCT SUBSTR(date_time, 1, 7) AS month FROM customer_application WHERE date_time LIKE ? ORDER BY month DESC''', (f"{year_filter}%",))
-        available_months = [row['month'] for row in cursor.fetchall()]
-
-        response = {
-            'success': True,
-            'summary_cost': round(summary_cost, 2),
-            'app_breakdown_data': app_breakdown_data,
-            'monthly_chart_data': monthly_chart_data_raw, # Totals per month (if period=year)
-            'daily_chart_data': daily_chart_data_raw, # Totals per day (if period=month or day)
-            'available_years': available_years,
-            'available_months': available_months,
-            'current_filter': {'period': period, 'date': date_param}
-        }
-        return jsonify(response), 200
+                SELECT bucket, application_name, total_cost
+                FROM usage_rollup
+                WHERE customer_id = ? AND period = ?{range_clause}
+            """, (customer_id, scan_level, *range_params))
+
+            summary_cost = 0.0
+            app_totals = {}
+            series_totals = {}
+            series_label_len = ROLLUP_PERIODS[series_level] if series_level else None
+            for bucket, app_name, total_cost in cursor:
+                summary_cost += total_cost
+                app_totals[app_name] = app_totals.get(app_name, 0.0) + total_cost
+                if series_label_len:
+                    label = bucket[:series_label_len]
+                    series_totals[label] = series_totals.get(label, 0.0) + total_cost
+
+            if 'summary' in fields:
+                response['summary_cost'] = round(summary_cost, 2)
+
+            if 'app_breakdown' in fields:
+                # Application Breakdown (Pie/Bar Chart): Total cost aggregated by application name for the filtered period
+                response['app_breakdown_data'] = list_payload(
+                    ('application_name', 'total_cost'),
+                    sorted(app_totals.items(), key=lambda item: item[1], reverse=True)
+                )
+
+            if 'time_series' in fields:
+                # Time Series Data: Monthly totals within a year, or daily totals within a month
+                monthly_chart_data_raw = None
+                daily_chart_data_raw = None
+                if period == 'year':
+                    monthly_chart_data_raw = list_payload(('month_label', 'total_cost'), sorted(series_totals.items()))
+                elif period == 'month':
+                    daily_chart_data_raw = list_payload(('day_label', 'total_cost'), sorted(series_totals.items()))
+                response['monthly_chart_data'] = monthly_chart_data_raw # Totals per month (if period=year)
+                response['daily_chart_data'] = daily_chart_data_raw # Totals per day (if period=month or day)
+
+        # 3. Available Filters for UI Controls: the customer's own years, and their months
+        # within the selected year, read from the small customer_active_period table
+        if 'filters' in fields:
+            year_filter = date_param[:4] if date_param and len(date_param) >= 4 else datetime.now().strftime('%Y')
+            year_start, year_end = get_date_range(year_filter)
+            cursor.execute('''
+                SELECT period, bucket
+                FROM customer_active_period
+                WHERE customer_id = ?
+                  AND (period = 'year' OR (period = 'month' AND bucket >= ? AND bucket < ?))
+                ORDER BY bucket DESC
+            ''', (customer_id, year_start, year_end))
+            available_years = []
+            available_months = []
+            for row in cursor:
+                (available_years if row['period'] == 'year' else available_months).append(row['bucket'])
+            response['available_years'] = available_years
+            response['available_months'] = available_months
+
+        # 4. Month-end and year-end projection of the customer's bill as of today
+        if 'forecast' in fields:
+            forecasts = forecast_bills(db, customer_id=customer_id)
+            response['forecast'] = forecasts[0] if forecasts else None
+
+        response['current_filter'] = {'period': period, 'date': date_param}
+        return json_response(response)
 
     except Exception as e:
         print(f"Error in cost analysis: {e}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/customer/<int:customer_id>/totals', methods=['GET'])
+def get_customer_totals(customer_id):
+    """
+    Dashboard totals: the cost and kWh of the day, month and year containing 'date'
+    (YYYY-MM-DD, defaults to today), answered by one lookup of three rollup buckets.
+    """
+    date_param = request.args.get('date') or datetime.now().strftime('%Y-%m-%d')
+    try:
+        datetime.strptime(date_param, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'success': False, 'message': f"Invalid date '{date_param}'. Expected YYYY-MM-DD."}), 400
+
+    buckets = {period: date_param[:prefix_len] for period, prefix_len in ROLLUP_PERIODS.items()}
+    totals = {period: {'bucket': bucket, 'total_kwh': 0.0, 'total_cost': 0.0} for period, bucket in buckets.items()}
+
+    db = get_db()
+    cursor = db.cursor()
+    # A deleted customer is 404, not all-zero totals, so a stale dashboard can tell the two apart
+    cursor.execute("SELECT 1 FROM customer WHERE customer_id = ?", (customer_id,))
+    if not cursor.fetchone():
+        return jsonify({'success': False, 'message': 'Customer not found.'}), 404
+    # Each (customer_id, period, bucket) triple is a prefix of usage_rollup's primary key;
+    # joining from the list of buckets lets SQLite seek all three (a row-value IN list only
+    # seeks customer_id and scans the customer's buckets)
+    cursor.execute("""
+        SELECT r.period, SUM(r.total_kwh) AS total_kwh, SUM(r.total_cost) AS total_cost
+        FROM (VALUES ('day', ?), ('month', ?), ('year', ?)) AS wanted
+        JOIN usage_rollup r ON r.customer_id = ? AND r.period = wanted.column1 AND r.bucket = wanted.column2
+        GROUP BY r.period
+    """, (buckets['day'], buckets['month'], buckets['year'], customer_id))
+    for row in cursor:
+        totals[row['period']].update(total_kwh=round(row['total_kwh'], 3), total_cost=round(row['total_cost'], 2))
+
+    return jsonify({'success': True, 'date': date_param, 'totals': totals}), 200
+
 @app.route('/api/customer/<int:customer_id>/report_data', methods=['GET'])
+@versioned_response_cache
 def get_pdf_report_data(customer_id):
-    """Fetches all customer usage data for the PDF export."""
+    """
+    Fetches customer usage data for the PDF export. Supports the same 'limit'/'cursor'
+    pagination as the usage listing. With 'Accept: application/x-ndjson' the first line
+    carries customer_info and totals, and every following line is one usage record.
+    """
+    try:
+        page_cursor, limit = get_page_params()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
     db = get_db()
     cursor = db.cursor()
 
     # Get customer details
     cursor.execute("SELECT customer_name, email_id, phone_no FROM customer WHERE customer_id = ?", (customer_id,))
-    customer_info = dict(cursor.fetchone())
+    customer = cursor.fetchone()
+    if not customer:
+        return jsonify({'success': False, 'message': 'Customer not found.'}), 404
+    customer_info = dict(customer)
 
-    # Get all usage data
-    cursor.execute(f'''
-        SELECT application_name, qty, STRFTIME('%Y-%m-%d %H:%M', date_time) AS date_time, 
-               watts, hours_day, daily_kwh, daily_cost
-        FROM customer_application 
-        WHERE customer_id = ?
-        ORDER BY date_time DESC
-    ''', (customer_id,))
-    usage_data = [dict(row) for row in cursor.fetchall()]
-
-    # Get total cost and consumption
-    cursor.execute("SELECT SUM(daily_kwh) AS total_kwh, SUM(daily_cost) AS total_cost FROM customer_application WHERE customer_id = ?", (customer_id,))
+    # Get total cost and consumption (the yearly rollup buckets cover all of the customer's history)
+    cursor.execute("SELECT SUM(total_kwh) AS total_kwh, SUM(total_cost) AS total_cost FROM usage_rollup WHERE customer_id = ? AND period = 'year'", (customer_id,))
     totals = dict(cursor.fetchone())
 
-    return jsonify({
+    if wants_ndjson():
+        def report_lines(stream_cursor):
+            yield {'customer_info': customer_info, 'totals': totals}
+            for record, _ in iter_usage_rows(stream_cursor, customer_id, REPORT_USAGE_FIELDS, page_cursor, limit):
+                yield record
+        return stream_ndjson(report_lines)
+
+    # Get the usage data
+    usage_data, next_cursor = fetch_usage_page(cursor, customer_id, REPORT_USAGE_FIELDS, page_cursor, limit)
+
+    return json_response({
         'success': True,
         'customer_info': customer_info,
         'usage_data': usage_data,
-        'totals': totals
-    }), 200
+        'totals': totals,
+        'next_cursor': next_cursor
+    })
+
+@app.route('/api/customer/<int:customer_id>/report.<report_format>', methods=['GET'])
+def download_report(customer_id, report_format):
+    """
+    Downloads a customer's full usage report as 'csv' or 'pdf', rendered on the server.
+    Reports are cached on disk under the customer's data version: an unchanged report is
+    sent straight from its file (with an ETag), otherwise it is streamed while it renders.
+    """
+    if report_format not in REPORT_FORMATS:
+        return jsonify({'success': False, 'message': f"Report format must be one of: {', '.join(REPORT_FORMATS)}."}), 400
+
+    # The version, header data and rows are read in one transaction, opened here: a customer
+    # deleted after this check cannot turn into an empty download, and the file is cached
+    # under exactly the version of the data it contains
+    conn = get_db_connection()
+    try:
+        stream_cursor = conn.cursor()
+        stream_cursor.execute('BEGIN')
+        data_version = get_customer_data_version(stream_cursor, customer_id)
+        stream_cursor.execute("SELECT customer_name, email_id, phone_no FROM customer WHERE customer_id = ?", (customer_id,))
+        customer = stream_cursor.fetchone()
+    except Exception:
+        conn.close()
+        raise
+    if not customer:
+        conn.close()
+        return jsonify({'success': False, 'message': 'Customer not found.'}), 404
+    customer_info = dict(customer)
+    download_name = secure_filename(f"Energy_Report_{customer['customer_name']}_{datetime.now().strftime('%Y-%m-%d')}.{report_format}")
+
+    cache_key = report_cache_key(customer_id, data_version, report_format)
+    try:
+        response = send_file(
+            cached_report_path(customer_id, cache_key, report_format), mimetype=REPORT_FORMATS[report_format],
+            as_attachment=True, download_name=download_name, etag=cache_key, conditional=True, max_age=0
+        )
+        conn.close()
+        response.headers['X-Report-Cache'] = 'hit'
+        return response
+    except FileNotFoundError:
+        pass
+
+    def generate():
+        try:
+            stream_cursor.execute("SELECT SUM(total_kwh) AS total_kwh, SUM(total_cost) AS total_cost FROM usage_rollup WHERE customer_id = ? AND period = 'year'", (customer_id,))
+            totals = dict(stream_cursor.fetchone())
+
+            records = (record for record, _ in iter_usage_rows(stream_cursor, customer_id, REPORT_USAGE_FIELDS))
+            if report_format == 'csv':
+                chunks = render_report_csv(records)
+            else:
+                chunks = render_report_pdf(customer_info, totals, records)
+            yield from cache_report_chunks(chunks, cached_report_path(customer_id, cache_key, report_format))
+        finally:
+            conn.close()
+
+    response = Response(generate(), mimetype=REPORT_FORMATS[report_format])
+    response.call_on_close(conn.close)  # Also when the stream is dropped before it starts
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    response.headers['X-Report-Cache'] = 'miss'
+    return response
+
+@app.route('/api/customer/<int:customer_id>/what_if', methods=['GET'])
+def get_what_if_estimate(customer_id):
+    """
+    Reprices a customer's whole usage history under a what-if scenario using the
+    vectorized estimation engine. Query parameters (all optional):
+    cost_per_kwh (defaults to COST_PER_KWH), application (case-insensitive name match,
+    e.g. 'Air Conditioner') and hours_delta (hours/day added to matching rows, e.g. -2).
+    """
+    try:
+        cost_per_kwh = float(request.args.get('cost_per_kwh', COST_PER_KWH))
+        hours_delta = float(request.args.get('hours_delta', 0.0))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'cost_per_kwh and hours_delta must be numbers.'}), 400
+    # float() also parses 'nan' and 'inf', which would end up as invalid JSON in the response
+    if not (math.isfinite(cost_per_kwh) and math.isfinite(hours_delta)):
+        return jsonify({'success': False, 'message': 'cost_per_kwh and hours_delta must be finite numbers.'}), 400
+    if cost_per_kwh < 0:
+        return jsonify({'success': False, 'message': 'cost_per_kwh cannot be negative.'}), 400
+    application = request.args.get('application')
+
+    try:
+        db = get_db()
+        if db.execute("SELECT 1 FROM customer WHERE customer_id = ?", (customer_id,)).fetchone() is None:
+            return jsonify({'success': False, 'message': 'Customer not found.'}), 404
+        records, app_names = load_usage_arrays(db, customer_id)
+        result = run_what_if(records, app_names, cost_per_kwh, application, hours_delta)
+        result.update({
+            'success': True,
+            'scenario_params': {'cost_per_kwh': cost_per_kwh, 'application': application, 'hours_delta': hours_delta}
+        })
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/customer/<int:customer_id>/load_curve', methods=['GET'])
+@versioned_response_cache
+def get_customer_load_curve(customer_id):
+    """
+    The customer's simulated hourly load over a day, month or year ('date', default this
+    month): the average day's kW in each hour (00:00 to 23:00) and their peak kW, with the
+    date and hour it occurs at. Each entry's hours of use follow its appliance's duty-cycle profile.
+    """
+    try:
+        level, bucket = get_fleet_bucket()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    try:
+        first_day, last_day, curves, _ = customer_load_curves(get_db(), level, bucket, customer_id=customer_id)
+        if not curves:
+            return jsonify({'success': False, 'message': 'Customer not found.'}), 404
+        return jsonify({
+            'success': True, 'period': level, 'date': bucket, 'first_day': first_day, 'last_day': last_day,
+            'load_curve': {key: value for key, value in curves[0].items() if key not in ('customer_name', 'email_id')}
+        }), 200
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+# --- Fleet Analytics Routes (Admin only) ---
+
+def get_db_path():
+    """Absolute path of the database file behind the request's connection, for worker processes."""
+    return get_db().execute('PRAGMA database_list').fetchone()['file']
+
+def get_fleet_bucket():
+    """Reads the 'date' parameter (YYYY-MM-DD, YYYY-MM or YYYY; default this month) as a (level, bucket) rollup key."""
+    date_param = request.args.get('date') or datetime.now().strftime('%Y-%m')
+    get_date_range(date_param)  # Raises ValueError for an invalid date
+    return ROLLUP_LEVEL_BY_PREFIX_LEN[len(date_param)], date_param
+
+@app.route('/api/admin/analytics/top_consumers', methods=['GET'])
+def get_fleet_top_consumers():
+    """The highest-cost customers of a day, month or year ('date', default this month). Optional 'limit' (default 10)."""
+    try:
+        level, bucket = get_fleet_bucket()
+        limit = int(request.args.get('limit', 10))
+        if not 1 <= limit <= MAX_FLEET_TOP_LIMIT:
+            raise ValueError(f'Limit must be between 1 and {MAX_FLEET_TOP_LIMIT}.')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    try:
+        result = fleet_top_consumers(get_db_path(), level, bucket, limit)
+        result.update({'success': True, 'period': level, 'date': bucket})
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/analytics/appliance_load', methods=['GET'])
+def get_fleet_appliance_load():
+    """Total consumption and cost per appliance type across all customers for a day, month or year ('date')."""
+    try:
+        level, bucket = get_fleet_bucket()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    try:
+        result = fleet_appliance_load(get_db_path(), level, bucket)
+        result.update({'success': True, 'period': level, 'date': bucket})
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/analytics/growth', methods=['GET'])
+def get_fleet_growth():
+    """
+    Fleet cost, kWh and active customers per month with month-over-month growth, for the
+    'months' months (default 12) ending with 'end' (YYYY-MM, default this month).
+    """
+    end_param = request.args.get('end') or datetime.now().strftime('%Y-%m')
+    try:
+        end = datetime.strptime(end_param, '%Y-%m')
+        month_count = int(request.args.get('months', 12))
+        if not 1 <= month_count <= MAX_FLEET_GROWTH_MONTHS:
+            raise ValueError(f'Months must be between 1 and {MAX_FLEET_GROWTH_MONTHS}.')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    month_index = end.year * 12 + end.month - 1
+    months = [f'{index // 12:04d}-{index % 12 + 1:02d}' for index in range(month_index - month_count + 1, month_index + 1)]
+    try:
+        result = fleet_monthly_growth(get_db_path(), months)
+        result['success'] = True
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/analytics/peak_demand', methods=['GET'])
+def get_fleet_peak_demand():
+    """
+    Peak demand across all customers over a day, month or year ('date', default this month),
+    simulated for every customer in one batched pass: the customers with the highest peak kW
+    (optional 'limit', default 10) with their average-day curves, and the fleet's average-day
+    curve, coincident peak and diversity factor.
+    """
+    try:
+        level, bucket = get_fleet_bucket()
+        limit = int(request.args.get('limit', 10))
+        if not 1 <= limit <= MAX_FLEET_TOP_LIMIT:
+            raise ValueError(f'Limit must be between 1 and {MAX_FLEET_TOP_LIMIT}.')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    try:
+        first_day, last_day, curves, fleet = customer_load_curves(get_db(), level, bucket)
+        curves.sort(key=lambda curve: curve['peak_kw'], reverse=True)
+        return jsonify({
+            'success': True, 'period': level, 'date': bucket, 'first_day': first_day, 'last_day': last_day,
+            'customers': len(curves),
+            'fleet': fleet,
+            'top_customers': curves[:limit]
+        }), 200
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/analytics/projected_bills', methods=['GET'])
+def get_projected_bills():
+    """
+    Projected month-end and year-end bills of every customer as of 'date' (YYYY-MM-DD,
+    default today), highest projected month first. Optional 'limit' keeps the top N.
+    """
+    date_param = request.args.get('date') or datetime.now().strftime('%Y-%m-%d')
+    try:
+        try:
+            as_of = datetime.strptime(date_param, '%Y-%m-%d')
+        except ValueError:
+            raise ValueError(f"Invalid date '{date_param}'. Expected YYYY-MM-DD.")
+        limit = request.args.get('limit')
+        limit = int(limit) if limit is not None else None
+        if limit is not None and limit < 1:
+            raise ValueError('Limit must be a positive integer.')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    try:
+        forecasts = forecast_bills(get_db(), as_of)
+        forecasts.sort(key=lambda forecast: forecast['projected_month_cost'], reverse=True)
+        return jsonify({
+            'success': True,
+            'date': as_of.strftime('%Y-%m-%d'),
+            'customers': len(forecasts),
+            'projected_month_cost': round(sum(forecast['projected_month_cost'] for forecast in forecasts), 2),
+            'projected_year_cost': round(sum(forecast['projected_year_cost'] for forecast in forecasts), 2),
+            'forecasts': forecasts[:limit]
+        }), 200
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
 
 # --- Default Route ---
 
@@ -484,8 +1907,4 @@ def index():
     return jsonify({'message': 'BillBuddy Energy Estimator API is running.'}), 200
 
 if __name__ == '__main__':
-    # When running locally, ensure the DB and initial data are set up
-    if not os.path.exists(DB_NAME):
-        create_tables()
-        insert_initial_applications()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,109 @@
+# This module holds the vectorized (NumPy) estimation engine used for batch and what-if pricing.
+# It mirrors calculate_daily_cost in energy_app.py, but works on whole columns of usage records at once.
+
+import numpy as np
+
+from usage_archive import load_customer_archive
+
+# Column layout loaded from customer_application (and the usage archive) for one customer
+USAGE_ARRAY_DTYPE = np.dtype([
+    ('app_code', np.int32),
+    ('watts', np.float64),
+    ('hours_day', np.float64),
+    ('qty', np.float64),
+    ('daily_kwh', np.float64),
+    ('daily_cost', np.float64),
+])
+
+
+def load_usage_arrays(conn, customer_id):
+    """
+    Loads a customer's usage history, live and archived rows alike, as columnar arrays.
+    Returns (records, app_names): a structured array in USAGE_ARRAY_DTYPE, and the
+    application names that its 'app_code' column indexes into.
+    """
+    cursor = conn.cursor()
+    archive = load_customer_archive(cursor, customer_id)
+    cursor.row_factory = None  # Plain tuples stream straight into np.fromiter
+    cursor.execute('''
+        SELECT application_name, watts, hours_day, qty, daily_kwh, daily_cost
+        FROM customer_application
+        WHERE customer_id = ?
+    ''', (customer_id,))
+
+    app_codes = {}
+    def coded_rows():
+        for app_name, watts, hours_day, qty, daily_kwh, daily_cost in cursor:
+            code = app_codes.setdefault(app_name, len(app_codes))
+            yield code, watts, hours_day, qty, daily_kwh or 0.0, daily_cost or 0.0
+
+    records = np.fromiter(coded_rows(), dtype=USAGE_ARRAY_DTYPE)
+    if archive is None:
+        return records, list(app_codes)
+
+    # Archived columns are copied straight out of their memory maps, codes remapped
+    columns, archived_app_names = archive
+    remap = np.array([app_codes.setdefault(name, len(app_codes)) for name in archived_app_names], dtype=np.int32)
+    archived = np.empty(len(columns['app_code']), dtype=USAGE_ARRAY_DTYPE)
+    archived['app_code'] = remap[columns['app_code']]
+    for name in ('watts', 'hours_day', 'qty', 'daily_kwh', 'daily_cost'):
+        archived[name] = columns[name]
+    return np.concatenate([records, archived]), list(app_codes)
+
+
+def estimate_daily_costs(watts, hours_day, qty, cost_per_kwh):
+    """
+    Vectorized calculate_daily_cost: Daily kWh = (Watts * Hours/Day * QTY) / 1000 and
+    Daily Cost = Daily kWh * cost_per_kwh, rounded to 3 and 2 places like the scalar version.
+    """
+    daily_kwh = np.asarray(watts, dtype=np.float64) * hours_day * qty / 1000.0
+    return np.round(daily_kwh, 3), np.round(daily_kwh * cost_per_kwh, 2)
+
+
+def run_what_if(records, app_names, cost_per_kwh, application=None, hours_delta=0.0):
+    """
+    Reprices a customer's history in one pass. Rows whose application name contains
+    'application' (case-insensitive; all rows when None) run hours_delta hours longer per
+    day, clipped to 0-24. Everything is then priced at cost_per_kwh and compared against
+    the stored daily_kwh/daily_cost.
+    """
+    hours_day = records['hours_day']
+    if hours_delta:
+        if application:
+            needle = application.lower()
+            matching_codes = [code for code, name in enumerate(app_names) if needle in name.lower()]
+            affected = np.isin(records['app_code'], matching_codes)
+        else:
+            affected = np.ones(len(records), dtype=bool)
+        hours_day = np.where(affected, np.clip(hours_day + hours_delta, 0.0, 24.0), hours_day)
+
+    scenario_kwh, scenario_cost = estimate_daily_costs(records['watts'], hours_day, records['qty'], cost_per_kwh)
+
+    # Per-application totals as bincounts over the integer app codes
+    app_count = len(app_names)
+    baseline_by_app = np.bincount(records['app_code'], weights=records['daily_cost'], minlength=app_count)
+    scenario_by_app = np.bincount(records['app_code'], weights=scenario_cost, minlength=app_count)
+
+    baseline_kwh = float(records['daily_kwh'].sum())
+    baseline_cost = float(records['daily_cost'].sum())
+    total_kwh = float(scenario_kwh.sum())
+    total_cost = float(scenario_cost.sum())
+    return {
+        'rows': int(len(records)),
+        'baseline': {'total_kwh': round(baseline_kwh, 3), 'total_cost': round(baseline_cost, 2)},
+        'scenario': {'total_kwh': round(total_kwh, 3), 'total_cost': round(total_cost, 2)},
+        # + 0.0 turns a -0.0 from an unchanged scenario into a plain 0.0
+        'savings': {'kwh': round(baseline_kwh - total_kwh, 3) + 0.0, 'cost': round(baseline_cost - total_cost, 2) + 0.0},
+        'app_breakdown': sorted(
+            (
+                {
+                    'application_name': name,
+                    'baseline_cost': round(float(baseline_by_app[code]), 2),
+                    'scenario_cost': round(float(scenario_by_app[code]), 2),
+                }
+                for code, name in enumerate(app_names)
+            ),
+            key=lambda item: item['scenario_cost'],
+            reverse=True,
+        ),
+    }
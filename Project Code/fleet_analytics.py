@@ -0,0 +1,188 @@
+# This module holds the fleet-wide (all customers) admin analytics.
+# Customers are split into contiguous customer_id ranges; each range is aggregated on its
+# own read-only connection in a process pool and the partial results are merged, so a
+# full-fleet report uses every core. Aggregation reads the usage_rollup buckets, which are
+# kept in step with customer_application in the same transaction as every usage write.
+
+import os
+import atexit
+import sqlite3
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Worker processes in the pool (at most one partition per worker)
+FLEET_MAX_WORKERS = os.cpu_count() or 1
+# Below this many customers per partition the pool costs more than it saves, so small
+# fleets are aggregated in-process
+FLEET_MIN_CUSTOMERS_PER_PARTITION = 500
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    """The shared process pool, started on first use. Workers are spawned, not forked,
+    as the server process runs threads (request workers, repricing jobs)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=FLEET_MAX_WORKERS, mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+@atexit.register
+def shutdown_fleet_pool():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+def _read_only_connection(db_path):
+    return sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+
+def customer_id_ranges(db_path, max_partitions=None):
+    """Splits the customers into up to max_partitions contiguous (first_id, last_id) ranges of equal size."""
+    conn = _read_only_connection(db_path)
+    try:
+        customer_count = conn.execute("SELECT COUNT(*) FROM customer").fetchone()[0]
+        partitions = min(
+            max_partitions or FLEET_MAX_WORKERS,
+            max(1, customer_count // FLEET_MIN_CUSTOMERS_PER_PARTITION)
+        )
+        return conn.execute('''
+            SELECT MIN(customer_id), MAX(customer_id)
+            FROM (SELECT customer_id, NTILE(?) OVER (ORDER BY customer_id) AS partition_no FROM customer)
+            GROUP BY partition_no
+            ORDER BY partition_no
+        ''', (partitions,)).fetchall()
+    finally:
+        conn.close()
+
+def _map_partitions(task, db_path, ranges, *args):
+    """Runs task(db_path, first_id, last_id, *args) for every range and returns the partial results."""
+    if len(ranges) <= 1:
+        return [task(db_path, first_id, last_id, *args) for first_id, last_id in ranges]
+    executor = _get_executor()
+    futures = [executor.submit(task, db_path, first_id, last_id, *args) for first_id, last_id in ranges]
+    return [future.result() for future in futures]
+
+# --- Partition Tasks (run in worker processes) ---
+# Every query drives from the customer range and joins usage_rollup on its primary key
+# prefix (customer_id, period, bucket), so each customer costs one index seek.
+
+def _top_consumers_partition(db_path, first_id, last_id, level, bucket, limit):
+    conn = _read_only_connection(db_path)
+    try:
+        return conn.execute('''
+            SELECT c.customer_id, c.customer_name, c.email_id,
+                   SUM(r.total_kwh), SUM(r.total_cost), SUM(r.entry_count)
+            FROM customer c
+            JOIN usage_rollup r ON r.customer_id = c.customer_id AND r.period = ? AND r.bucket = ?
+            WHERE c.customer_id BETWEEN ? AND ?
+            GROUP BY c.customer_id
+            ORDER BY SUM(r.total_cost) DESC
+            LIMIT ?
+        ''', (level, bucket, first_id, last_id, limit)).fetchall()
+    finally:
+        conn.close()
+
+def _appliance_load_partition(db_path, first_id, last_id, level, bucket):
+    conn = _read_only_connection(db_path)
+    try:
+        return conn.execute('''
+            SELECT r.application_name, SUM(r.total_kwh), SUM(r.total_cost), SUM(r.entry_count),
+                   COUNT(DISTINCT r.customer_id)
+            FROM customer c
+            JOIN usage_rollup r ON r.customer_id = c.customer_id AND r.period = ? AND r.bucket = ?
+            WHERE c.customer_id BETWEEN ? AND ?
+            GROUP BY r.application_name
+        ''', (level, bucket, first_id, last_id)).fetchall()
+    finally:
+        conn.close()
+
+def _monthly_totals_partition(db_path, first_id, last_id, first_month, last_month):
+    conn = _read_only_connection(db_path)
+    try:
+        return conn.execute('''
+            SELECT r.bucket, SUM(r.total_kwh), SUM(r.total_cost), COUNT(DISTINCT r.customer_id)
+            FROM customer c
+            JOIN usage_rollup r ON r.customer_id = c.customer_id AND r.period = 'month'
+                               AND r.bucket >= ? AND r.bucket <= ?
+            WHERE c.customer_id BETWEEN ? AND ?
+            GROUP BY r.bucket
+        ''', (first_month, last_month, first_id, last_id)).fetchall()
+    finally:
+        conn.close()
+
+# --- Fleet Reports ---
+
+def fleet_top_consumers(db_path, level, bucket, limit):
+    """The 'limit' customers with the highest cost in one day/month/year bucket."""
+    ranges = customer_id_ranges(db_path)
+    partials = _map_partitions(_top_consumers_partition, db_path, ranges, level, bucket, limit)
+    # Ranges are disjoint, so the fleet's top N is among the partitions' top N
+    rows = sorted((row for partial in partials for row in partial), key=lambda row: row[4], reverse=True)[:limit]
+    return {
+        'partitions': len(ranges),
+        'consumers': [
+            {
+                'customer_id': customer_id, 'customer_name': customer_name, 'email_id': email_id,
+                'total_kwh': round(total_kwh, 3), 'total_cost': round(total_cost, 2), 'entry_count': entry_count,
+            }
+            for customer_id, customer_name, email_id, total_kwh, total_cost, entry_count in rows
+        ],
+    }
+
+def fleet_appliance_load(db_path, level, bucket):
+    """Consumption per application across every customer in one day/month/year bucket."""
+    ranges = customer_id_ranges(db_path)
+    merged = {}
+    for partial in _map_partitions(_appliance_load_partition, db_path, ranges, level, bucket):
+        for app_name, total_kwh, total_cost, entry_count, customers in partial:
+            totals = merged.setdefault(app_name, [0.0, 0.0, 0, 0])
+            totals[0] += total_kwh
+            totals[1] += total_cost
+            totals[2] += entry_count
+            totals[3] += customers  # Each customer is counted in exactly one partition
+    fleet_cost = sum(totals[1] for totals in merged.values())
+    return {
+        'partitions': len(ranges),
+        'total_cost': round(fleet_cost, 2),
+        'total_kwh': round(sum(totals[0] for totals in merged.values()), 3),
+        'appliances': [
+            {
+                'application_name': app_name, 'total_kwh': round(total_kwh, 3), 'total_cost': round(total_cost, 2),
+                'entry_count': entry_count, 'customers': customers,
+                'cost_share_pct': round(100.0 * total_cost / fleet_cost, 2) if fleet_cost else 0.0,
+            }
+            for app_name, (total_kwh, total_cost, entry_count, customers)
+            in sorted(merged.items(), key=lambda item: item[1][1], reverse=True)
+        ],
+    }
+
+def fleet_monthly_growth(db_path, months):
+    """Fleet totals for each month in 'months' (ascending YYYY-MM), with month-over-month growth."""
+    ranges = customer_id_ranges(db_path)
+    merged = {}
+    for partial in _map_partitions(_monthly_totals_partition, db_path, ranges, months[0], months[-1]):
+        for bucket, total_kwh, total_cost, customers in partial:
+            totals = merged.setdefault(bucket, [0.0, 0.0, 0])
+            totals[0] += total_kwh
+            totals[1] += total_cost
+            totals[2] += customers
+
+    series = []
+    previous_cost = None
+    for month in months:
+        total_kwh, total_cost, customers = merged.get(month, (0.0, 0.0, 0))
+        growth = None
+        if previous_cost:
+            growth = round(100.0 * (total_cost - previous_cost) / previous_cost, 2)
+        series.append({
+            'month': month, 'total_kwh': round(total_kwh, 3), 'total_cost': round(total_cost, 2),
+            'active_customers': customers, 'mom_growth_pct': growth,
+        })
+        previous_cost = total_cost
+    return {'partitions': len(ranges), 'months': series}
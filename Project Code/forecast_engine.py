@@ -0,0 +1,155 @@
+# This module holds the month-end / year-end bill forecasting engine.
+# A customer's daily cost series is read from the 'day' usage_rollup buckets into one
+# customers x days matrix, and every customer is projected at once with NumPy: the
+# month-to-date run rate is blended with the customer's recurring profile (their average
+# daily cost over the weeks before the month) and extended over the days still to come.
+
+from calendar import monthrange
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Days before the current month that make up a customer's recurring daily profile
+FORECAST_PROFILE_DAYS = 90
+
+
+def load_daily_series(conn, as_of, customer_id=None):
+    """
+    Loads the daily cost and kWh of every customer (or just customer_id) from the start of
+    the profile window up to and including as_of, plus their cost and kWh for the months of
+    as_of's year before its month.
+    Returns (customers, cost, kwh, ytd_cost, ytd_kwh): customers is the list of
+    (customer_id, customer_name, email_id) rows, cost and kwh are customers x days
+    matrices, ytd_cost and ytd_kwh per-customer vectors.
+    """
+    month_start = as_of.replace(day=1)
+    window_start = month_start - timedelta(days=FORECAST_PROFILE_DAYS)
+    day_count = (as_of - window_start).days + 1
+    day_index = {
+        (window_start + timedelta(days=offset)).strftime('%Y-%m-%d'): offset for offset in range(day_count)
+    }
+
+    cursor = conn.cursor()
+    cursor.row_factory = None  # Plain tuples stream straight into np.fromiter
+    customer_clause = " WHERE c.customer_id = ?" if customer_id is not None else ""
+    customer_params = (customer_id,) if customer_id is not None else ()
+    cursor.execute(
+        f"SELECT customer_id, customer_name, email_id FROM customer c{customer_clause} ORDER BY customer_id",
+        customer_params
+    )
+    customers = cursor.fetchall()
+    customer_ids = np.fromiter((row[0] for row in customers), dtype=np.int64, count=len(customers))
+
+    # Both queries drive from the customer table and seek usage_rollup's primary key prefix
+    # (customer_id, period, bucket), like the fleet analytics partitions
+    cursor.execute(f'''
+        SELECT c.customer_id, r.bucket, SUM(r.total_cost), SUM(r.total_kwh)
+        FROM customer c
+        JOIN usage_rollup r ON r.customer_id = c.customer_id AND r.period = 'day'
+                           AND r.bucket >= ? AND r.bucket <= ?
+        {customer_clause}
+        GROUP BY c.customer_id, r.bucket
+    ''', (window_start.strftime('%Y-%m-%d'), as_of.strftime('%Y-%m-%d'), *customer_params))
+    # Rollups of dates stored unparsed keep their raw prefix as the bucket; they sort inside
+    # the range without being one of its days, and are skipped
+    daily = np.fromiter(
+        (
+            (cid, day_index[bucket], total_cost, total_kwh)
+            for cid, bucket, total_cost, total_kwh in cursor if bucket in day_index
+        ),
+        dtype=[('customer_id', np.int64), ('day', np.int64), ('cost', np.float64), ('kwh', np.float64)]
+    )
+    cost = np.zeros((len(customers), day_count))
+    kwh = np.zeros((len(customers), day_count))
+    rows = np.searchsorted(customer_ids, daily['customer_id'])
+    # (customer, day) pairs are unique after the GROUP BY, so plain fancy assignment suffices
+    cost[rows, daily['day']] = daily['cost']
+    kwh[rows, daily['day']] = daily['kwh']
+
+    ytd_cost = np.zeros(len(customers))
+    ytd_kwh = np.zeros(len(customers))
+    if as_of.month > 1:
+        cursor.execute(f'''
+            SELECT c.customer_id, SUM(r.total_cost), SUM(r.total_kwh)
+            FROM customer c
+            JOIN usage_rollup r ON r.customer_id = c.customer_id AND r.period = 'month'
+                               AND r.bucket >= ? AND r.bucket < ?
+            {customer_clause}
+            GROUP BY c.customer_id
+        ''', (as_of.strftime('%Y-01'), as_of.strftime('%Y-%m'), *customer_params))
+        months = np.fromiter(
+            cursor, dtype=[('customer_id', np.int64), ('cost', np.float64), ('kwh', np.float64)]
+        )
+        rows = np.searchsorted(customer_ids, months['customer_id'])
+        ytd_cost[rows] = months['cost']
+        ytd_kwh[rows] = months['kwh']
+    return customers, cost, kwh, ytd_cost, ytd_kwh
+
+
+def project_totals(series, ytd_before_month, as_of):
+    """
+    Projects month-end and year-end totals from a customers x days matrix whose last
+    as_of.day columns are the current month and whose earlier columns are the profile window.
+
+    The expected daily amount blends the month-to-date run rate with the profile rate
+    (averaged from each customer's first active profile day), weighting the run rate by the
+    fraction of the month that has elapsed. Customers without profile history use the run
+    rate alone. Returns a dict of per-customer vectors.
+    """
+    elapsed = as_of.day
+    days_in_month = monthrange(as_of.year, as_of.month)[1]
+    days_left_in_year = (datetime(as_of.year, 12, 31) - as_of).days
+
+    profile = series[:, :-elapsed]
+    month = series[:, -elapsed:]
+    month_to_date = month.sum(axis=1)
+    run_rate = month_to_date / elapsed
+
+    active = profile > 0
+    has_profile = active.any(axis=1)
+    # Days from the first active profile day to the month start; argmax finds the first True
+    profile_days = np.where(has_profile, profile.shape[1] - active.argmax(axis=1), 1)
+    profile_rate = profile.sum(axis=1) / profile_days
+
+    run_rate_weight = np.where(has_profile, elapsed / days_in_month, 1.0)
+    expected_daily = run_rate_weight * run_rate + (1.0 - run_rate_weight) * profile_rate
+    return {
+        'month_to_date': month_to_date,
+        'run_rate': run_rate,
+        'profile_rate': profile_rate,
+        'expected_daily': expected_daily,
+        'month_end': month_to_date + (days_in_month - elapsed) * expected_daily,
+        'year_end': ytd_before_month + month_to_date + days_left_in_year * expected_daily,
+    }
+
+
+def forecast_bills(conn, as_of=None, customer_id=None):
+    """
+    Forecasts the month-end and year-end bill of every customer (or just customer_id) as of
+    a date (default today) in one batched pass. Returns a list of per-customer dicts.
+    """
+    as_of = as_of or datetime.now()
+    as_of = datetime(as_of.year, as_of.month, as_of.day)
+    customers, cost, kwh, ytd_cost, ytd_kwh = load_daily_series(conn, as_of, customer_id)
+    cost_projection = project_totals(cost, ytd_cost, as_of)
+    kwh_projection = project_totals(kwh, ytd_kwh, as_of)
+
+    round_list = lambda values, places: np.round(values, places).tolist()
+    columns = zip(
+        round_list(cost_projection['month_to_date'], 2), round_list(cost_projection['month_end'], 2),
+        round_list(cost_projection['year_end'], 2), round_list(cost_projection['expected_daily'], 2),
+        round_list(cost_projection['profile_rate'], 2),
+        round_list(kwh_projection['month_to_date'], 3), round_list(kwh_projection['month_end'], 3),
+        round_list(kwh_projection['year_end'], 3),
+    )
+    return [
+        {
+            'customer_id': customer_id, 'customer_name': customer_name, 'email_id': email_id,
+            'month_to_date_cost': mtd_cost, 'projected_month_cost': month_cost, 'projected_year_cost': year_cost,
+            'expected_daily_cost': daily_cost, 'profile_daily_cost': profile_cost,
+            'month_to_date_kwh': mtd_kwh, 'projected_month_kwh': month_kwh, 'projected_year_kwh': year_kwh,
+        }
+        for (customer_id, customer_name, email_id),
+            (mtd_cost, month_cost, year_cost, daily_cost, profile_cost, mtd_kwh, month_kwh, year_kwh)
+        in zip(customers, columns)
+    ]
@@ -59,4 +59,96 @@ APPLICATIONS_LIST = {
     "Dehumidifier": 300,
     "Inverter/UPS (Idling)": 10,
     "Solar Inverter (Idling)": 5,
-}
\ No newline at end of file
+}
+
+# Typical 24-hour duty-cycle shapes: the relative load of an appliance in each hour of the
+# day, 00:00 to 23:00. The load profile engine normalizes each shape to sum to 1 and
+# spreads an entry's daily kWh over the hours by it.
+LOAD_PROFILE_SHAPES = {
+    # Standby and always-on equipment
+    "constant": [1.0] * 24,
+    # Compressor cycling all day, a little harder in the warm afternoon
+    "refrigeration": [0.8] * 6 + [1.0] * 6 + [1.2] * 6 + [1.1] * 4 + [0.9] * 2,
+    # Heating water for the morning bath, a little again in the evening
+    "water_heating": [0, 0, 0, 0, 0, 2, 5, 6, 4, 1, 0, 0, 0, 0, 0, 0, 0, 0, 1, 2, 1, 0, 0, 0],
+    "lighting": [0.2, 0.1, 0.1, 0.1, 0.2, 0.5, 0.8, 0.5, 0.2, 0.1, 0.1, 0.1,
+                 0.1, 0.1, 0.1, 0.2, 0.4, 1.0, 2.0, 2.5, 2.5, 2.0, 1.2, 0.5],
+    # Hot afternoons and warm nights
+    "cooling": [1.5, 1.2, 1.0, 0.8, 0.6, 0.4, 0.3, 0.3, 0.3, 0.4, 0.6, 0.9,
+                1.2, 1.4, 1.5, 1.5, 1.3, 1.1, 1.0, 1.0, 1.1, 1.3, 1.5, 1.6],
+    # Breakfast, lunch and dinner
+    "cooking": [0, 0, 0, 0, 0, 0.5, 2, 3, 2, 0.5, 0.3, 1,
+                2, 1.5, 0.3, 0.2, 0.5, 1, 2, 3, 2.5, 1, 0.3, 0],
+    # Working hours
+    "daytime": [0, 0, 0, 0, 0, 0, 0.1, 0.3, 0.8, 1, 1, 1,
+                0.8, 1, 1, 1, 1, 0.8, 0.5, 0.3, 0.2, 0.1, 0, 0],
+    "entertainment": [0.3, 0.1, 0, 0, 0, 0, 0.1, 0.3, 0.3, 0.2, 0.2, 0.3,
+                      0.5, 0.5, 0.5, 0.6, 0.8, 1, 1.5, 2, 2.5, 2.5, 2, 1],
+    # Plugged in overnight
+    "overnight_charging": [2, 2, 2, 1.5, 1, 0.5, 0.2, 0, 0, 0, 0, 0,
+                           0, 0, 0, 0, 0, 0, 0.2, 0.3, 0.5, 1, 1.5, 2],
+    # Laundry, ironing, cleaning and garden work
+    "chores": [0, 0, 0, 0, 0, 0, 0.2, 0.8, 1.5, 2, 2, 1.5,
+               1, 0.5, 0.3, 0.5, 1, 1, 0.8, 0.8, 1, 0.5, 0.2, 0],
+    # Getting ready in the morning, winding down at night
+    "personal_care": [0, 0, 0, 0, 0, 0.5, 2, 2.5, 1.5, 0.3, 0, 0,
+                      0, 0, 0, 0, 0, 0.3, 0.8, 1, 1, 1, 0.5, 0],
+}
+
+# Duty-cycle shape of each application; applications not listed use DEFAULT_LOAD_PROFILE
+APPLICATION_LOAD_PROFILES = {
+    "Refrigerator (Standard)": "refrigeration",
+    "LED Light Bulb (10W)": "lighting",
+    "CFL Light Bulb (18W)": "lighting",
+    "Ceiling Fan": "cooling",
+    "Air Conditioner (Window 1 Ton)": "cooling",
+    "Air Conditioner (Split 1.5 Ton)": "cooling",
+    "Washing Machine (Front Load)": "chores",
+    "Electric Water Heater (Geyser)": "water_heating",
+    "Electric Iron": "chores",
+    "Electric Kettle": "cooking",
+    "Water Purifier": "constant",
+    "Vacuum Cleaner (Corded)": "chores",
+    "Hair Dryer": "personal_care",
+    "Microwave Oven": "cooking",
+    "Induction Cooktop": "cooking",
+
+    "Desktop Computer (Tower)": "daytime",
+    "Laptop Computer": "daytime",
+    "50-inch LED TV": "entertainment",
+    "Gaming Console (PS5/Xbox)": "entertainment",
+    "Internet Router/Modem": "constant",
+    "Printer (Laser)": "daytime",
+    "Sound Bar / Home Theatre": "entertainment",
+    "Security Camera System": "constant",
+    "Tablet Charger": "overnight_charging",
+    "Mobile Phone Charger": "overnight_charging",
+    "Smart Speaker (Amazon/Google)": "constant",
+    "Electric Toothbrush Charger": "constant",
+    "Power Bank Charger": "overnight_charging",
+    "Smart Watch Charger": "overnight_charging",
+    "Home Automation Hub": "constant",
+
+    "Blender": "cooking",
+    "Toaster Oven": "cooking",
+    "Coffee Maker": "cooking",
+    "Dishwasher": "chores",
+    "Exhaust Fan": "cooking",
+    "Deep Freezer": "refrigeration",
+    "Food Processor": "cooking",
+    "Electric Grinder": "cooking",
+    "Stand Mixer": "cooking",
+    "Oven Hood/Range Hood": "cooking",
+
+    "Electric Mosquito Swatter Charger": "constant",
+    "Heated Towel Rail": "water_heating",
+    "Treadmill (Motorized)": "personal_care",
+    "Power Drill": "daytime",
+    "Electric Lawn Mower": "chores",
+    "Electric Car Charger (Slow)": "overnight_charging",
+    "Aquarium Pump": "constant",
+    "Dehumidifier": "cooling",
+    "Inverter/UPS (Idling)": "constant",
+    "Solar Inverter (Idling)": "constant",
+}
+DEFAULT_LOAD_PROFILE = "daytime"
\ No newline at end of file
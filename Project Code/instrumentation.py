@@ -0,0 +1,333 @@
+# This module holds the opt-in request and SQL instrumentation behind /api/metrics.
+# install_instrumentation(app) swaps in a cursor that times every statement and counts its
+# rows, hooks the Flask request lifecycle and the JSON provider, and keeps Prometheus-style
+# histograms per route, so a slow request can be split into SQL, JSON encoding and the
+# Python in between (row conversion, aggregation).
+
+import re
+import time
+import logging
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+from app_database import configure_connection_pool
+
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Statements whose execute + fetch time reaches this are logged with their query plan
+SLOW_QUERY_MS = 100
+# Slow queries kept in memory for /api/admin/slow_queries
+SLOW_QUERY_LOG_SIZE = 100
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+logger = logging.getLogger('billbuddy.sql')
+
+_metrics_lock = threading.Lock()
+_request_stats = threading.local()
+_enabled = False
+slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+# --- Metric Types ---
+
+class Histogram:
+    """A Prometheus histogram with fixed upper bounds, one series per label tuple."""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, labels, value):
+        # Callers hold _metrics_lock
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, series in sorted(self.series.items()):
+            label_text = _label_text(self.label_names, labels)
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{label_text}{"," if label_text else ""}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label_text}{"," if label_text else ""}le="+Inf"}} {series[-2]}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {round(series[-1], 6)}')
+            lines.append(f'{self.name}_count{{{label_text}}} {series[-2]}')
+        return lines
+
+class Counter:
+    """A Prometheus counter, one series per label tuple."""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.series = {}
+
+    def inc(self, labels=(), amount=1):
+        # Callers hold _metrics_lock
+        self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self.series.items()):
+            label_text = _label_text(self.label_names, labels)
+            lines.append(f'{self.name}{{{label_text}}} {value}' if label_text else f'{self.name} {value}')
+        return lines
+
+def _label_text(names, values):
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+REQUESTS = Counter('billbuddy_http_requests_total', 'HTTP requests handled.', ('route', 'method', 'status'))
+REQUEST_SECONDS = Histogram('billbuddy_http_request_duration_seconds', 'Time from request start to response.',
+                            ('route', 'method'), SECONDS_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram('billbuddy_request_sql_seconds', 'Time spent executing and fetching SQL per request.',
+                                ('route',), SECONDS_BUCKETS)
+REQUEST_JSON_SECONDS = Histogram('billbuddy_request_json_seconds', 'Time spent encoding JSON per request.',
+                                 ('route',), SECONDS_BUCKETS)
+REQUEST_OTHER_SECONDS = Histogram('billbuddy_request_other_seconds',
+                                  'Request time outside SQL and JSON encoding (row conversion, aggregation, Flask).',
+                                  ('route',), SECONDS_BUCKETS)
+REQUEST_STATEMENTS = Histogram('billbuddy_request_sql_statements', 'SQL statements executed per request.',
+                               ('route',), STATEMENT_BUCKETS)
+REQUEST_ROWS = Histogram('billbuddy_request_sql_rows', 'Rows fetched from SQLite per request.', ('route',), ROW_BUCKETS)
+SQL_STATEMENTS = Counter('billbuddy_sql_statements_total', 'SQL statements executed, including background jobs and streams.')
+SQL_SECONDS = Counter('billbuddy_sql_seconds_total', 'Seconds spent executing and fetching SQL.')
+SQL_ROWS = Counter('billbuddy_sql_rows_total', 'Rows fetched from SQLite.')
+SLOW_QUERIES = Counter('billbuddy_sql_slow_queries_total', 'Statements slower than the slow-query threshold.')
+
+METRICS = (
+    REQUESTS, REQUEST_SECONDS, REQUEST_SQL_SECONDS, REQUEST_JSON_SECONDS, REQUEST_OTHER_SECONDS,
+    REQUEST_STATEMENTS, REQUEST_ROWS, SQL_STATEMENTS, SQL_SECONDS, SQL_ROWS, SLOW_QUERIES,
+)
+
+# --- SQL Instrumentation ---
+
+def _add_sql_time(elapsed, statements=0, rows=0):
+    """Charges SQL work to the process totals and to the current request, if any."""
+    stats = getattr(_request_stats, 'current', None)
+    if stats is not None:
+        stats['sql_seconds'] += elapsed
+        stats['statements'] += statements
+        stats['rows'] += rows
+    with _metrics_lock:
+        SQL_SECONDS.inc(amount=elapsed)
+        if statements:
+            SQL_STATEMENTS.inc(amount=statements)
+        if rows:
+            SQL_ROWS.inc(amount=rows)
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    A cursor that times execute and every fetch. A statement's total time is checked
+    against the slow-query threshold once it is finished: when its rows are exhausted,
+    on fetchall, or when the cursor runs its next statement or is closed.
+    """
+
+    _statement = None
+
+    def _begin(self, sql, parameters, elapsed, planable=True):
+        self._finish()
+        self._statement = [sql, parameters if planable else None, elapsed, 0]
+        _add_sql_time(elapsed, statements=1)
+
+    def _fetched(self, elapsed, rows):
+        if self._statement is not None:
+            self._statement[2] += elapsed
+            self._statement[3] += rows
+        _add_sql_time(elapsed, rows=rows)
+
+    def _finish(self):
+        statement = self._statement
+        if statement is None:
+            return
+        self._statement = None
+        sql, parameters, elapsed, rows = statement
+        if elapsed * 1000.0 >= SLOW_QUERY_MS:
+            record_slow_query(self.connection, sql, parameters, elapsed, rows)
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._begin(sql, parameters, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._begin(sql, None, time.perf_counter() - started, planable=False)
+
+    def executescript(self, sql_script):
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            self._begin(sql_script, None, time.perf_counter() - started, planable=False)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(time.perf_counter() - started, 0 if row is None else 1)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(time.perf_counter() - started, len(rows))
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(time.perf_counter() - started, len(rows))
+        self._finish()
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(time.perf_counter() - started, 0)
+            self._finish()
+            raise
+        self._fetched(time.perf_counter() - started, 1)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+class InstrumentedConnection(sqlite3.Connection):
+    """A connection whose cursors (including those behind conn.execute) are instrumented."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+def record_slow_query(conn, sql, parameters, elapsed, rows):
+    """Logs a slow statement together with its EXPLAIN QUERY PLAN."""
+    plan = None
+    if parameters is not None:
+        try:
+            # A plain cursor, so explaining the statement is not itself instrumented
+            plan_cursor = sqlite3.Cursor(conn)
+            plan_cursor.row_factory = None
+            plan_cursor.execute('EXPLAIN QUERY PLAN ' + sql, parameters)
+            plan = [detail for _, _, _, detail in plan_cursor.fetchall()]
+        except sqlite3.Error:
+            plan = None
+    stats = getattr(_request_stats, 'current', None)
+    entry = {
+        'at': datetime.now().isoformat(timespec='seconds'),
+        'route': stats['route'] if stats else None,
+        'duration_ms': round(elapsed * 1000.0, 3),
+        'rows': rows,
+        'sql': re.sub(r'\s+', ' ', sql).strip(),
+        'plan': plan,
+    }
+    with _metrics_lock:
+        SLOW_QUERIES.inc()
+        slow_queries.append(entry)
+    logger.warning('Slow query (%.1f ms, %d rows): %s | plan: %s',
+                   entry['duration_ms'], rows, entry['sql'], '; '.join(plan) if plan else 'n/a')
+
+# --- Request Instrumentation ---
+
+def add_json_seconds(seconds):
+    """Charges JSON encoding time to the current request (a no-op when not instrumented)."""
+    stats = getattr(_request_stats, 'current', None)
+    if stats is not None:
+        stats['json_seconds'] += seconds
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, charging encoding time to the current request."""
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            add_json_seconds(time.perf_counter() - started)
+
+def _start_request():
+    _request_stats.current = {
+        'started': time.perf_counter(), 'route': None,
+        'sql_seconds': 0.0, 'json_seconds': 0.0, 'statements': 0, 'rows': 0,
+    }
+
+def _finish_request(response):
+    stats = getattr(_request_stats, 'current', None)
+    if stats is None:
+        return response
+    duration = time.perf_counter() - stats['started']
+    # Label by route template, not the concrete path, to keep the series count bounded
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    with _metrics_lock:
+        REQUESTS.inc((route, request.method, str(response.status_code)))
+        REQUEST_SECONDS.observe((route, request.method), duration)
+        REQUEST_SQL_SECONDS.observe((route,), stats['sql_seconds'])
+        REQUEST_JSON_SECONDS.observe((route,), stats['json_seconds'])
+        REQUEST_OTHER_SECONDS.observe((route,), max(0.0, duration - stats['sql_seconds'] - stats['json_seconds']))
+        REQUEST_STATEMENTS.observe((route,), stats['statements'])
+        REQUEST_ROWS.observe((route,), stats['rows'])
+    return response
+
+def _clear_request(exc=None):
+    _request_stats.current = None
+
+def _label_request():
+    stats = getattr(_request_stats, 'current', None)
+    if stats is not None and request.url_rule:
+        stats['route'] = request.url_rule.rule
+
+def install_instrumentation(app, slow_query_ms=None):
+    """
+    Turns instrumentation on for 'app'. Call before the first request: connections opened
+    earlier (e.g. already pooled by a worker thread) are not instrumented.
+    """
+    global _enabled, SLOW_QUERY_MS
+    if _enabled:
+        return
+    if slow_query_ms is not None:
+        SLOW_QUERY_MS = slow_query_ms
+    configure_connection_pool(connection_factory=InstrumentedConnection)
+    app.json = TimedJSONProvider(app)
+    app.before_request_funcs.setdefault(None, []).insert(0, _start_request)
+    app.before_request(_label_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_clear_request)
+    _enabled = True
+
+def instrumentation_enabled():
+    return _enabled
+
+def render_metrics(extra_lines=()):
+    """Renders every metric in the Prometheus text exposition format."""
+    lines = []
+    if _enabled:
+        with _metrics_lock:
+            for metric in METRICS:
+                lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return '\n'.join(lines) + '\n'
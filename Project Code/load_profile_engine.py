@@ -0,0 +1,240 @@
+# This module holds the hourly load-curve and peak-demand engine.
+# Every appliance has a 24-hour duty-cycle shape (initial_data.LOAD_PROFILE_SHAPES): a fridge
+# cycles all day, a geyser runs in the morning. A usage entry's hours/day of running time are
+# laid out along its shape as the fraction of each hour the appliance is on (never more than
+# the whole hour), so its load in an hour is that duty fraction x watts x qty, and never
+# exceeds its connected load. Entries are read from customer_application and the usage
+# archive; every customer is simulated at once, one batch of NumPy products per day of the
+# period, giving each customer's average-day curve and their peak kW, and the fleet's
+# coincident peak.
+
+import calendar
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from initial_data import APPLICATION_LOAD_PROFILES, DEFAULT_LOAD_PROFILE, LOAD_PROFILE_SHAPES
+from usage_archive import load_customer_archive
+
+HOURS_PER_DAY = 24
+# Bisection steps when fitting the duty fractions to the hours of use (far below float precision after this)
+DUTY_FIT_ITERATIONS = 60
+
+LOAD_ENTRY_DTYPE = np.dtype([
+    ('customer', np.int64), ('day', np.int64), ('app', np.int64), ('hours_day', np.float64), ('kw', np.float64),
+])
+
+
+def profile_matrix(app_names):
+    """The appliances x 24 matrix of duty-cycle shapes, each row normalized to sum to 1."""
+    profiles = np.array(
+        [LOAD_PROFILE_SHAPES[APPLICATION_LOAD_PROFILES.get(name, DEFAULT_LOAD_PROFILE)] for name in app_names],
+        dtype=np.float64
+    ).reshape(len(app_names), HOURS_PER_DAY)
+    return profiles / profiles.sum(axis=1, keepdims=True)
+
+
+def duty_fractions(profiles, hours_day):
+    """
+    The fraction of each hour an appliance is on (rows x 24, each in [0, 1]) for pairs of a
+    normalized shape and hours of use per day. The hours are poured into the shape: every
+    hour gets lambda x its weight, capped at the full hour, with lambda chosen so the
+    fractions add up to the hours of use. Hours beyond what the shape's nonzero hours can
+    hold are spread evenly over the rest of the day.
+    """
+    hours = np.clip(np.asarray(hours_day, dtype=np.float64), 0.0, float(HOURS_PER_DAY))[:, None]
+    in_shape = profiles > 0
+    shape_hours = in_shape.sum(axis=1, keepdims=True)
+    target = np.minimum(hours, shape_hours)
+
+    # At high every hour of the shape is full; sum(min(1, lambda x weight)) rises with lambda
+    low = np.zeros_like(hours)
+    high = 1.0 / np.where(in_shape, profiles, np.inf).min(axis=1, keepdims=True)
+    for _ in range(DUTY_FIT_ITERATIONS):
+        middle = (low + high) / 2.0
+        short = np.minimum(1.0, middle * profiles).sum(axis=1, keepdims=True) < target
+        low = np.where(short, middle, low)
+        high = np.where(short, high, middle)
+    fractions = np.minimum(1.0, high * profiles)
+
+    overflow = (hours - target) / np.maximum(HOURS_PER_DAY - shape_hours, 1)
+    return fractions + np.where(in_shape, 0.0, overflow)
+
+
+def period_days(level, bucket, as_of):
+    """
+    The calendar days of a day, month or year bucket, as (first, last) YYYY-MM-DD strings.
+    A period containing as_of ends on it, so days still to come do not dilute the averages.
+    """
+    if level == 'day':
+        return bucket, bucket
+    if level == 'month':
+        first = datetime.strptime(bucket, '%Y-%m')
+        last = first.replace(day=calendar.monthrange(first.year, first.month)[1])
+    else:
+        first = datetime.strptime(bucket, '%Y')
+        last = first.replace(month=12, day=31)
+    if first <= as_of <= last:
+        last = as_of
+    return first.strftime('%Y-%m-%d'), last.strftime('%Y-%m-%d')
+
+
+def load_usage_entries(conn, first_day, last_day, customer_id=None):
+    """
+    Loads the usage entries of every customer (or just customer_id) between two days,
+    inclusive, live and archived alike. Returns (customers, entries, app_names): customers
+    is the list of (customer_id, customer_name, email_id) rows, entries a LOAD_ENTRY_DTYPE
+    array (customer row, day offset, app code, hours/day and connected kW = watts x qty),
+    and app_names the names the app codes index into.
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = None  # Plain tuples stream straight into np.fromiter
+    customer_clause = " WHERE c.customer_id = ?" if customer_id is not None else ""
+    customer_params = (customer_id,) if customer_id is not None else ()
+    cursor.execute(
+        f"SELECT customer_id, customer_name, email_id FROM customer c{customer_clause} ORDER BY customer_id",
+        customer_params
+    )
+    customers = cursor.fetchall()
+    customer_rows = {row[0]: index for index, row in enumerate(customers)}
+
+    start = date.fromisoformat(first_day)
+    day_count = (date.fromisoformat(last_day) - start).days + 1
+    day_index = {(start + timedelta(days=offset)).isoformat(): offset for offset in range(day_count)}
+    app_codes = {}
+    # Drives from the customer table and seeks the (customer_id, day_bucket) index; rows
+    # whose date_time could not be parsed have no day_bucket and are left out
+    cursor.execute(f'''
+        SELECT c.customer_id, u.day_bucket, u.application_name, u.hours_day, u.watts * u.qty
+        FROM customer c
+        JOIN customer_application u ON u.customer_id = c.customer_id
+                                   AND u.day_bucket >= ? AND u.day_bucket <= ?
+        {customer_clause}
+    ''', (first_day, last_day, *customer_params))
+    live = np.fromiter(
+        (
+            (customer_rows[cid], day_index[day], app_codes.setdefault(app_name, len(app_codes)),
+             hours_day or 0.0, (watts_qty or 0.0) / 1000.0)
+            for cid, day, app_name, hours_day, watts_qty in cursor if day in day_index
+        ),
+        dtype=LOAD_ENTRY_DTYPE
+    )
+
+    parts = [live]
+    cursor.execute(
+        f"SELECT DISTINCT c.customer_id FROM customer c JOIN usage_archive_segment s ON s.customer_id = c.customer_id"
+        f"{customer_clause}", customer_params
+    )
+    for (archived_customer_id,) in cursor.fetchall():
+        archive = load_customer_archive(conn.cursor(), archived_customer_id)
+        if archive is None:
+            continue
+        columns, archived_app_names = archive
+        days = np.asarray(columns['date_ordinal'], dtype=np.int64) - start.toordinal()
+        selected = (days >= 0) & (days < day_count)
+        if not selected.any():
+            continue
+        remap = np.array([app_codes.setdefault(name, len(app_codes)) for name in archived_app_names], dtype=np.int64)
+        archived = np.empty(int(selected.sum()), dtype=LOAD_ENTRY_DTYPE)
+        archived['customer'] = customer_rows[archived_customer_id]
+        archived['day'] = days[selected]
+        archived['app'] = remap[columns['app_code'][selected]]
+        archived['hours_day'] = columns['hours_day'][selected]
+        archived['kw'] = columns['watts'][selected] * columns['qty'][selected] / 1000.0
+        parts.append(archived)
+    return customers, np.concatenate(parts), list(app_codes)
+
+
+def simulate_load_curves(customer_count, day_count, entries, profiles):
+    """
+    Simulates the hourly load of every customer on every day. Returns (average, peak_kw,
+    peak_day, peak_hour, fleet_curves): the customers x 24 average-day curve in kW, each
+    customer's highest hourly load with the day offset and hour it occurs at, and the
+    days x 24 fleet total (whose maximum is the coincident peak).
+    """
+    total = np.zeros((customer_count, HOURS_PER_DAY))
+    peak_kw = np.zeros(customer_count)
+    peak_day = np.zeros(customer_count, dtype=np.int64)
+    peak_hour = np.zeros(customer_count, dtype=np.int64)
+    fleet_curves = np.zeros((day_count, HOURS_PER_DAY))
+    if not len(entries):
+        return total, peak_kw, peak_day, peak_hour, fleet_curves
+
+    # Duty fractions depend only on the (appliance, hours/day) pair, so each distinct pair is fitted once
+    pairs, pair_index = np.unique(
+        np.column_stack([entries['app'], entries['hours_day']]), axis=0, return_inverse=True
+    )
+    pair_index = pair_index.reshape(-1)
+    fractions = duty_fractions(profiles[pairs[:, 0].astype(np.int64)], pairs[:, 1])
+
+    order = np.lexsort((entries['customer'], entries['day']))
+    entries = entries[order]
+    pair_index = pair_index[order]
+    day_starts = np.searchsorted(entries['day'], np.arange(day_count + 1))
+    for day in range(day_count):
+        day_slice = slice(day_starts[day], day_starts[day + 1])
+        day_customers = entries['customer'][day_slice]
+        if not len(day_customers):
+            continue
+        # Each entry's load in every hour (kW), summed per customer over their sorted runs
+        loads = entries['kw'][day_slice, None] * fractions[pair_index[day_slice]]
+        run_starts = np.flatnonzero(np.r_[True, day_customers[1:] != day_customers[:-1]])
+        curves = np.zeros((customer_count, HOURS_PER_DAY))
+        curves[day_customers[run_starts]] = np.add.reduceat(loads, run_starts, axis=0)
+        total += curves
+        fleet_curves[day] = curves.sum(axis=0)
+
+        day_peak_hour = curves.argmax(axis=1)
+        day_peak = curves[np.arange(customer_count), day_peak_hour]
+        higher = day_peak > peak_kw
+        peak_kw[higher] = day_peak[higher]
+        peak_day[higher] = day
+        peak_hour[higher] = day_peak_hour[higher]
+    return total / max(day_count, 1), peak_kw, peak_day, peak_hour, fleet_curves
+
+
+def customer_load_curves(conn, level, bucket, customer_id=None, as_of=None):
+    """
+    Hourly load curves and peak demand of every customer (or just customer_id) over a day,
+    month or year bucket, in one batched pass. Returns (first_day, last_day, customers,
+    fleet): a per-customer dict list and the fleet's coincident peak.
+    """
+    as_of = as_of or datetime.now()
+    as_of = datetime(as_of.year, as_of.month, as_of.day)
+    first_day, last_day = period_days(level, bucket, as_of)
+    start = datetime.strptime(first_day, '%Y-%m-%d')
+    day_count = (datetime.strptime(last_day, '%Y-%m-%d') - start).days + 1
+
+    customers, entries, app_names = load_usage_entries(conn, first_day, last_day, customer_id)
+    average, peak_kw, peak_day, peak_hour, fleet_curves = simulate_load_curves(
+        len(customers), day_count, entries, profile_matrix(app_names)
+    )
+    day_label = lambda offset: (start + timedelta(days=int(offset))).strftime('%Y-%m-%d')
+
+    average_kw = average.mean(axis=1)
+    hourly_kw = np.round(average, 3).tolist()
+    results = []
+    for index, (cid, customer_name, email_id) in enumerate(customers):
+        has_load = peak_kw[index] > 0
+        results.append({
+            'customer_id': cid, 'customer_name': customer_name, 'email_id': email_id,
+            'hourly_kw': hourly_kw[index],
+            'average_kw': round(float(average_kw[index]), 3),
+            'peak_kw': round(float(peak_kw[index]), 3),
+            'peak_date': day_label(peak_day[index]) if has_load else None,
+            'peak_hour': int(peak_hour[index]) if has_load else None,
+            # Average over peak load: 1.0 is a perfectly flat curve
+            'load_factor': round(float(average_kw[index] / peak_kw[index]), 3) if has_load else None,
+        })
+
+    fleet_day, fleet_hour = np.unravel_index(fleet_curves.argmax(), fleet_curves.shape)
+    coincident_peak = float(fleet_curves[fleet_day, fleet_hour])
+    fleet = {
+        'hourly_kw': np.round(fleet_curves.mean(axis=0), 3).tolist(),
+        'coincident_peak_kw': round(coincident_peak, 3),
+        'peak_date': day_label(fleet_day) if coincident_peak > 0 else None,
+        'peak_hour': int(fleet_hour) if coincident_peak > 0 else None,
+        # Sum of the customers' own peaks over the fleet peak: how far their peaks are staggered
+        'diversity_factor': round(float(peak_kw.sum()) / coincident_peak, 3) if coincident_peak > 0 else None,
+    }
+    return first_day, last_day, results, fleet
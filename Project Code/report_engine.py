@@ -0,0 +1,223 @@
+# This module renders the downloadable usage reports (CSV and PDF) on the server.
+# Both renderers consume an iterator of usage records and yield the file in chunks, so a
+# report is never held in memory; finished files are cached on disk by content key.
+
+import os
+import io
+import csv
+import glob
+import zlib
+import shutil
+import hashlib
+import tempfile
+
+# Directory holding rendered reports, one sub-directory per customer
+REPORT_CACHE_DIR = 'report_cache'
+# Bump when the report layout changes, so files rendered by older code are not reused
+REPORT_LAYOUT_VERSION = 1
+REPORT_FORMATS = {'csv': 'text/csv', 'pdf': 'application/pdf'}
+
+REPORT_COLUMNS = ('date_time', 'application_name', 'qty', 'watts', 'hours_day', 'daily_kwh', 'daily_cost')
+# CSV rows buffered per yielded chunk
+CSV_ROWS_PER_CHUNK = 500
+
+# --- Disk Cache ---
+
+def report_cache_key(customer_id, data_version, report_format):
+    """Content key of a report: everything its bytes depend on, hashed."""
+    source = f'{customer_id}:{data_version}:{report_format}:{REPORT_LAYOUT_VERSION}'
+    return hashlib.sha256(source.encode()).hexdigest()
+
+def cached_report_path(customer_id, cache_key, report_format):
+    """Absolute path a report with this key is (or will be) stored at."""
+    return os.path.abspath(os.path.join(REPORT_CACHE_DIR, str(customer_id), f'{cache_key}.{report_format}'))
+
+def cache_report_chunks(chunks, path):
+    """
+    Passes the rendered chunks through to the caller while writing them to a temporary
+    file next to path. Only a fully rendered report is moved into place, after which
+    older reports of the same format for the customer are removed.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            for chunk in chunks:
+                temp_file.write(chunk)
+                yield chunk
+        os.replace(temp_path, path)
+    except FileNotFoundError:
+        # The customer's reports were purged (the customer deleted) while this one rendered;
+        # the download itself is complete, it is just not cached
+        return
+    except BaseException:
+        # Includes GeneratorExit when the client disconnects mid-download
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    extension = os.path.splitext(path)[1]
+    for stale_path in glob.glob(os.path.join(directory, f'*{extension}')):
+        if stale_path != path:
+            try:
+                os.remove(stale_path)
+            except OSError:
+                pass
+
+def purge_customer_reports(customer_id):
+    """Removes every cached report of a customer."""
+    shutil.rmtree(os.path.join(REPORT_CACHE_DIR, str(customer_id)), ignore_errors=True)
+
+# --- CSV Rendering ---
+
+def render_report_csv(records):
+    """Yields a CSV of the usage records (REPORT_COLUMNS order) as UTF-8 chunks."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(REPORT_COLUMNS)
+    rows_in_buffer = 0
+    for record in records:
+        writer.writerow([record[column] for column in REPORT_COLUMNS])
+        rows_in_buffer += 1
+        if rows_in_buffer >= CSV_ROWS_PER_CHUNK:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            rows_in_buffer = 0
+    yield buffer.getvalue().encode('utf-8')
+
+# --- PDF Rendering ---
+# A minimal PDF 1.4 writer using the built-in Helvetica fonts (no embedding). Objects are
+# written as soon as a page is full and their byte offsets are collected for the xref
+# table, so only one page is ever held in memory.
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+PAGE_MARGIN = 40
+ROW_HEIGHT = 12
+# (heading, x position, max characters) of each usage table column
+PDF_TABLE_COLUMNS = (
+    ('Date/Time', 40, 16),
+    ('Application', 118, 38),
+    ('QTY', 300, 4),
+    ('Watts', 330, 8),
+    ('Hrs/Day', 380, 8),
+    ('Daily kWh', 430, 12),
+    ('Daily Cost', 495, 14),
+)
+
+# Fixed objects: 1 catalog, 2 page tree (written last, once every page is known), 3-4 fonts
+_CATALOG_ID, _PAGES_ID, _FONT_ID, _BOLD_FONT_ID = 1, 2, 3, 4
+
+def _pdf_text(value):
+    """Escapes a value for a PDF string literal in the fonts' WinAnsi encoding."""
+    text = str(value)
+    if not text.isascii():
+        text = text.encode('cp1252', errors='replace').decode('latin-1')
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def _format_rupees(amount):
+    # The standard fonts have no rupee sign
+    return f'Rs. {amount or 0.0:,.2f}'
+
+class _PdfStream:
+    """Serializes PDF objects while tracking their byte offsets."""
+
+    def __init__(self):
+        self.position = 0
+        self.offsets = {}
+        self.next_id = _BOLD_FONT_ID + 1
+        self.page_ids = []
+
+    def raw(self, data):
+        self.position += len(data)
+        return data
+
+    def obj(self, obj_id, body):
+        self.offsets[obj_id] = self.position
+        return self.raw(f'{obj_id} 0 obj\n'.encode() + body + b'\nendobj\n')
+
+    def page(self, operators):
+        """Returns the bytes of one page (content stream + page object)."""
+        content = zlib.compress('\n'.join(operators).encode('latin-1'))
+        content_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self.page_ids.append(page_id)
+        return (
+            self.obj(content_id, f'<< /Length {len(content)} /Filter /FlateDecode >>\nstream\n'.encode()
+                     + content + b'\nendstream')
+            + self.obj(page_id, (
+                f'<< /Type /Page /Parent {_PAGES_ID} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+                f'/Resources << /Font << /F1 {_FONT_ID} 0 R /F2 {_BOLD_FONT_ID} 0 R >> >> '
+                f'/Contents {content_id} 0 R >>'
+            ).encode())
+        )
+
+    def trailer(self):
+        """Returns the page tree, cross-reference table and trailer."""
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self.page_ids)
+        data = self.obj(_PAGES_ID, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>'.encode())
+        xref_offset = self.position
+        lines = [f'xref\n0 {self.next_id}\n', '0000000000 65535 f \n']
+        lines.extend(f'{self.offsets[obj_id]:010d} 00000 n \n' for obj_id in range(1, self.next_id))
+        lines.append(f'trailer\n<< /Size {self.next_id} /Root {_CATALOG_ID} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n')
+        return data + self.raw(''.join(lines).encode())
+
+def _text_op(x, y, text, size=8, bold=False):
+    return f'BT /{"F2" if bold else "F1"} {size} Tf {x} {y} Td ({_pdf_text(text)}) Tj ET'
+
+def _table_header_ops(y):
+    ops = ['0.12 0.16 0.22 rg', f'{PAGE_MARGIN - 4} {y - 4} {PAGE_WIDTH - 2 * PAGE_MARGIN + 8} {ROW_HEIGHT + 2} re f', '1 g']
+    ops.extend(_text_op(x, y, heading, bold=True) for heading, x, _ in PDF_TABLE_COLUMNS)
+    ops.append('0 g')
+    return ops
+
+def render_report_pdf(customer_info, totals, records):
+    """
+    Yields the customer's usage report as PDF chunks, one page at a time: a header with
+    the customer's details and all-time totals, then the usage table (same columns as
+    the former in-browser report).
+    """
+    pdf = _PdfStream()
+    yield pdf.raw(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    yield pdf.obj(_CATALOG_ID, f'<< /Type /Catalog /Pages {_PAGES_ID} 0 R >>'.encode())
+    yield pdf.obj(_FONT_ID, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+    yield pdf.obj(_BOLD_FONT_ID, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>')
+
+    y = PAGE_HEIGHT - PAGE_MARGIN - 10
+    ops = [
+        '0.06 0.73 0.51 rg', _text_op(PAGE_WIDTH / 2 - 190, y, 'Energy Consumption Report - BillBuddy', 20, True), '0 g',
+        _text_op(PAGE_MARGIN, y - 28, f"Customer: {customer_info['customer_name']}", 14),
+        _text_op(PAGE_MARGIN, y - 44, f"Email: {customer_info['email_id']} | Phone: {customer_info['phone_no'] or 'N/A'}", 10),
+        _text_op(PAGE_MARGIN, y - 70, 'Consumption Summary', 14, True),
+        f'{PAGE_MARGIN} {y - 74} m {PAGE_WIDTH - PAGE_MARGIN} {y - 74} l S',
+        _text_op(PAGE_MARGIN, y - 90, f"Total Energy Consumed (All Time): {totals['total_kwh'] or 0.0:.3f} kWh", 11),
+        _text_op(PAGE_MARGIN + 270, y - 90, f"Total Estimated Cost (All Time): {_format_rupees(totals['total_cost'])}", 11),
+        _text_op(PAGE_MARGIN, y - 116, 'Detailed Application Usage Log', 14, True),
+    ]
+    y -= 136
+    ops.extend(_table_header_ops(y))
+
+    row_index = 0
+    for record in records:
+        y -= ROW_HEIGHT
+        if y < PAGE_MARGIN + ROW_HEIGHT:
+            ops.append(_text_op(PAGE_WIDTH - PAGE_MARGIN - 40, PAGE_MARGIN - 16, f'Page {len(pdf.page_ids) + 1}'))
+            yield pdf.page(ops)
+            y = PAGE_HEIGHT - PAGE_MARGIN - 10
+            ops = _table_header_ops(y)
+            y -= ROW_HEIGHT
+        if row_index % 2:
+            ops.append(f'0.95 g {PAGE_MARGIN - 4} {y - 3} {PAGE_WIDTH - 2 * PAGE_MARGIN + 8} {ROW_HEIGHT} re f 0 g')
+        values = (
+            record['date_time'], record['application_name'], record['qty'], f"{record['watts']} W",
+            f"{record['hours_day']} h", f"{record['daily_kwh'] or 0.0:.3f} kWh", _format_rupees(record['daily_cost']),
+        )
+        ops.extend(_text_op(x, y, str(value)[:max_chars]) for (_, x, max_chars), value in zip(PDF_TABLE_COLUMNS, values))
+        row_index += 1
+
+    ops.append(_text_op(PAGE_WIDTH - PAGE_MARGIN - 40, PAGE_MARGIN - 16, f'Page {len(pdf.page_ids) + 1}'))
+    yield pdf.page(ops)
+    yield pdf.trailer()
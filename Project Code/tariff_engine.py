@@ -0,0 +1,311 @@
+# This module holds the tariff engine: flat, slab (tiered) and time-of-use pricing, plus the
+# background job that reprices stored usage rows when a different tariff is activated.
+# Tariffs are compiled once into lookup tables so pricing a single record costs O(1).
+# Slab bands are kWh/day thresholds, so a slab tariff prices a customer's total kWh for the
+# day marginally across its bands, and each entry of that day pays its pro-rata share.
+
+import math
+import threading
+import time
+from bisect import bisect_right
+
+from app_database import get_db_connection, update_usage_rollups_bulk
+from change_feed import publish_resync
+
+TARIFF_TYPES = ('flat', 'slab', 'tou')
+
+# Repricing runs in small transactions with a pause between them, so the write lock is
+# only ever held for one chunk and live writes interleave with the job
+REPRICE_CHUNK_SIZE = 1000
+REPRICE_PAUSE_SECONDS = 0.05
+
+# Compiled lookups by tariff_id. Bands never change after a tariff is created, so
+# entries never go stale.
+_compiled_tariffs = {}
+_compiled_tariffs_lock = threading.Lock()
+
+
+def validate_tariff_bands(tariff_type, bands):
+    """
+    Checks and normalizes a tariff definition. bands is a list of (band_start, rate_per_kwh)
+    pairs; returns them sorted by band_start or raises ValueError.
+    """
+    if tariff_type not in TARIFF_TYPES:
+        raise ValueError(f"Tariff type must be one of: {', '.join(TARIFF_TYPES)}.")
+    try:
+        bands = sorted((float(start), float(rate)) for start, rate in bands)
+    except (TypeError, ValueError):
+        raise ValueError('Each band needs a numeric band_start and rate_per_kwh.')
+    if not bands:
+        raise ValueError('A tariff needs at least one band.')
+    # float() also parses 'nan' and 'inf'; NaN is stored as NULL and an infinite rate prices usage at inf
+    if not all(math.isfinite(start) and math.isfinite(rate) for start, rate in bands):
+        raise ValueError('Band starts and rates must be finite numbers.')
+    if any(rate < 0 for _, rate in bands):
+        raise ValueError('Rates cannot be negative.')
+    if len({start for start, _ in bands}) != len(bands):
+        raise ValueError('Band starts must be unique.')
+    if bands[0][0] != 0:
+        raise ValueError('The first band must start at 0.')
+    if tariff_type == 'flat' and len(bands) != 1:
+        raise ValueError('A flat tariff has exactly one band.')
+    if tariff_type == 'tou' and bands[-1][0] >= 24:
+        raise ValueError('Time-of-use bands start at an hour between 0 and 23.')
+    return bands
+
+
+def compile_tariff(tariff_id, tariff_type, bands):
+    """
+    Precomputes a tariff's lookup tables:
+    - slab: band starts, rates and the cumulative cost at each band start
+    - tou: the running integral of the hourly rate over 48 hours, so the price of any
+      run of up to 24 hours is one subtraction
+    """
+    compiled = {'tariff_id': tariff_id, 'tariff_type': tariff_type}
+    if tariff_type == 'flat':
+        compiled['rate'] = bands[0][1]
+    elif tariff_type == 'slab':
+        starts = [start for start, _ in bands]
+        rates = [rate for _, rate in bands]
+        cumulative = [0.0]
+        for i in range(1, len(bands)):
+            cumulative.append(cumulative[-1] + (starts[i] - starts[i - 1]) * rates[i - 1])
+        compiled.update(starts=starts, rates=rates, cumulative=cumulative)
+    else:
+        # Hourly rate table: each band applies from its start hour until the next band
+        hourly = []
+        for hour in range(24):
+            hourly.append(bands[bisect_right([start for start, _ in bands], hour) - 1][1])
+        integral = [0.0]
+        for hour in range(48):
+            integral.append(integral[-1] + hourly[hour % 24])
+        compiled.update(hourly=hourly, integral=integral)
+    return compiled
+
+
+def _tou_integral(compiled, t):
+    """Integral of the hourly rate from hour 0 to hour t (0 <= t <= 48)."""
+    whole = min(int(t), 47)
+    return compiled['integral'][whole] + (t - whole) * compiled['hourly'][whole % 24]
+
+
+def slab_cost(compiled, kwh):
+    """The unrounded cost of kwh priced marginally across a compiled slab tariff's bands."""
+    i = bisect_right(compiled['starts'], kwh) - 1
+    return compiled['cumulative'][i] + (kwh - compiled['starts'][i]) * compiled['rates'][i]
+
+
+def allocate_slab_cost(compiled, daily_kwh):
+    """
+    Prices a customer's entries of one day under a slab tariff: the bands apply to their
+    total kWh, and the cost is shared out in proportion to each entry's kWh. The rounding
+    remainder goes to the largest entry, so the shares add up to the day's rounded cost.
+    """
+    total_kwh = sum(daily_kwh)
+    if total_kwh <= 0:
+        return [0.0] * len(daily_kwh)
+    total_cost = round(slab_cost(compiled, total_kwh), 2)
+    costs = [round(total_cost * kwh / total_kwh, 2) for kwh in daily_kwh]
+    largest = max(range(len(costs)), key=daily_kwh.__getitem__)
+    costs[largest] = round(costs[largest] + total_cost - sum(costs), 2)
+    return costs
+
+
+def price_daily_kwh(compiled, daily_kwh, hours_day, date_time=None):
+    """
+    Prices one usage entry's (unrounded) daily kWh under a compiled tariff in O(1).
+    Slab tariffs price the entry as if it were the customer's only one that day; writes
+    then share the day's cost out over all its entries with reprice_slab_days. Time-of-use
+    tariffs spread the kWh evenly over hours_day hours starting at date_time's time of day.
+    """
+    tariff_type = compiled['tariff_type']
+    if tariff_type == 'flat':
+        cost = daily_kwh * compiled['rate']
+    elif tariff_type == 'slab':
+        cost = slab_cost(compiled, daily_kwh)
+    else:
+        hours = min(max(float(hours_day), 0.0), 24.0)
+        if hours == 0:
+            return 0.0
+        start = 0.0
+        if date_time and len(date_time) >= 16:
+            try:
+                start = int(date_time[11:13]) + int(date_time[14:16]) / 60.0
+            except ValueError:
+                start = 0.0
+        average_rate = (_tou_integral(compiled, start + hours) - _tou_integral(compiled, start)) / hours
+        cost = daily_kwh * average_rate
+    return round(cost, 2)
+
+
+def reprice_slab_days(cursor, compiled, customer_days):
+    """
+    Re-prices every entry of each (customer_id, day_bucket) pair under a slab tariff with
+    allocate_slab_cost, updating the rows whose cost changed and moving their rollups by
+    the difference, on the caller's cursor and transaction. Does nothing for other tariffs.
+    Returns the (customer_id, cust_app_id) pairs of the rows that changed.
+    """
+    if compiled is None or compiled['tariff_type'] != 'slab':
+        return []
+    updates = []
+    old_entries = []
+    new_entries = []
+    for customer_id, day_bucket in sorted(customer_days):
+        # Seeks the (customer_id, day_bucket, application_name) index
+        cursor.execute('''
+            SELECT cust_app_id, application_name, date_time, watts, hours_day, qty, daily_kwh, daily_cost
+            FROM customer_application
+            WHERE customer_id = ? AND day_bucket = ?
+        ''', (customer_id, day_bucket))
+        rows = cursor.fetchall()
+        if not rows:
+            continue
+        costs = allocate_slab_cost(
+            compiled, [watts * hours_day * qty / 1000.0 for _, _, _, watts, hours_day, qty, _, _ in rows]
+        )
+        for (cust_app_id, application_name, date_time, _, _, _, daily_kwh, daily_cost), cost in zip(rows, costs):
+            if cost != daily_cost:
+                updates.append((cost, cust_app_id))
+                old_entries.append((customer_id, application_name, date_time, daily_kwh, daily_cost))
+                new_entries.append((customer_id, application_name, date_time, daily_kwh, cost))
+    if updates:
+        cursor.executemany("UPDATE customer_application SET daily_cost = ? WHERE cust_app_id = ?", updates)
+        update_usage_rollups_bulk(cursor, old_entries, direction=-1)
+        update_usage_rollups_bulk(cursor, new_entries)
+    return [(entry[0], cust_app_id) for entry, (_, cust_app_id) in zip(new_entries, updates)]
+
+
+def get_compiled_tariff(conn, tariff_id):
+    """Returns the compiled lookup for a tariff, loading and compiling it on first use."""
+    compiled = _compiled_tariffs.get(tariff_id)
+    if compiled is None:
+        cursor = conn.cursor()
+        cursor.execute("SELECT tariff_type FROM tariff WHERE tariff_id = ?", (tariff_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        cursor.execute(
+            "SELECT band_start, rate_per_kwh FROM tariff_band WHERE tariff_id = ? ORDER BY band_start",
+            (tariff_id,)
+        )
+        compiled = compile_tariff(tariff_id, row[0], [tuple(band) for band in cursor.fetchall()])
+        with _compiled_tariffs_lock:
+            _compiled_tariffs[tariff_id] = compiled
+    return compiled
+
+
+def load_active_tariff(conn):
+    """Returns the compiled active tariff, or None when costs use the flat COST_PER_KWH."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT tariff_id FROM tariff WHERE is_active = 1")
+    row = cursor.fetchone()
+    return get_compiled_tariff(conn, row[0]) if row else None
+
+
+def run_reprice_job(job_id, chunk_size=None, pause_seconds=None):
+    """
+    Recomputes daily_cost for every usage row up to the job's max_cust_app_id under the
+    job's tariff. Each chunk, its rollup adjustments and the job's progress are committed
+    together in one short IMMEDIATE transaction, so the job can resume after a crash.
+    Rows written after the job started were already priced with the new tariff.
+    """
+    chunk_size = chunk_size or REPRICE_CHUNK_SIZE
+    pause_seconds = REPRICE_PAUSE_SECONDS if pause_seconds is None else pause_seconds
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT tariff_id, status FROM reprice_job WHERE job_id = ?", (job_id,))
+        job = cursor.fetchone()
+        if job is None or job['status'] == 'done':
+            return
+        tariff_id = job['tariff_id']
+        compiled = get_compiled_tariff(conn, tariff_id)
+        cursor.execute(
+            "UPDATE reprice_job SET status = 'running', error = NULL, updated_at = DATETIME('now') WHERE job_id = ?",
+            (job_id,)
+        )
+        conn.commit()
+
+        while True:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute("SELECT is_active FROM tariff WHERE tariff_id = ?", (tariff_id,))
+            if not cursor.fetchone()['is_active']:
+                # A newer tariff was activated; its own job reprices everything
+                cursor.execute(
+                    "UPDATE reprice_job SET status = 'superseded', updated_at = DATETIME('now') WHERE job_id = ?",
+                    (job_id,)
+                )
+                conn.commit()
+                return
+
+            cursor.execute("SELECT last_cust_app_id, max_cust_app_id FROM reprice_job WHERE job_id = ?", (job_id,))
+            progress = cursor.fetchone()
+            cursor.execute('''
+                SELECT cust_app_id, customer_id, application_name, date_time, day_bucket, watts, hours_day, qty,
+                       daily_kwh, daily_cost
+                FROM customer_application
+                WHERE cust_app_id > ? AND cust_app_id <= ?
+                ORDER BY cust_app_id
+                LIMIT ?
+            ''', (progress['last_cust_app_id'], progress['max_cust_app_id'], chunk_size))
+            rows = cursor.fetchall()
+            if not rows:
+                cursor.execute(
+                    "UPDATE reprice_job SET status = 'done', updated_at = DATETIME('now') WHERE job_id = ?",
+                    (job_id,)
+                )
+                conn.commit()
+                return
+
+            updates = []
+            old_entries = []
+            new_entries = []
+            slab_days = set()
+            for row in rows:
+                if compiled['tariff_type'] == 'slab' and row['day_bucket'] is not None:
+                    # Priced with the rest of the customer's day below
+                    slab_days.add((row['customer_id'], row['day_bucket']))
+                    continue
+                daily_kwh = (row['watts'] * row['hours_day'] * row['qty']) / 1000.0
+                daily_cost = price_daily_kwh(compiled, daily_kwh, row['hours_day'], row['date_time'])
+                if daily_cost != row['daily_cost']:
+                    updates.append((daily_cost, row['cust_app_id']))
+                    key = (row['customer_id'], row['application_name'], row['date_time'])
+                    old_entries.append(key + (row['daily_kwh'], row['daily_cost']))
+                    new_entries.append(key + (row['daily_kwh'], daily_cost))
+
+            if updates:
+                cursor.executemany("UPDATE customer_application SET daily_cost = ? WHERE cust_app_id = ?", updates)
+                update_usage_rollups_bulk(cursor, old_entries, direction=-1)
+                update_usage_rollups_bulk(cursor, new_entries)
+            # A day's entries may reach past this chunk; they are repriced together now and
+            # come out unchanged when the job gets to them
+            repriced = reprice_slab_days(cursor, compiled, slab_days)
+            cursor.execute('''
+                UPDATE reprice_job
+                SET last_cust_app_id = ?, rows_done = rows_done + ?, rows_changed = rows_changed + ?,
+                    updated_at = DATETIME('now')
+                WHERE job_id = ?
+            ''', (rows[-1]['cust_app_id'], len(rows), len(updates) + len(repriced), job_id))
+            conn.commit()
+            publish_resync(
+                [entry[0] for entry in new_entries] + [customer_id for customer_id, _ in repriced], 'reprice'
+            )
+            time.sleep(pause_seconds)
+    except Exception as e:
+        conn.rollback()
+        cursor.execute(
+            "UPDATE reprice_job SET status = 'failed', error = ?, updated_at = DATETIME('now') WHERE job_id = ?",
+            (str(e), job_id)
+        )
+        conn.commit()
+        print(f"Reprice job {job_id} failed: {e}")
+    finally:
+        conn.close()
+
+
+def start_reprice_job(job_id):
+    """Runs a repricing job on a background daemon thread and returns the thread."""
+    thread = threading.Thread(target=run_reprice_job, args=(job_id,), name=f'reprice-job-{job_id}', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,56 @@
+# Shared fixtures: every test runs the app against a fresh, migrated database in a
+# temporary directory (with its own report cache and usage archive directories).
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app_database
+import report_engine
+import usage_archive
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """A freshly migrated database; pooled connections to the previous one are replaced."""
+    path = str(tmp_path / 'energy_estimator.db')
+    monkeypatch.setattr(app_database, 'DB_NAME', path)
+    monkeypatch.setattr(report_engine, 'REPORT_CACHE_DIR', str(tmp_path / 'report_cache'))
+    monkeypatch.setattr(usage_archive, 'ARCHIVE_DIR', str(tmp_path / 'usage_archive'))
+    app_database.migrate_database()
+    yield path
+    app_database.close_pooled_connection()
+
+
+@pytest.fixture
+def energy_app(db_path):
+    import energy_app
+    energy_app.clear_response_cache()
+    energy_app.invalidate_application_catalog()
+    return energy_app
+
+
+@pytest.fixture
+def client(energy_app):
+    return energy_app.app.test_client()
+
+
+def add_customer(client, name='Test Customer', email='test@example.com', phone='9876543210'):
+    response = client.post('/api/admin/customer', json={'name': name, 'email': email, 'phone': phone})
+    assert response.status_code == 201, response.get_json()
+    conn = app_database.get_db_connection()
+    try:
+        return conn.execute('SELECT customer_id FROM customer WHERE email_id = ?', (email,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def add_usage(client, customer_id, application_name='Ceiling Fan', date_time='2026-05-04T08:00', hours_day=2, qty=1):
+    response = client.post(f'/api/customer/{customer_id}/application', json={
+        'application_name': application_name, 'qty': qty, 'date_time': date_time, 'hours_day': hours_day
+    })
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['cust_app_id']
@@ -0,0 +1,31 @@
+import app_database
+from conftest import add_customer, add_usage
+
+
+def test_bulk_delete_rejects_a_non_integer_chunk_size(client):
+    customer_id = add_customer(client)
+    response = client.post('/api/admin/customers/bulk_delete?chunk_size=ten', json={'customer_ids': [customer_id]})
+    assert response.status_code == 400
+    assert 'chunk_size' in response.get_json()['message']
+
+
+def test_bulk_delete_looks_up_the_requested_ids_in_groups(client, energy_app, monkeypatch):
+    monkeypatch.setattr(energy_app, 'PURGE_GROUP_SIZE', 2)
+    customer_ids = [add_customer(client, f'Customer {i}', f'customer{i}@example.com', f'98765432{i:02d}')
+                    for i in range(4)]
+    for customer_id in customer_ids:
+        add_usage(client, customer_id)
+        add_usage(client, customer_id, date_time='2026-05-05T08:00')
+
+    doomed = customer_ids[:3]
+    response = client.post('/api/admin/customers/bulk_delete?chunk_size=1', json={'customer_ids': doomed + [999999]})
+    assert response.status_code == 200, response.get_json()
+    body = response.get_json()
+    assert (body['deleted'], body['usage_rows_deleted'], body['not_found']) == (3, 6, [999999])
+
+    conn = app_database.get_db_connection()
+    try:
+        assert [row[0] for row in conn.execute('SELECT customer_id FROM customer')] == customer_ids[3:]
+        assert conn.execute('SELECT COUNT(*) FROM customer_application').fetchone()[0] == 2
+    finally:
+        conn.close()
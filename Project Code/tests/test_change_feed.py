@@ -0,0 +1,57 @@
+import threading
+
+from change_feed import OVERFLOW_RESYNC, LocalChangeFeed, format_sse
+
+SUBSCRIBERS = 8
+EVENTS = 200
+
+
+def usage_event(n):
+    return format_sse('usage_added', {'customer_id': 1, 'cust_app_id': n}, event_id=n)
+
+
+def test_every_subscriber_receives_every_event_in_order():
+    feed = LocalChangeFeed(queue_size=EVENTS)
+    subscriptions = [feed.subscribe(1) for _ in range(SUBSCRIBERS)]
+    other_customer = feed.subscribe(2)
+    received = [[] for _ in subscriptions]
+
+    def consume(index):
+        while len(received[index]) < EVENTS:
+            message = subscriptions[index].get(timeout=5)
+            if message is None:
+                break
+            received[index].append(message)
+
+    threads = [threading.Thread(target=consume, args=(index,)) for index in range(SUBSCRIBERS)]
+    for thread in threads:
+        thread.start()
+    for n in range(EVENTS):
+        assert feed.publish(1, usage_event(n)) == SUBSCRIBERS
+    for thread in threads:
+        thread.join()
+
+    expected = [usage_event(n) for n in range(EVENTS)]
+    assert all(messages == expected for messages in received)
+    assert other_customer.get(timeout=0) is None
+    assert feed.subscriber_count() == SUBSCRIBERS + 1
+
+
+def test_slow_subscriber_overflows_into_a_resync():
+    feed = LocalChangeFeed(queue_size=4)
+    fast = feed.subscribe(1)
+    slow = feed.subscribe(1)
+    for n in range(10):
+        feed.publish(1, usage_event(n))
+        assert fast.get(timeout=0) == usage_event(n)
+
+    # The slow subscriber's missed deltas are replaced by one resync, then delivery resumes
+    assert slow.get(timeout=0) == OVERFLOW_RESYNC
+    assert slow.get(timeout=0) is None
+    feed.publish(1, usage_event(10))
+    assert slow.get(timeout=0) == usage_event(10)
+    assert fast.get(timeout=0) == usage_event(10)
+
+    feed.unsubscribe(slow)
+    feed.unsubscribe(fast)
+    assert not feed.has_subscribers(1)
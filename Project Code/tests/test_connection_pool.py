@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+
+import app_database
+from conftest import add_customer
+
+WRITER_THREADS = 8
+WRITES_PER_THREAD = 25
+
+
+def read_rollups(conn):
+    return conn.execute('''
+        SELECT customer_id, period, bucket, application_name, ROUND(total_kwh, 6), ROUND(total_cost, 6), entry_count
+        FROM usage_rollup ORDER BY 1, 2, 3, 4
+    ''').fetchall()
+
+
+def test_concurrent_pooled_writes_do_not_lock_and_keep_rollups_exact(energy_app):
+    client = energy_app.app.test_client()
+    customer_ids = [add_customer(client, f'Customer {i}', f'customer{i}@example.com', f'98765432{i:02d}')
+                    for i in range(WRITER_THREADS)]
+    failures = []
+    start = threading.Barrier(WRITER_THREADS)
+
+    def writer(index):
+        # Every thread sends its requests through its own pooled connection
+        thread_client = energy_app.app.test_client()
+        customer_id = customer_ids[index % 2]  # Threads share customers, so they contend for the same rollup rows
+        try:
+            start.wait()
+            for n in range(WRITES_PER_THREAD):
+                response = thread_client.post(f'/api/customer/{customer_id}/application', json={
+                    'application_name': 'Ceiling Fan', 'qty': 1 + n % 3,
+                    'date_time': f'2026-05-{1 + n % 5:02d}T{index:02d}:00', 'hours_day': 2
+                })
+                if response.status_code != 201:
+                    failures.append(response.get_json())
+                    continue
+                cust_app_id = response.get_json()['cust_app_id']
+                if n % 3 == 1:
+                    response = thread_client.put(f'/api/customer/application/{cust_app_id}', json={
+                        'qty': 2, 'date_time': f'2026-06-{1 + n % 5:02d}T{index:02d}:00', 'hours_day': 3
+                    })
+                elif n % 3 == 2:
+                    response = thread_client.delete(f'/api/customer/application/{cust_app_id}')
+                if response.status_code not in (200, 201):
+                    failures.append(response.get_json())
+                thread_client.get(f'/api/customer/{customer_id}/totals?date=2026-05-01')
+        except Exception as e:
+            failures.append(str(e))
+        finally:
+            app_database.close_pooled_connection()
+
+    threads = [threading.Thread(target=writer, args=(index,)) for index in range(WRITER_THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not failures, failures[:5]
+    assert not any('database is locked' in str(failure) for failure in failures)
+    conn = app_database.get_db_connection()
+    try:
+        assert conn.execute('SELECT COUNT(*) FROM customer_application').fetchone()[0] == \
+            WRITER_THREADS * (WRITES_PER_THREAD - WRITES_PER_THREAD // 3)
+        rollups = read_rollups(conn)
+    finally:
+        conn.close()
+
+    app_database.rebuild_usage_rollups()
+    conn = app_database.get_db_connection()
+    try:
+        assert read_rollups(conn) == rollups
+    finally:
+        conn.close()
+
+
+READ_SECONDS = 0.6
+# The cost_analysis scan over a customer's day rollups, summed in SQL so each read is
+# mostly SQLite work (which runs without the GIL) rather than Python
+COST_SCAN_SQL = '''
+    SELECT SUM(total_kwh), SUM(total_cost) FROM usage_rollup
+    WHERE customer_id = ? AND period = 'day' AND bucket >= ? AND bucket < ?
+'''
+
+
+def seed_usage_history(energy_app, customer_id, days=720):
+    conn = app_database.get_db_connection()
+    try:
+        apps = ('Ceiling Fan', 'Refrigerator (Standard)', 'LED Light Bulb (10W)', 'Water Purifier')
+        chunk = [
+            (customer_id, app_name, 1, f'{2024 + day // 360}-{1 + day // 30 % 12:02d}-{1 + day % 28:02d}T{hour:02d}:00',
+             60, 4.0)
+            for day in range(days) for hour, app_name in enumerate(apps)
+        ]
+        energy_app.insert_usage_chunk(conn, chunk)
+    finally:
+        conn.close()
+
+
+def measure_read_throughput(reader_count, customer_id, writer_holding):
+    """
+    Reads per second over READ_SECONDS with reader_count threads, each on its own pooled
+    connection, and how many of the reads finished while the writer held the write lock.
+    """
+    counts = [0] * reader_count
+    during_write = [0] * reader_count
+    failures = []
+    start = threading.Barrier(reader_count + 1)
+
+    def reader(index):
+        conn = app_database.get_pooled_connection()
+        try:
+            start.wait()
+            deadline = time.perf_counter() + READ_SECONDS
+            while time.perf_counter() < deadline:
+                conn.execute(COST_SCAN_SQL, (customer_id, '2024', '2027')).fetchone()
+                counts[index] += 1
+                if writer_holding.is_set():
+                    during_write[index] += 1
+        except Exception as e:
+            failures.append(str(e))
+        finally:
+            app_database.close_pooled_connection()
+
+    threads = [threading.Thread(target=reader, args=(index,)) for index in range(reader_count)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    for thread in threads:
+        thread.join()
+    assert not failures, failures[:5]
+    return sum(counts) / READ_SECONDS, sum(during_write)
+
+
+def test_reads_run_alongside_an_active_writer_and_scale_with_threads(energy_app):
+    client = energy_app.app.test_client()
+    customer_id = add_customer(client)
+    writer_id = add_customer(client, 'Writer', 'writer@example.com', '9876500000')
+    seed_usage_history(energy_app, customer_id)
+
+    writer_holding = threading.Event()
+    stop = threading.Event()
+    commits = [0]
+    writer_failures = []
+
+    def writer():
+        # Commits continuously, holding the write lock for a while in every transaction
+        conn = app_database.get_pooled_connection()
+        try:
+            while not stop.is_set():
+                conn.execute('BEGIN IMMEDIATE')
+                writer_holding.set()
+                time.sleep(0.002)  # A slow write keeps the lock while readers carry on
+                energy_app.insert_usage_chunk(conn, [(writer_id, 'Ceiling Fan', 1, '2026-05-04T08:00', 75, 2.0)])
+                writer_holding.clear()
+                commits[0] += 1
+                time.sleep(0.001)
+        except Exception as e:
+            writer_failures.append(str(e))
+        finally:
+            app_database.close_pooled_connection()
+
+    writer_thread = threading.Thread(target=writer)
+    writer_thread.start()
+    try:
+        throughput = {}
+        for reader_count in (1, 2, 4):
+            commits_before = commits[0]
+            throughput[reader_count], reads_during_write = measure_read_throughput(
+                reader_count, customer_id, writer_holding
+            )
+            # The writer kept committing, and reads completed while it held the write lock
+            assert commits[0] > commits_before
+            assert reads_during_write > 0
+    finally:
+        stop.set()
+        writer_thread.join()
+    assert not writer_failures, writer_failures
+
+    # Readers never queue behind each other or the writer: more threads never read less...
+    assert min(throughput[2], throughput[4]) > 0.7 * throughput[1], throughput
+    # ...and, given cores to run on, clearly more
+    if (os.cpu_count() or 1) >= 2:
+        assert max(throughput[2], throughput[4]) > 1.3 * throughput[1], throughput
@@ -0,0 +1,21 @@
+from conftest import add_customer, add_usage
+
+
+def test_totals_of_the_day_month_and_year(client):
+    customer_id = add_customer(client)
+    add_usage(client, customer_id, date_time='2026-05-04T08:00')
+    add_usage(client, customer_id, date_time='2026-05-09T08:00')
+    add_usage(client, customer_id, date_time='2026-01-09T08:00')
+
+    totals = client.get(f'/api/customer/{customer_id}/totals?date=2026-05-04').get_json()['totals']
+    assert [totals[period]['total_kwh'] for period in ('day', 'month', 'year')] == [0.15, 0.3, 0.45]
+
+
+def test_totals_of_a_deleted_customer_are_not_found(client):
+    customer_id = add_customer(client)
+    add_usage(client, customer_id)
+    assert client.delete(f'/api/admin/customer/{customer_id}').status_code == 200
+
+    response = client.get(f'/api/customer/{customer_id}/totals?date=2026-05-04')
+    assert response.status_code == 404
+    assert response.get_json()['message'] == 'Customer not found.'
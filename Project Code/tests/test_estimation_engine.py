@@ -0,0 +1,25 @@
+import pytest
+
+from conftest import add_customer, add_usage
+
+
+@pytest.mark.parametrize('query', ['cost_per_kwh=nan', 'cost_per_kwh=inf', 'cost_per_kwh=-Infinity', 'hours_delta=nan'])
+def test_what_if_rejects_non_finite_numbers(client, query):
+    customer_id = add_customer(client)
+    response = client.get(f'/api/customer/{customer_id}/what_if?{query}')
+    assert response.status_code == 400
+    assert 'finite' in response.get_json()['message']
+
+
+def test_what_if_of_an_unknown_customer_is_not_found(client):
+    response = client.get('/api/customer/999999/what_if')
+    assert response.status_code == 404
+    assert response.get_json()['message'] == 'Customer not found.'
+
+
+def test_what_if_reprices_the_usage(client):
+    customer_id = add_customer(client)
+    add_usage(client, customer_id, hours_day=4)
+    response = client.get(f'/api/customer/{customer_id}/what_if?cost_per_kwh=10&hours_delta=-2')
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['scenario_params'] == {'cost_per_kwh': 10.0, 'application': None, 'hours_delta': -2.0}
@@ -0,0 +1,39 @@
+import sqlite3
+from datetime import datetime
+
+import app_database
+from forecast_engine import forecast_bills
+from conftest import add_customer, add_usage
+
+
+def test_unparsed_rollup_buckets_are_skipped(client, db_path):
+    customer_id = add_customer(client)
+    add_usage(client, customer_id, date_time='2026-05-04T08:00')
+    # A legacy date stored as-is leaves its raw prefix as a day bucket inside the forecast window
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        INSERT INTO usage_rollup (customer_id, period, bucket, application_name, total_kwh, total_cost, entry_count)
+        VALUES (?, 'day', '2026-05-0x', 'Ceiling Fan', 1, 8, 1)
+    ''', (customer_id,))
+    conn.commit()
+    conn.close()
+
+    conn = app_database.get_db_connection()
+    try:
+        forecasts = forecast_bills(conn, datetime(2026, 5, 10), customer_id=customer_id)
+    finally:
+        conn.close()
+    assert forecasts[0]['month_to_date_cost'] > 0
+
+    response = client.get('/api/admin/analytics/projected_bills?date=2026-05-10')
+    assert response.status_code == 200, response.get_json()
+
+
+def test_cost_analysis_forecast_is_opt_in(client):
+    customer_id = add_customer(client)
+    add_usage(client, customer_id)
+    url = f'/api/cost_analysis?customer_id={customer_id}&period=month&date=2026-05'
+
+    assert 'forecast' not in client.get(url).get_json()
+    forecast = client.get(url + '&fields=summary,forecast').get_json()['forecast']
+    assert forecast['customer_id'] == customer_id
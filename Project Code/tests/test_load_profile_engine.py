@@ -0,0 +1,56 @@
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+
+import app_database
+from initial_data import APPLICATIONS_LIST
+from load_profile_engine import customer_load_curves, duty_fractions, profile_matrix
+from conftest import add_customer, add_usage
+
+AS_OF = datetime(2026, 5, 31)
+AIR_CONDITIONER = 'Air Conditioner (Split 1.5 Ton)'
+
+
+def test_duty_fractions_stay_within_the_hour_and_keep_the_hours_of_use():
+    profiles = profile_matrix(['Electric Water Heater (Geyser)', AIR_CONDITIONER, 'Refrigerator (Standard)'])
+    for hours in (0.5, 3, 20, 24):
+        fractions = duty_fractions(profiles, np.full(len(profiles), hours))
+        assert fractions.max() <= 1.0 + 1e-9
+        assert np.allclose(fractions.sum(axis=1), hours)
+
+
+def test_peak_never_exceeds_the_connected_load(client):
+    customer_id = add_customer(client)
+    add_usage(client, customer_id, AIR_CONDITIONER, '2026-05-04T08:00', hours_day=20)
+    add_usage(client, customer_id, AIR_CONDITIONER, '2026-05-05T08:00', hours_day=20, qty=2)
+    add_usage(client, customer_id, 'Ceiling Fan', '2026-05-05T08:00', hours_day=24, qty=3)
+
+    conn = app_database.get_db_connection()
+    try:
+        _, _, curves, fleet = customer_load_curves(conn, 'month', '2026-05', as_of=AS_OF)
+    finally:
+        conn.close()
+    connected_kw = (2 * APPLICATIONS_LIST[AIR_CONDITIONER] + 3 * APPLICATIONS_LIST['Ceiling Fan']) / 1000
+    assert 0 < curves[0]['peak_kw'] <= connected_kw + 1e-3
+    assert fleet['coincident_peak_kw'] <= connected_kw + 1e-3
+    # The energy of the month is unchanged by the shaping: 1.5 kWh/h x (20 + 40) h plus 3 fans all day
+    # (each hourly average is rounded to the watt, so the month's total is only good to about 0.4 kWh)
+    month_energy = sum(curves[0]['hourly_kw']) * 31
+    assert abs(month_energy - (1.5 * 60 + 3 * APPLICATIONS_LIST['Ceiling Fan'] / 1000 * 24)) < 0.4
+
+
+def test_unparsed_dates_are_left_out(client, db_path):
+    customer_id = add_customer(client)
+    add_usage(client, customer_id, AIR_CONDITIONER, '2026-05-04T08:00', hours_day=4)
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        INSERT INTO customer_application (customer_id, application_name, qty, date_time, watts, hours_day)
+        VALUES (?, ?, 1, '2026-05-xx', 1500, 4)
+    ''', (customer_id, AIR_CONDITIONER))
+    conn.commit()
+    conn.close()
+
+    response = client.get(f'/api/customer/{customer_id}/load_curve?date=2026-05')
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['load_curve']['peak_kw'] <= 1.5
@@ -0,0 +1,78 @@
+import pytest
+
+import app_database
+
+# The hot reads over customer_application and usage_rollup, as the app issues them, with
+# the search each one must resolve to: (SQL, parameters, expected index search)
+HOT_QUERIES = {
+    'usage_page': (
+        '''SELECT {usage_list_columns}, customer_application.date_time AS sort_date_time, cust_app_id AS sort_id
+           FROM customer_application
+           WHERE customer_id = ? AND (customer_application.date_time, cust_app_id) < (?, ?)
+           ORDER BY customer_application.date_time DESC, cust_app_id DESC LIMIT ?''',
+        (1, '2026-05-04T08:00', 10, 50),
+        'idx_customer_application_customer_date (customer_id=? AND date_time<?)',
+    ),
+    'usage_date_range': (
+        '''SELECT cust_app_id, application_name, daily_kwh, daily_cost FROM customer_application
+           WHERE customer_id = ? AND date_time >= ? AND date_time < ?''',
+        (1, '2026-05', '2026-06'),
+        'idx_customer_application_customer_date (customer_id=? AND date_time>? AND date_time<?)',
+    ),
+    'usage_application': (
+        "SELECT COUNT(*) FROM customer_application WHERE customer_id = ? AND application_name = ?",
+        (1, 'Ceiling Fan'),
+        'idx_customer_application_customer_app (customer_id=? AND application_name=?)',
+    ),
+    'usage_day': (
+        '''SELECT cust_app_id, application_name, date_time, watts, hours_day, qty, daily_kwh, daily_cost
+           FROM customer_application
+           WHERE customer_id = ? AND day_bucket = ?''',
+        (1, '2026-05-04'),
+        'idx_customer_application_customer_day (customer_id=? AND day_bucket=?)',
+    ),
+    'rollup_cost_analysis': (
+        '''SELECT bucket, application_name, total_cost FROM usage_rollup
+           WHERE customer_id = ? AND period = ? AND bucket >= ? AND bucket < ?''',
+        (1, 'day', '2026-05', '2026-06'),
+        'PRIMARY KEY (customer_id=? AND period=? AND bucket>? AND bucket<?)',
+    ),
+    'rollup_bucket_totals': (
+        '''SELECT r.period, SUM(r.total_kwh), SUM(r.total_cost)
+           FROM (VALUES ('day', ?), ('month', ?), ('year', ?)) AS wanted
+           JOIN usage_rollup r ON r.customer_id = ? AND r.period = wanted.column1 AND r.bucket = wanted.column2
+           GROUP BY r.period''',
+        ('2026-05-04', '2026-05', '2026', 1),
+        'PRIMARY KEY (customer_id=? AND period=? AND bucket=?)',
+    ),
+    'rollup_year_total': (
+        "SELECT SUM(total_kwh), SUM(total_cost) FROM usage_rollup WHERE customer_id = ? AND period = 'year'",
+        (1,),
+        'PRIMARY KEY (customer_id=? AND period=?)',
+    ),
+}
+
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_queries_search_an_index(energy_app, name):
+    sql, params, expected_search = HOT_QUERIES[name]
+    conn = app_database.get_db_connection()
+    try:
+        plan = [row[3] for row in conn.execute(
+            'EXPLAIN QUERY PLAN ' + sql.format(usage_list_columns=energy_app.USAGE_LIST_COLUMNS), params
+        )]
+    finally:
+        conn.close()
+    # Every step reading a base table (by name or alias); the VALUES list of wanted buckets is not one
+    table_steps = [
+        step for step in plan
+        if step.startswith(('SEARCH', 'SCAN')) and 'CONSTANT ROWS' not in step and step.split()[1] != 'wanted'
+    ]
+    assert table_steps, plan
+    for step in table_steps:
+        # usage_rollup is WITHOUT ROWID: its primary key is its covering index
+        assert step.startswith('SEARCH'), plan
+        assert any(using in step for using in ('USING INDEX', 'USING COVERING INDEX', 'USING PRIMARY KEY')), plan
+    assert any(step.endswith(expected_search) for step in table_steps), plan
+    # The keyset listing must come out of the index in order, not through a sort
+    assert not any('TEMP B-TREE FOR ORDER BY' in step for step in plan), plan
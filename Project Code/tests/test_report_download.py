@@ -0,0 +1,39 @@
+from conftest import add_customer, add_usage
+
+
+def add_report_usage(client):
+    customer_id = add_customer(client)
+    add_usage(client, customer_id, 'Ceiling Fan')
+    add_usage(client, customer_id, 'Refrigerator (Standard)', '2026-05-05T08:00')
+    return customer_id
+
+
+def test_unknown_customer_is_not_found(client):
+    assert client.get('/api/customer/999999/report.csv').status_code == 404
+
+
+def test_customer_deleted_before_the_report_streams_still_gets_the_full_report(client, energy_app):
+    customer_id = add_report_usage(client)
+    with energy_app.app.test_request_context(f'/api/customer/{customer_id}/report.csv'):
+        response = energy_app.download_report(customer_id, 'csv')
+    assert response.status_code == 200
+    assert response.headers['X-Report-Cache'] == 'miss'
+
+    # Committed after the customer check, before the first chunk is rendered
+    assert client.delete(f'/api/admin/customer/{customer_id}').status_code == 200
+    body = b''.join(response.response).decode()
+    response.close()
+    assert 'Ceiling Fan' in body and 'Refrigerator (Standard)' in body
+    assert client.get(f'/api/customer/{customer_id}/report.csv').status_code == 404
+
+
+def test_customer_deleted_while_the_report_streams_completes_uncached(client):
+    customer_id = add_report_usage(client)
+    response = client.get(f'/api/customer/{customer_id}/report.csv', buffered=False)
+    assert response.status_code == 200
+    # Purges the customer's report cache directory under the file being written
+    assert client.delete(f'/api/admin/customer/{customer_id}').status_code == 200
+
+    body = response.get_data(as_text=True)
+    response.close()
+    assert 'Ceiling Fan' in body and 'Refrigerator (Standard)' in body
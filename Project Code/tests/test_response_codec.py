@@ -0,0 +1,51 @@
+# Compact columnar responses and response compression (response_codec.py, compress_response)
+
+import gzip
+
+from conftest import add_customer, add_usage
+from response_codec import columnar, records
+
+
+def test_columnar_and_records_hold_the_same_rows():
+    columns = ('a', 'b')
+    rows = [(1, 'x'), (2, 'y')]
+    assert columnar(columns, rows) == {'a': [1, 2], 'b': ['x', 'y']}
+    assert records(columns, rows) == [{'a': 1, 'b': 'x'}, {'a': 2, 'b': 'y'}]
+    assert columnar(columns, []) == {'a': [], 'b': []}
+
+
+def test_columns_format_matches_row_format(client):
+    customer_id = add_customer(client)
+    for day in range(1, 6):
+        add_usage(client, customer_id, date_time=f'2026-05-{day:02d}T08:00')
+    rows = client.get(f'/api/customer/{customer_id}/applications').get_json()['applications']
+    columns = client.get(f'/api/customer/{customer_id}/applications?format=columns').get_json()['applications']
+    assert [dict(zip(columns, values)) for values in zip(*columns.values())] == rows
+
+
+def test_large_bodies_are_gzipped(client):
+    response = client.get('/api/applications', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    identity = client.get('/api/applications', headers={'Accept-Encoding': 'identity'})
+    assert gzip.decompress(response.data) == identity.data
+
+
+def test_compressed_catalog_revalidates_with_its_weak_etag(client):
+    response = client.get('/api/applications', headers={'Accept-Encoding': 'gzip'})
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    revalidated = client.get('/api/applications', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
+
+
+def test_compressed_cached_response_revalidates_with_its_weak_etag(client):
+    customer_id = add_customer(client)
+    for day in range(1, 30):
+        add_usage(client, customer_id, date_time=f'2026-05-{day:02d}T08:00')
+    path = f'/api/customer/{customer_id}/report_data'
+    response = client.get(path, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    etag = response.headers['ETag']
+    assert client.get(path, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}).status_code == 304
@@ -0,0 +1,108 @@
+import app_database
+import tariff_engine
+from tariff_engine import allocate_slab_cost, compile_tariff
+from conftest import add_customer
+
+# 5/kWh for a customer's first 2 kWh of the day, 10/kWh beyond
+SLAB_BANDS = [{'band_start': 0, 'rate_per_kwh': 5}, {'band_start': 2, 'rate_per_kwh': 10}]
+
+
+def add_slab_tariff(client, monkeypatch):
+    # Repricing runs inline, one row per chunk, so a day's entries span chunks
+    monkeypatch.setattr(
+        'energy_app.start_reprice_job',
+        lambda job_id: tariff_engine.run_reprice_job(job_id, chunk_size=1, pause_seconds=0)
+    )
+    response = client.post('/api/admin/tariffs', json={'name': 'Slab', 'tariff_type': 'slab', 'bands': SLAB_BANDS})
+    tariff_id = response.get_json()['tariff_id']
+    assert client.post(f'/api/admin/tariffs/{tariff_id}/activate').status_code == 202
+
+
+def add_kettle_use(client, customer_id, date_time='2026-05-04T08:00'):
+    # 750 W for 2 hours: 1.5 kWh, below the 2 kWh slab boundary on its own
+    response = client.post(f'/api/customer/{customer_id}/application', json={
+        'application_name': 'Electric Kettle', 'watts': 750, 'qty': 1, 'date_time': date_time, 'hours_day': 2
+    })
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['cust_app_id']
+
+
+def read_costs_and_rollups(customer_id):
+    conn = app_database.get_db_connection()
+    try:
+        costs = [row[0] for row in conn.execute(
+            'SELECT daily_cost FROM customer_application WHERE customer_id = ? ORDER BY cust_app_id', (customer_id,)
+        )]
+        rollups = conn.execute(
+            'SELECT period, bucket, application_name, ROUND(total_kwh, 6), ROUND(total_cost, 6), entry_count '
+            'FROM usage_rollup WHERE customer_id = ? ORDER BY 1, 2, 3', (customer_id,)
+        ).fetchall()
+        day_cost = conn.execute(
+            "SELECT SUM(total_cost) FROM usage_rollup WHERE customer_id = ? AND period = 'day' AND bucket = '2026-05-04'",
+            (customer_id,)
+        ).fetchone()[0]
+    finally:
+        conn.close()
+    return costs, [tuple(row) for row in rollups], day_cost
+
+
+def test_allocation_shares_the_marginal_cost_of_the_total():
+    compiled = compile_tariff(1, 'slab', [(0, 5), (2, 10)])
+    assert allocate_slab_cost(compiled, [1.5, 1.5]) == [10.0, 10.0]
+    assert allocate_slab_cost(compiled, [1.0]) == [5.0]
+    costs = allocate_slab_cost(compiled, [1.0, 1.0, 1.0])
+    assert sum(costs) == 20.0
+    assert allocate_slab_cost(compiled, [0.0, 0.0]) == [0.0, 0.0]
+
+
+def test_entries_crossing_a_band_only_together_pay_the_higher_band(client, monkeypatch):
+    add_slab_tariff(client, monkeypatch)
+    customer_id = add_customer(client)
+    add_kettle_use(client, customer_id)
+    assert read_costs_and_rollups(customer_id)[0] == [7.5]
+
+    second_id = add_kettle_use(client, customer_id, '2026-05-04T18:00')
+    # 3 kWh in the day: 2 x 5 + 1 x 10 = 20, shared equally
+    costs, rollups, day_cost = read_costs_and_rollups(customer_id)
+    assert costs == [10.0, 10.0]
+    assert day_cost == 20.0
+
+    app_database.rebuild_usage_rollups()
+    assert read_costs_and_rollups(customer_id)[1] == rollups
+
+    assert client.delete(f'/api/customer/application/{second_id}').status_code == 200
+    costs, _, day_cost = read_costs_and_rollups(customer_id)
+    assert costs == [7.5]
+    assert day_cost == 7.5
+
+
+def test_repricing_job_prices_each_day_as_a_whole(client, monkeypatch):
+    customer_id = add_customer(client)
+    add_kettle_use(client, customer_id)
+    add_kettle_use(client, customer_id, '2026-05-04T18:00')
+    add_kettle_use(client, customer_id, '2026-05-05T08:00')
+    assert read_costs_and_rollups(customer_id)[0] == [12.0, 12.0, 12.0]
+
+    add_slab_tariff(client, monkeypatch)
+    costs, rollups, day_cost = read_costs_and_rollups(customer_id)
+    assert costs == [10.0, 10.0, 7.5]
+    assert day_cost == 20.0
+    app_database.rebuild_usage_rollups()
+    assert read_costs_and_rollups(customer_id)[1] == rollups
+
+
+def test_non_finite_bands_are_rejected(client):
+    for bands in ([{'band_start': 0, 'rate_per_kwh': float('nan')}],
+                  [{'band_start': 0, 'rate_per_kwh': float('inf')}],
+                  [{'band_start': 0, 'rate_per_kwh': 5}, {'band_start': float('inf'), 'rate_per_kwh': 10}]):
+        response = client.post('/api/admin/tariffs', json={'name': 'Broken', 'tariff_type': 'slab', 'bands': bands})
+        assert response.status_code == 400
+        assert 'finite' in response.get_json()['message']
+
+
+def test_only_a_duplicate_name_is_a_conflict(client):
+    tariff = {'name': 'Flat 9', 'tariff_type': 'flat', 'bands': [{'band_start': 0, 'rate_per_kwh': 9}]}
+    assert client.post('/api/admin/tariffs', json=tariff).status_code == 201
+    response = client.post('/api/admin/tariffs', json=tariff)
+    assert response.status_code == 409
+    assert response.get_json()['message'] == 'Tariff name already exists.'
@@ -0,0 +1,34 @@
+import json
+
+import app_database
+from conftest import add_customer
+
+
+def import_ndjson(client, rows):
+    body = '\n'.join(json.dumps(row) for row in rows)
+    return client.post('/api/admin/usage/import?format=ndjson', data=body, content_type='application/x-ndjson')
+
+
+def test_out_of_range_hours_and_quantities_are_row_errors(client):
+    customer_id = add_customer(client)
+    row = {'customer_id': customer_id, 'application_name': 'Ceiling Fan', 'date_time': '2026-05-04T08:00'}
+    response = import_ndjson(client, [
+        dict(row, hours_day=2, qty=1),
+        dict(row, hours_day=-3),
+        dict(row, hours_day=30),
+        dict(row, hours_day=0),
+        dict(row, hours_day='nan'),
+        dict(row, hours_day=24, qty=-2),
+        dict(row, hours_day=24, qty=2),
+    ])
+    body = response.get_json()
+    assert (body['inserted'], body['failed']) == (2, 5)
+    assert [error['row'] for error in body['errors']] == [2, 3, 4, 5, 6]
+
+    conn = app_database.get_db_connection()
+    try:
+        assert [tuple(row) for row in conn.execute(
+            'SELECT qty, hours_day FROM customer_application ORDER BY cust_app_id'
+        )] == [(1, 2.0), (2, 24.0)]
+    finally:
+        conn.close()
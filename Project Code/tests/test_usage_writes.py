@@ -0,0 +1,25 @@
+import pytest
+
+from conftest import add_customer, add_usage
+
+USAGE = {'application_name': 'Ceiling Fan', 'qty': 1, 'date_time': '2026-05-04T08:00', 'hours_day': 2}
+
+
+@pytest.mark.parametrize('field, value', [
+    ('hours_day', [1]), ('qty', {'n': 1}), ('watts', [75]), ('application_name', ['Ceiling Fan']),
+])
+def test_malformed_add_is_a_json_400(client, field, value):
+    customer_id = add_customer(client)
+    response = client.post(f'/api/customer/{customer_id}/application', json=dict(USAGE, **{field: value}))
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+@pytest.mark.parametrize('field, value', [('hours_day', [1]), ('qty', [2])])
+def test_malformed_edit_is_a_json_400(client, field, value):
+    customer_id = add_customer(client)
+    cust_app_id = add_usage(client, customer_id)
+    body = {'qty': 1, 'date_time': '2026-05-04T08:00', 'hours_day': 2, field: value}
+    response = client.put(f'/api/customer/application/{cust_app_id}', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
@@ -0,0 +1,37 @@
+from concurrent.futures import Future
+
+import pytest
+
+from conftest import add_customer
+
+USAGE = {'application_name': 'Ceiling Fan', 'qty': 1, 'date_time': '2026-05-04T08:00', 'hours_day': 2}
+
+
+class StalledQueue:
+    """A write queue whose writer never gets to the operation."""
+
+    def submit(self, operation, idempotency_key=None, fingerprint=None):
+        return Future()
+
+
+@pytest.fixture
+def queued_app(energy_app, monkeypatch):
+    monkeypatch.setitem(energy_app.app.config, 'WRITE_QUEUE', True)
+    monkeypatch.setitem(energy_app.app.config, 'WRITE_TIMEOUT_SECONDS', 0.01)
+    return energy_app
+
+
+def test_timed_out_write_only_advises_a_retry_with_an_idempotency_key(client, queued_app, monkeypatch):
+    customer_id = add_customer(client)
+    monkeypatch.setattr(queued_app, 'get_write_queue', lambda *args: StalledQueue())
+
+    response = client.post(f'/api/customer/{customer_id}/application', json=USAGE,
+                           headers={'Idempotency-Key': 'usage-1'})
+    assert response.status_code == 504
+    assert 'retry with the same Idempotency-Key' in response.get_json()['message']
+
+    response = client.post(f'/api/customer/{customer_id}/application', json=USAGE)
+    assert response.status_code == 504
+    message = response.get_json()['message']
+    assert 'outcome is unknown' in message and 'retry with the same' not in message
+
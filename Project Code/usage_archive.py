@@ -0,0 +1,384 @@
+# This module holds the columnar archive for closed usage periods.
+# Archiving moves a customer's usage rows dated before a cut-off month out of
+# customer_application into immutable segments: one directory per segment under the
+# customer's directory, holding one fixed-width .npy file per column. Segments are
+# memory-mapped with NumPy, so summing years of history is a vectorized scan of the mapped
+# pages, and the live table only keeps recent periods.
+#
+# A segment counts only once its row in usage_archive_segment is committed, in the same
+# transaction that deletes the archived rows from customer_application; a segment written
+# by an interrupted run is never read and is removed by the next one. The usage_rollup
+# buckets are left as they are, so cost analysis covers archived periods unchanged.
+# Archived rows are read-only: they cannot be edited, deleted or repriced individually.
+#
+#   python usage_archive.py archive --before 2025-01
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+import numpy as np
+
+import app_database
+from app_database import ROLLUP_PERIODS, get_db_connection
+
+# Directory holding the archive, one sub-directory per customer
+ARCHIVE_DIR = 'usage_archive'
+# Most rows written to one segment (and deleted from the live table in one transaction)
+ARCHIVE_CHUNK_SIZE = 50000
+# Months kept in the live table when no cut-off is given
+ARCHIVE_LIVE_MONTHS = 12
+# Opened (memory-mapped) segments kept per process; segments never change once written
+ARCHIVE_SEGMENT_CACHE_SIZE = 256
+
+# Column files of a segment. Dates are stored as proleptic Gregorian day ordinals plus the
+# minute of the day; application names as codes into the segment's applications.json.
+ARCHIVE_COLUMNS = {
+    'cust_app_id': np.int64,
+    'date_ordinal': np.int32,
+    'minute': np.int16,
+    'app_code': np.int16,
+    'watts': np.int32,
+    'hours_day': np.float64,
+    'qty': np.int32,
+    'daily_kwh': np.float64,
+    'daily_cost': np.float64,
+}
+
+_segment_cache = OrderedDict()
+_segment_cache_lock = threading.Lock()
+
+
+def customer_archive_dir(customer_id):
+    return os.path.abspath(os.path.join(ARCHIVE_DIR, str(customer_id)))
+
+
+def segment_dir(customer_id, segment_id):
+    return os.path.join(customer_archive_dir(customer_id), f'segment-{segment_id}')
+
+
+def archived_segment_ids(cursor, customer_id):
+    """The committed segments of a customer, oldest first."""
+    cursor.execute(
+        "SELECT segment_id FROM usage_archive_segment WHERE customer_id = ? ORDER BY segment_id", (customer_id,)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def load_segment(customer_id, segment_id):
+    """Returns (columns, app_names) of one segment; columns are read-only memory maps."""
+    path = segment_dir(customer_id, segment_id)
+    with _segment_cache_lock:
+        segment = _segment_cache.get(path)
+        if segment is not None:
+            _segment_cache.move_to_end(path)
+            return segment
+    with open(os.path.join(path, 'applications.json')) as names_file:
+        app_names = json.load(names_file)
+    columns = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in ARCHIVE_COLUMNS}
+    segment = (columns, app_names)
+    with _segment_cache_lock:
+        _segment_cache[path] = segment
+        while len(_segment_cache) > ARCHIVE_SEGMENT_CACHE_SIZE:
+            _segment_cache.popitem(last=False)
+    return segment
+
+
+def load_customer_archive(cursor, customer_id):
+    """
+    Returns (columns, app_names) over all of a customer's archived rows, or None when
+    nothing is archived. A single segment is returned as its memory maps (no copy);
+    several are concatenated, with their application codes remapped to one name list.
+    """
+    segment_ids = archived_segment_ids(cursor, customer_id)
+    if not segment_ids:
+        return None
+    segments = [load_segment(customer_id, segment_id) for segment_id in segment_ids]
+    if len(segments) == 1:
+        return segments[0]
+
+    app_codes = {}
+    parts = {name: [] for name in ARCHIVE_COLUMNS}
+    for columns, segment_app_names in segments:
+        remap = np.array(
+            [app_codes.setdefault(name, len(app_codes)) for name in segment_app_names], dtype=np.int16
+        )
+        for name in ARCHIVE_COLUMNS:
+            parts[name].append(remap[columns[name]] if name == 'app_code' else columns[name])
+    app_names = list(app_codes)
+    return {name: np.concatenate(arrays) for name, arrays in parts.items()}, app_names
+
+
+def purge_customer_archive(customer_id):
+    """Removes every archived segment of a customer (their registry rows cascade with the customer)."""
+    shutil.rmtree(customer_archive_dir(customer_id), ignore_errors=True)
+    with _segment_cache_lock:
+        prefix = customer_archive_dir(customer_id) + os.sep
+        for path in [path for path in _segment_cache if path.startswith(prefix)]:
+            del _segment_cache[path]
+
+
+def parse_date_time(date_time):
+    """Splits a stored date_time ('YYYY-MM-DD[THH:MM...]') into (day ordinal, minute of day)."""
+    ordinal = date.fromisoformat(date_time[:10]).toordinal()
+    minute = int(date_time[11:13]) * 60 + int(date_time[14:16]) if len(date_time) >= 16 else 0
+    return ordinal, minute
+
+
+def format_date_time(ordinal, minute, separator=' '):
+    return f'{date.fromordinal(ordinal).isoformat()}{separator}{minute // 60:02d}:{minute % 60:02d}'
+
+
+def iter_archived_usage(archive, page_cursor=None, limit=None):
+    """
+    Yields (record, sort_key) for the rows of a load_customer_archive() result, newest
+    first, in the same (date_time, cust_app_id) keyset order as the live listing. Records
+    carry every usage field, with date_time formatted like the listing ('YYYY-MM-DD HH:MM').
+    """
+    columns, app_names = archive
+    moments = columns['date_ordinal'].astype(np.int64) * 1440 + columns['minute']
+    ids = columns['cust_app_id']
+    # lexsort orders by the last key first: time, then id; reversed for newest first
+    order = np.lexsort((ids, moments))[::-1]
+    if page_cursor:
+        try:
+            ordinal, minute = parse_date_time(page_cursor[0])
+        except ValueError:
+            return
+        cursor_moment = ordinal * 1440 + minute
+        sorted_moments = moments[order]
+        before = (sorted_moments < cursor_moment) | ((sorted_moments == cursor_moment) & (ids[order] < page_cursor[1]))
+        order = order[before]
+    if limit:
+        order = order[:limit]
+
+    for index in order.tolist():
+        ordinal = int(columns['date_ordinal'][index])
+        minute = int(columns['minute'][index])
+        cust_app_id = int(ids[index])
+        record = {
+            'cust_app_id': cust_app_id,
+            'application_name': app_names[columns['app_code'][index]],
+            'qty': int(columns['qty'][index]),
+            'date_time': format_date_time(ordinal, minute),
+            'watts': int(columns['watts'][index]),
+            'hours_day': float(columns['hours_day'][index]),
+            'daily_kwh': float(columns['daily_kwh'][index]),
+            'daily_cost': float(columns['daily_cost'][index]),
+        }
+        yield record, (format_date_time(ordinal, minute, 'T'), cust_app_id)
+
+
+def archived_bucket_totals(columns, app_names):
+    """
+    Aggregates archived rows into usage_rollup rows: yields (period, bucket,
+    application_name, total_kwh, total_cost, entry_count) for every day/month/year bucket.
+    """
+    ordinals, day_index = np.unique(columns['date_ordinal'], return_inverse=True)
+    days = [date.fromordinal(int(ordinal)) for ordinal in ordinals]
+    app_count = len(app_names)
+    for period in ROLLUP_PERIODS:
+        if period == 'day':
+            labels = [day.isoformat() for day in days]
+        elif period == 'month':
+            labels = [f'{day.year:04d}-{day.month:02d}' for day in days]
+        else:
+            labels = [f'{day.year:04d}' for day in days]
+        bucket_labels, bucket_of_day = np.unique(labels, return_inverse=True)
+        keys = bucket_of_day[day_index] * app_count + columns['app_code']
+        size = len(bucket_labels) * app_count
+        counts = np.bincount(keys, minlength=size)
+        total_kwh = np.bincount(keys, weights=columns['daily_kwh'], minlength=size)
+        total_cost = np.bincount(keys, weights=columns['daily_cost'], minlength=size)
+        for key in np.flatnonzero(counts).tolist():
+            yield (period, str(bucket_labels[key // app_count]), app_names[key % app_count],
+                   float(total_kwh[key]), float(total_cost[key]), int(counts[key]))
+
+
+def add_archive_to_rollups(cursor):
+    """Adds every archived row to the rollups and active periods (after they were rebuilt from the live table)."""
+    cursor.execute("SELECT DISTINCT customer_id FROM usage_archive_segment")
+    for customer_id in [row[0] for row in cursor.fetchall()]:
+        archive = load_customer_archive(cursor, customer_id)
+        rows = [(customer_id,) + totals for totals in archived_bucket_totals(*archive)]
+        cursor.executemany('''
+            INSERT INTO usage_rollup
+                (customer_id, period, bucket, application_name, total_kwh, total_cost, entry_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (customer_id, period, bucket, application_name) DO UPDATE SET
+                total_kwh = total_kwh + excluded.total_kwh,
+                total_cost = total_cost + excluded.total_cost,
+                entry_count = entry_count + excluded.entry_count
+        ''', rows)
+        period_counts = {}
+        for _, period, bucket, _, _, _, entry_count in rows:
+            if period in app_database.ACTIVE_PERIOD_LEVELS:
+                period_counts[(period, bucket)] = period_counts.get((period, bucket), 0) + entry_count
+        cursor.executemany('''
+            INSERT INTO customer_active_period (customer_id, period, bucket, entry_count)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (customer_id, period, bucket) DO UPDATE SET
+                entry_count = entry_count + excluded.entry_count
+        ''', [(customer_id, period, bucket, count) for (period, bucket), count in period_counts.items()])
+
+
+def default_archive_cutoff():
+    """The first live month when no cut-off is given: ARCHIVE_LIVE_MONTHS before this one."""
+    today = datetime.now()
+    month_index = today.year * 12 + today.month - 1 - ARCHIVE_LIVE_MONTHS
+    return f'{month_index // 12:04d}-{month_index % 12 + 1:02d}'
+
+
+def write_segment(path, rows):
+    """Writes rows (cust_app_id, application_name, date_time, watts, hours_day, qty, daily_kwh, daily_cost) as a segment."""
+    app_codes = {}
+    values = {name: [] for name in ARCHIVE_COLUMNS}
+    for cust_app_id, app_name, date_time, watts, hours_day, qty, daily_kwh, daily_cost in rows:
+        ordinal, minute = parse_date_time(date_time)
+        values['cust_app_id'].append(cust_app_id)
+        values['date_ordinal'].append(ordinal)
+        values['minute'].append(minute)
+        values['app_code'].append(app_codes.setdefault(app_name, len(app_codes)))
+        values['watts'].append(watts)
+        values['hours_day'].append(hours_day)
+        values['qty'].append(qty)
+        values['daily_kwh'].append(daily_kwh or 0.0)
+        values['daily_cost'].append(daily_cost or 0.0)
+
+    # Written next to its final name and renamed into place once complete
+    temp_path = path + '.part'
+    shutil.rmtree(temp_path, ignore_errors=True)
+    os.makedirs(temp_path)
+    for name, dtype in ARCHIVE_COLUMNS.items():
+        np.save(os.path.join(temp_path, f'{name}.npy'), np.array(values[name], dtype=dtype))
+    with open(os.path.join(temp_path, 'applications.json'), 'w') as names_file:
+        json.dump(list(app_codes), names_file)
+    # A directory left by a rolled-back run may carry this id; it was never registered
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(temp_path, path)
+
+
+def _is_archivable(date_time):
+    try:
+        parse_date_time(date_time)
+        return True
+    except ValueError:
+        return False
+
+
+def archive_customer(conn, customer_id, before, chunk_size=None):
+    """
+    Moves a customer's usage rows dated before 'before' (YYYY-MM) into archive segments of
+    at most chunk_size rows. Each segment is written, registered and its rows deleted from
+    the live table inside one IMMEDIATE transaction. Rows whose date_time cannot be parsed
+    stay live. Returns the number of rows archived.
+    """
+    chunk_size = chunk_size or ARCHIVE_CHUNK_SIZE
+    cursor = conn.cursor()
+    archived = 0
+    last_seen = ('', 0)
+    while True:
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute('''
+                SELECT cust_app_id, application_name, date_time, watts, hours_day, qty, daily_kwh, daily_cost
+                FROM customer_application
+                WHERE customer_id = ? AND date_time < ? AND (date_time, cust_app_id) > (?, ?)
+                ORDER BY date_time, cust_app_id
+                LIMIT ?
+            ''', (customer_id, before, *last_seen, chunk_size))
+            rows = [tuple(row) for row in cursor.fetchall()]
+            if not rows:
+                conn.commit()
+                return archived
+            last_seen = (rows[-1][2], rows[-1][0])
+            rows = [row for row in rows if _is_archivable(row[2])]
+            if not rows:
+                conn.commit()
+                continue
+
+            cursor.execute('''
+                INSERT INTO usage_archive_segment (customer_id, row_count, first_date_time, last_date_time)
+                VALUES (?, ?, ?, ?)
+            ''', (customer_id, len(rows), rows[0][2], rows[-1][2]))
+            os.makedirs(customer_archive_dir(customer_id), exist_ok=True)
+            write_segment(segment_dir(customer_id, cursor.lastrowid), rows)
+            cursor.executemany('DELETE FROM customer_application WHERE cust_app_id = ?', [(row[0],) for row in rows])
+            conn.commit()
+            archived += len(rows)
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+def remove_orphan_segments(cursor):
+    """Deletes segment directories that were written but never committed."""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return
+    cursor.execute("SELECT customer_id, segment_id FROM usage_archive_segment")
+    committed = {segment_dir(customer_id, segment_id) for customer_id, segment_id in cursor.fetchall()}
+    for customer_name in os.listdir(ARCHIVE_DIR):
+        customer_path = os.path.abspath(os.path.join(ARCHIVE_DIR, customer_name))
+        if not os.path.isdir(customer_path):
+            continue
+        for segment_name in os.listdir(customer_path):
+            path = os.path.join(customer_path, segment_name)
+            if path not in committed:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def archive_closed_periods(before=None, chunk_size=None):
+    """
+    Archives every customer's usage dated before 'before' (YYYY-MM, default
+    default_archive_cutoff()). Returns {'before', 'customers', 'rows'}.
+    """
+    before = before or default_archive_cutoff()
+    datetime.strptime(before, '%Y-%m')  # Raises ValueError for an invalid cut-off
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        remove_orphan_segments(cursor)
+        cursor.execute("SELECT customer_id FROM customer ORDER BY customer_id")
+        customer_ids = [row[0] for row in cursor.fetchall()]
+        customers = 0
+        rows = 0
+        for customer_id in customer_ids:
+            archived = archive_customer(conn, customer_id, before, chunk_size)
+            if archived:
+                customers += 1
+                rows += archived
+        return {'before': before, 'customers': customers, 'rows': rows}
+    finally:
+        conn.close()
+
+
+def archive_stats(cursor):
+    """Segment, row and customer counts of the archive."""
+    cursor.execute('''
+        SELECT COUNT(*), COALESCE(SUM(row_count), 0), COUNT(DISTINCT customer_id),
+               MIN(first_date_time), MAX(last_date_time)
+        FROM usage_archive_segment
+    ''')
+    segments, rows, customers, first_date_time, last_date_time = cursor.fetchone()
+    return {
+        'segments': segments, 'rows': rows, 'customers': customers,
+        'first_date_time': first_date_time, 'last_date_time': last_date_time,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move closed usage periods into the columnar archive.')
+    parser.add_argument('command', choices=('archive',))
+    parser.add_argument('--before', help='archive usage dated before this month (YYYY-MM); '
+                                         f'default: {ARCHIVE_LIVE_MONTHS} months before the current one')
+    parser.add_argument('--chunk-size', type=int, help='rows per segment')
+    args = parser.parse_args()
+    app_database.ensure_schema()
+    result = archive_closed_periods(args.before, args.chunk_size)
+    print(f"Archived {result['rows']} usage rows of {result['customers']} customers dated before {result['before']}.")
+    sys.exit(0)
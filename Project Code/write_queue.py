@@ -0,0 +1,261 @@
+# This module holds the usage write path: single add/edit/delete operations, run either
+# directly on the request's connection or through the group-commit write queue.
+# In queued mode (opt-in) request threads put their operation on a bounded in-process queue
+# and wait; one writer thread drains it, applying up to WRITE_BATCH_SIZE operations (each
+# under its own savepoint) in one transaction, so a burst costs one commit per batch instead
+# of one per row, and request threads never queue up on SQLite's write lock. A request is
+# acknowledged only after the transaction holding its write has committed.
+#
+# Writes sent with an Idempotency-Key have their outcome recorded in the same transaction,
+# so a retried request (e.g. after a timeout) is answered from the record, never applied twice.
+
+import json
+import time
+import queue
+import atexit
+import hashlib
+import threading
+from collections import namedtuple
+from concurrent.futures import Future
+
+from app_database import get_db_connection
+
+# Operations waiting for the writer; further writes are refused until it catches up
+WRITE_QUEUE_SIZE = 10000
+# Most operations committed in one transaction
+WRITE_BATCH_SIZE = 256
+# Longest the writer waits for more operations to join a batch after its first arrives
+WRITE_BATCH_DELAY_MS = 2.0
+# How long a request waits for its batch to commit
+WRITE_TIMEOUT_SECONDS = 30.0
+# Idempotency keys are remembered this long, and expired ones are pruned at most this often
+IDEMPOTENCY_KEY_TTL_SECONDS = 24 * 3600
+IDEMPOTENCY_PRUNE_INTERVAL_SECONDS = 60
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+# What an operation returns: the JSON body and status of the response, a callable run with a
+# cursor once the write has committed (e.g. to publish it to the change feed), and whether
+# the result was replayed from an earlier request with the same idempotency key
+WriteResult = namedtuple('WriteResult', 'body status after_commit replayed', defaults=(None, False))
+
+
+class WriteQueueFull(Exception):
+    """The queue is at WRITE_QUEUE_SIZE; the client should back off and retry."""
+
+
+def request_fingerprint(method, path, body):
+    """Identifies a request, so an idempotency key reused for a different one is caught."""
+    return hashlib.sha256(b'\n'.join([method.encode(), path.encode(), body or b''])).hexdigest()
+
+
+_next_prune = 0.0
+
+
+def prune_idempotency_keys(cursor, now=None):
+    """Deletes expired idempotency keys, at most once per IDEMPOTENCY_PRUNE_INTERVAL_SECONDS."""
+    global _next_prune
+    now = now or time.time()
+    if now < _next_prune:
+        return
+    _next_prune = now + IDEMPOTENCY_PRUNE_INTERVAL_SECONDS
+    cursor.execute("DELETE FROM write_idempotency_key WHERE created_at < ?",
+                   (int(now - IDEMPOTENCY_KEY_TTL_SECONDS),))
+
+
+def apply_write(cursor, operation, idempotency_key=None, fingerprint=None):
+    """
+    Runs one operation inside the caller's transaction, under a savepoint: an operation that
+    raises or returns an error status leaves nothing behind. A known idempotency key is
+    answered from its recorded outcome; a new one records the outcome (unless it is a 5xx,
+    which the client may retry) in the same savepoint.
+    """
+    if idempotency_key is not None:
+        cursor.execute("SELECT request_hash, status, response FROM write_idempotency_key WHERE idempotency_key = ?",
+                       (idempotency_key,))
+        row = cursor.fetchone()
+        if row is not None:
+            if row[0] != fingerprint:
+                return WriteResult(
+                    {'success': False, 'message': 'Idempotency-Key was already used for a different request.'}, 422
+                )
+            return WriteResult(json.loads(row[2]), row[1], replayed=True)
+
+    cursor.execute('SAVEPOINT usage_write')
+    try:
+        result = operation(cursor)
+        if result.status >= 400:
+            cursor.execute('ROLLBACK TO usage_write')
+        if idempotency_key is not None and result.status < 500:
+            cursor.execute('''
+                INSERT INTO write_idempotency_key (idempotency_key, request_hash, status, response, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (idempotency_key, fingerprint, result.status, json.dumps(result.body), int(time.time())))
+    except Exception:
+        cursor.execute('ROLLBACK TO usage_write')
+        raise
+    finally:
+        cursor.execute('RELEASE usage_write')
+    return result
+
+
+def run_after_commit(cursor, result):
+    if result.after_commit is not None:
+        result.after_commit(cursor)
+
+
+def execute_write(conn, operation, idempotency_key=None, fingerprint=None):
+    """Runs one operation in its own IMMEDIATE transaction on conn (the unqueued path)."""
+    cursor = conn.cursor()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        result = apply_write(cursor, operation, idempotency_key, fingerprint)
+        if idempotency_key is not None:
+            prune_idempotency_keys(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    run_after_commit(cursor, result)
+    return result
+
+
+class WriteQueue:
+    """A bounded queue of write operations and the writer thread that group-commits them."""
+
+    def __init__(self, batch_size=None, batch_delay_ms=None, queue_size=None):
+        self.batch_size = batch_size or WRITE_BATCH_SIZE
+        self.batch_delay = (WRITE_BATCH_DELAY_MS if batch_delay_ms is None else batch_delay_ms) / 1000.0
+        self._queue = queue.Queue(maxsize=queue_size or WRITE_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {'writes': 0, 'batches': 0, 'failed_batches': 0, 'rejected': 0, 'largest_batch': 0}
+
+    def submit(self, operation, idempotency_key=None, fingerprint=None):
+        """Queues an operation; returns a Future resolved with its WriteResult once its batch commits."""
+        self._start()
+        future = Future()
+        try:
+            self._queue.put_nowait((operation, idempotency_key, fingerprint, future))
+        except queue.Full:
+            with self._lock:
+                self.stats['rejected'] += 1
+            raise WriteQueueFull(f'The write queue is full ({self._queue.maxsize} pending writes).')
+        return future
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _start(self):
+        # Started on first use, so a forking server starts it in each worker, not the parent
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='usage-writer', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        """Commits everything already queued, then stops the writer thread."""
+        with self._lock:
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def _next_batch(self):
+        """Blocks for the first operation, then gathers more until the batch is full or the delay is up."""
+        item = self._queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.batch_delay
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        conn = get_db_connection()
+        try:
+            stopping = False
+            while not stopping:
+                batch, stopping = self._next_batch()
+                if batch:
+                    self._commit_batch(conn, batch)
+        finally:
+            conn.close()
+            with self._lock:
+                self._thread = None
+
+    def _commit_batch(self, conn, batch):
+        cursor = conn.cursor()
+        results = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for operation, idempotency_key, fingerprint, _ in batch:
+                try:
+                    results.append(apply_write(cursor, operation, idempotency_key, fingerprint))
+                except Exception as e:
+                    # Only this operation's savepoint was rolled back; the rest of the batch commits
+                    results.append(e)
+            prune_idempotency_keys(cursor)
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                self.stats['failed_batches'] += 1
+            for *_, future in batch:
+                future.set_exception(e)
+            return
+
+        with self._lock:
+            self.stats['writes'] += len(batch)
+            self.stats['batches'] += 1
+            self.stats['largest_batch'] = max(self.stats['largest_batch'], len(batch))
+        for (*_, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        for result in results:
+            if isinstance(result, WriteResult):
+                try:
+                    run_after_commit(cursor, result)
+                except Exception as e:
+                    print(f"After-commit hook failed: {e}")
+
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+
+def get_write_queue(batch_size=None, batch_delay_ms=None, queue_size=None):
+    """The process's write queue, created on first use with the given settings."""
+    global _write_queue
+    with _write_queue_lock:
+        if _write_queue is None:
+            _write_queue = WriteQueue(batch_size, batch_delay_ms, queue_size)
+        return _write_queue
+
+
+def write_queue_stats():
+    """The queue's counters and current depth, or None if queued mode has not been used."""
+    write_queue = _write_queue
+    if write_queue is None:
+        return None
+    with write_queue._lock:
+        stats = dict(write_queue.stats)
+    stats['pending'] = write_queue.pending()
+    return stats
+
+
+@atexit.register
+def shutdown_write_queue():
+    """Drains the queue on interpreter exit, so acknowledged-pending writes are not lost."""
+    if _write_queue is not None:
+        _write_queue.stop(timeout=WRITE_TIMEOUT_SECONDS)